@@ -0,0 +1,173 @@
+import tkinter as tk
+from tkinter import messagebox, ttk
+
+from omr_processing.answer_manager import AnswerManager
+
+CHOICES = "ABCDE"
+
+class AnswerKeyEditor(tk.Frame):
+    """Answer key editor backed directly by an AnswerManager.
+
+    All questions live in one Treeview, which only draws the visible rows, so
+    the editor stays responsive at any question count.  Select a row and type
+    A-E (or 1-5) to set its answer and move to the next question; Delete
+    clears it.  A whole key can be pasted as a string such as "ABDCE...",
+    with "-" marking questions that have no answer.
+    """
+
+    def __init__(self, parent: tk.Widget, manager: AnswerManager, count: int = 20, **kwargs):
+        """Initialize the editor.
+
+        Args:
+            parent: Parent widget
+            manager: Answer manager that stores the key
+            count: Initial number of questions
+        """
+        super().__init__(parent, **kwargs)
+        self.manager = manager
+        self.count = 0
+
+        # Key string entry for pasting or typing a whole key at once
+        key_frame = tk.Frame(self, bg=self["bg"])
+        key_frame.pack(fill=tk.X, pady=(0, 2))
+        tk.Label(key_frame, text="Key:", bg=self["bg"]).pack(side=tk.LEFT)
+        self.key_string = tk.StringVar()
+        key_entry = tk.Entry(key_frame, textvariable=self.key_string, width=22)
+        key_entry.pack(side=tk.LEFT, padx=2)
+        key_entry.bind("<Return>", lambda e: self.apply_key_string())
+        tk.Button(key_frame, text="Apply", command=self.apply_key_string).pack(side=tk.LEFT)
+
+        tree_frame = tk.Frame(self)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(tree_frame, columns=("question", "answer"),
+                                 show="headings", height=8, selectmode="browse")
+        self.tree.heading("question", text="Question")
+        self.tree.heading("answer", text="Answer")
+        self.tree.column("question", width=80, anchor=tk.CENTER)
+        self.tree.column("answer", width=80, anchor=tk.CENTER)
+        self.tree.tag_configure("unset", foreground="#999999")
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind("<KeyPress>", self._on_key)
+        self.tree.bind("<<Paste>>", self._on_paste)
+        self.tree.bind("<Control-v>", self._on_paste)
+
+        self.set_question_count(count)
+
+    def set_question_count(self, count: int) -> None:
+        """Add or remove rows so the editor shows `count` questions.
+
+        New questions default to A; answers beyond the new count are removed.
+
+        Args:
+            count: Number of questions (1-100)
+        """
+        if not (1 <= count <= 100):
+            raise ValueError("Question count must be between 1 and 100")
+
+        for q_num in range(count + 1, self.count + 1):
+            self.tree.delete(str(q_num))
+            self.manager.remove_answer(q_num)
+        for q_num in range(self.count + 1, count + 1):
+            if not self.manager.get_answer(q_num):
+                self.manager.set_answer(q_num, "A")
+            self.tree.insert("", tk.END, iid=str(q_num), values=(f"Q{q_num}", ""))
+            self._refresh_row(q_num)
+        self.count = count
+        self._sync_key_string()
+
+    def refresh(self) -> None:
+        """Reload every row from the answer manager, e.g. after loading a key."""
+        self._rebuild(max(self.manager.get_question_count(), 1))
+
+    def reset(self, count: int) -> None:
+        """Show `count` questions with every answer reset to the default.
+
+        Args:
+            count: Number of questions (1-100)
+        """
+        self.manager.clear_answers()
+        self._rebuild(0)
+        self.set_question_count(count)
+
+    def _rebuild(self, count: int) -> None:
+        # Rows are inserted directly so unset answers are not filled with defaults
+        self.tree.delete(*self.tree.get_children())
+        for q_num in range(1, count + 1):
+            self.tree.insert("", tk.END, iid=str(q_num), values=(f"Q{q_num}", ""))
+            self._refresh_row(q_num)
+        self.count = count
+        self._sync_key_string()
+
+    def apply_key_string(self, start: int = 1) -> None:
+        """Set answers from the key entry, growing the question count if needed.
+
+        Args:
+            start: Question number of the first letter
+        """
+        self._apply_key(self.key_string.get(), start)
+
+    def _apply_key(self, key: str, start: int) -> None:
+        try:
+            letters = self.manager.set_answer_key(key, start)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        last = start + letters - 1
+        if last > self.count:
+            self.set_question_count(last)
+        for q_num in range(start, last + 1):
+            self._refresh_row(q_num)
+        self._sync_key_string()
+
+    def _sync_key_string(self) -> None:
+        self.key_string.set(self.manager.get_answer_key(self.count))
+
+    def _refresh_row(self, q_num: int) -> None:
+        answer = self.manager.get_answer(q_num)
+        self.tree.item(str(q_num), values=(f"Q{q_num}", answer or "-"),
+                       tags=() if answer else ("unset",))
+
+    def _selected_question(self) -> int:
+        focus = self.tree.focus()
+        return int(focus) if focus else 0
+
+    def _select(self, q_num: int) -> None:
+        iid = str(q_num)
+        self.tree.selection_set(iid)
+        self.tree.focus(iid)
+        self.tree.see(iid)
+
+    def _on_key(self, event: tk.Event):
+        q_num = self._selected_question()
+        if not q_num:
+            return None
+        char = event.char.upper()
+        if char and char in CHOICES:
+            self.manager.set_answer(q_num, char)
+        elif char and char in "12345":
+            self.manager.set_answer(q_num, CHOICES[int(char) - 1])
+        elif event.keysym in ("Delete", "BackSpace"):
+            self.manager.remove_answer(q_num)
+            self._refresh_row(q_num)
+            self._sync_key_string()
+            return "break"
+        else:
+            return None
+
+        self._refresh_row(q_num)
+        self._sync_key_string()
+        if q_num < self.count:
+            self._select(q_num + 1)
+        return "break"
+
+    def _on_paste(self, event: tk.Event):
+        try:
+            key = self.clipboard_get()
+        except tk.TclError:
+            return "break"
+        self._apply_key(key, self._selected_question() or 1)
+        return "break"
@@ -0,0 +1,173 @@
+"""Regenerate the synthetic part of the golden sheet corpus.
+
+Writes the synthetic sheets and their labels into this directory.  The
+output is deterministic, so rerunning it only changes files when this
+script changes.  Real sheets are added by hand: copy the anonymised scan
+here and add an entry to labels.json.
+
+Usage:
+    python golden/generate.py
+"""
+import json
+import os
+
+import cv2
+import numpy as np
+
+ROWS = 30
+COLS = 5
+PAGE_WIDTH = 800
+PAGE_HEIGHT = 940
+BORDER = 100
+BACKGROUND = 90
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def _fill(page: np.ndarray, centre, radius: int, style: str, rng: np.random.Generator) -> None:
+    if style == 'solid':
+        cv2.circle(page, centre, radius, (0, 0, 0), -1)
+    elif style == 'pencil':
+        # Graphite: mid-grey with grain and a ragged edge
+        mask = np.zeros(page.shape[:2], dtype=np.uint8)
+        cv2.circle(mask, centre, radius + int(rng.integers(-1, 2)), 255, -1)
+        shade = np.clip(rng.normal(90, 15, page.shape[:2]), 0, 255).astype(np.uint8)
+        page[mask > 0] = np.minimum(page[mask > 0], shade[mask > 0][:, None])
+    elif style == 'partial':
+        # Roughly two thirds of the bubble scribbled in
+        cv2.ellipse(page, centre, (radius, int(radius * 0.7)), float(rng.uniform(0, 180)),
+                    0, 360, (0, 0, 0), -1)
+    elif style == 'erased':
+        cv2.circle(page, centre, radius, (205, 205, 205), -1)
+    else:
+        raise ValueError(f"Unknown fill style: {style}")
+
+def make_sheet(labels: str, rng: np.random.Generator, style: str = 'solid', erasures: int = 0,
+               marker: bool = False) -> np.ndarray:
+    """Draw a sheet on a darker scanner background.
+
+    Args:
+        labels: One character per question: A-E, "-" for blank, "*" for two marks
+        rng: Random generator for the mark texture and positions
+        style: Fill style of the marks
+        erasures: Number of blank bubbles that get a faint erased mark
+        marker: Draw the orientation marker in the top-left corner
+
+    Returns:
+        BGR image
+    """
+    page = np.full((PAGE_HEIGHT, PAGE_WIDTH, 3), 255, dtype=np.uint8)
+    cell_h, cell_w = PAGE_HEIGHT / ROWS, PAGE_WIDTH / COLS
+    radius = int(min(cell_h, cell_w) * 0.3)
+    centres = [[(int((c + 0.5) * cell_w), int((r + 0.5) * cell_h)) for c in range(COLS)]
+               for r in range(ROWS)]
+
+    marked = []
+    for row, label in enumerate(labels):
+        if label == '*':
+            marked += [(row, c) for c in rng.choice(COLS, 2, replace=False)]
+        elif label != '-':
+            marked.append((row, 'ABCDE'.index(label)))
+    unmarked = [(r, c) for r in range(ROWS) for c in range(COLS) if (r, c) not in marked]
+    for i in rng.choice(len(unmarked), erasures, replace=False):
+        row, col = unmarked[i]
+        _fill(page, centres[row][col], radius, 'erased', rng)
+    for row, col in marked:
+        _fill(page, centres[row][col], radius, style, rng)
+    for row in centres:
+        for centre in row:
+            cv2.circle(page, centre, radius, (0, 0, 0), 2)
+
+    cv2.rectangle(page, (2, 2), (PAGE_WIDTH - 3, PAGE_HEIGHT - 3), (0, 0, 0), 3)
+    if marker:
+        cv2.rectangle(page, (10, 10), (40, 40), (0, 0, 0), -1)
+    # Scanner optics never resolve single-pixel grain
+    page = cv2.GaussianBlur(page, (3, 3), 0)
+    canvas = np.full((PAGE_HEIGHT + 2 * BORDER, PAGE_WIDTH + 2 * BORDER, 3), BACKGROUND, dtype=np.uint8)
+    canvas[BORDER:BORDER + PAGE_HEIGHT, BORDER:BORDER + PAGE_WIDTH] = page
+    return canvas
+
+def rescan(img: np.ndarray, rng: np.random.Generator, angle: float = 2.0, noise: float = 3.0,
+           contrast: float = 1.0) -> np.ndarray:
+    """Simulate a second pass through a scanner: skew, exposure change and noise."""
+    h, w = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), rng.uniform(-angle, angle), rng.uniform(0.97, 1.03))
+    matrix[:, 2] += rng.uniform(-15, 15, 2)
+    out = cv2.warpAffine(img, matrix, (w, h), borderValue=(BACKGROUND,) * 3)
+    out = cv2.convertScaleAbs(out, alpha=contrast * rng.uniform(0.9, 1.1),
+                              beta=rng.uniform(-10, 10) + (1 - contrast) * 128)
+    return np.clip(out + rng.normal(0, noise, out.shape), 0, 255).astype(np.uint8)
+
+def _labels(rng: np.random.Generator, blanks: int = 3, multi: int = 0) -> str:
+    labels = ['ABCDE'[i] for i in rng.integers(0, COLS, ROWS)]
+    rows = rng.choice(ROWS, blanks + multi, replace=False)
+    for row in rows[:blanks]:
+        labels[row] = '-'
+    for row in rows[blanks:]:
+        labels[row] = '*'
+    return ''.join(labels)
+
+# name, style, erasures, blanks, multi, rescan settings, quarter turns clockwise
+SHEETS = [
+    ('clean_01', 'solid', 0, 3, 0, None, 0),
+    ('clean_02', 'solid', 0, 0, 0, None, 0),
+    ('clean_03', 'solid', 0, 8, 0, None, 0),
+    ('pencil_01', 'pencil', 0, 3, 0, None, 0),
+    ('pencil_02', 'pencil', 0, 3, 0, {'noise': 4.0}, 0),
+    ('partial_01', 'partial', 0, 3, 0, None, 0),
+    ('partial_02', 'partial', 0, 3, 0, {'noise': 4.0}, 0),
+    ('erased_01', 'solid', 6, 3, 0, None, 0),
+    ('erased_02', 'pencil', 6, 3, 0, None, 0),
+    ('multi_01', 'solid', 0, 2, 4, None, 0),
+    ('multi_02', 'pencil', 0, 2, 4, None, 0),
+    ('skewed_01', 'solid', 0, 3, 0, {'angle': 3.0}, 0),
+    ('skewed_02', 'pencil', 0, 3, 0, {'angle': 3.0, 'noise': 5.0}, 0),
+    ('faded_01', 'solid', 0, 3, 0, {'contrast': 0.55}, 0),
+    ('faded_02', 'pencil', 0, 3, 0, {'contrast': 0.6}, 0),
+    ('upside_down_01', 'solid', 0, 3, 0, None, 2),
+    ('sideways_01', 'solid', 0, 3, 0, None, 1),
+]
+
+# name, sheet rescanned, rescan settings: second scans of a sheet that the
+# duplicate index must match to the original
+RESCANS = [
+    ('rescan_01', 'clean_01', {'angle': 2.0, 'noise': 4.0}),
+    ('rescan_02', 'pencil_01', {'angle': 3.0, 'noise': 5.0, 'contrast': 0.8}),
+]
+
+def main() -> None:
+    entries = []
+    images = {}
+    for i, (name, style, erasures, blanks, multi, scan, turns) in enumerate(SHEETS):
+        rng = np.random.default_rng(1000 + i)
+        labels = _labels(rng, blanks, multi)
+        img = make_sheet(labels, rng, style, erasures, marker=bool(turns))
+        if scan is not None:
+            img = rescan(img, rng, **scan)
+        if turns:
+            img = np.ascontiguousarray(np.rot90(img, -turns))
+        path = os.path.join(HERE, f"{name}.jpg")
+        cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        images[name] = img
+        entries.append({'file': f"{name}.jpg", 'answers': labels, 'source': 'synthetic',
+                        'tags': [style] + (['rescan'] if scan else []) + (['rotated'] if turns else [])})
+
+    for i, (name, original, scan) in enumerate(RESCANS):
+        img = rescan(images[original], np.random.default_rng(3000 + i), **scan)
+        cv2.imwrite(os.path.join(HERE, f"{name}.jpg"), img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        source = next(entry for entry in entries if entry['file'] == f"{original}.jpg")
+        entries.append({'file': f"{name}.jpg", 'answers': source['answers'], 'source': 'synthetic',
+                        'duplicate_of': f"{original}.jpg", 'tags': source['tags'][:1] + ['rescan']})
+
+    blank = np.full((PAGE_HEIGHT + 2 * BORDER, PAGE_WIDTH + 2 * BORDER, 3), 235, dtype=np.uint8)
+    blank = rescan(blank, np.random.default_rng(2000), angle=0.0, noise=2.0)
+    cv2.imwrite(os.path.join(HERE, 'blank_page_01.jpg'), blank, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    entries.append({'file': 'blank_page_01.jpg', 'rejected': 'blank', 'source': 'synthetic',
+                    'tags': ['blank']})
+
+    with open(os.path.join(HERE, 'labels.json'), 'w') as f:
+        json.dump({'rows': ROWS, 'sheets': entries}, f, indent=2)
+        f.write('\n')
+    print(f"Wrote {len(entries)} sheets to {HERE}")
+
+if __name__ == "__main__":
+    main()
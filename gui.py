@@ -1,11 +1,19 @@
+import threading
 import tkinter as tk
+from collections import OrderedDict
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk
-import cv2
-import numpy as np
-from typing import List, Tuple, Optional, Dict
+from typing import TYPE_CHECKING, List, Tuple, Optional, Dict
 
-from omr_processing import image_utils, bubble_detector, grader, answer_manager
+# OpenCV, NumPy and PIL are imported on first use so the window appears
+# before the heavy modules are loaded
+from omr_processing import grader, answer_manager
+from answer_key_editor import AnswerKeyEditor
+
+if TYPE_CHECKING:
+    import numpy as np
+
+PREVIEW_SIZE = (600, 600)
+RECENT_SHEETS = 10
 
 class OMRGraderGUI:
     def __init__(self, root: tk.Tk):
@@ -22,10 +30,20 @@ class OMRGraderGUI:
         self.image_path = tk.StringVar()
         self.results = []
         self.answer_manager = answer_manager.AnswerManager()
-        self.answer_vars = {}
+        self.sheet_cache = OrderedDict()
+        self.current_sheet = None
+        self.rendered_photos = {}
         
         # Create GUI components
         self.create_widgets()
+        self.root.after(100, self.preload_processing)
+    
+    def preload_processing(self):
+        """Import OpenCV and the processing modules in the background once the window is up."""
+        def load():
+            from omr_processing import pipeline  # noqa: F401
+
+        threading.Thread(target=load, daemon=True).start()
     
     def create_widgets(self):
         """Create and arrange all GUI widgets."""
@@ -54,37 +72,19 @@ class OMRGraderGUI:
         answer_frame = tk.LabelFrame(parent, text="Correct Answers", bg="#f0f0f0", padx=5, pady=5)
         answer_frame.pack(fill=tk.X, padx=5, pady=5)
         
-        # Create a canvas with scrollbar for answer inputs
-        canvas = tk.Canvas(answer_frame, bg="#f0f0f0", height=200)
-        scrollbar = tk.Scrollbar(answer_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = tk.Frame(canvas, bg="#f0f0f0")
-        
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        
         # Question count control
-        count_frame = tk.Frame(scrollable_frame, bg="#f0f0f0")
-        count_frame.grid(row=0, column=0, columnspan=4, padx=2, pady=2)
+        count_frame = tk.Frame(answer_frame, bg="#f0f0f0")
+        count_frame.pack(fill=tk.X, padx=2, pady=2)
         tk.Label(count_frame, text="Number of Questions:", bg="#f0f0f0").pack(side=tk.LEFT)
         self.question_count = tk.StringVar(value="20")
         count_entry = tk.Entry(count_frame, textvariable=self.question_count, width=5)
         count_entry.pack(side=tk.LEFT, padx=5)
+        count_entry.bind("<Return>", lambda e: self._update_answer_fields())
         tk.Button(count_frame, text="Update", command=self._update_answer_fields).pack(side=tk.LEFT, padx=5)
         
-        # Create answer input fields container
-        self.answers_container = tk.Frame(scrollable_frame, bg="#f0f0f0")
-        self.answers_container.grid(row=1, column=0, columnspan=4, sticky="nsew")
-        
-        # Initialize with default 20 questions
-        self._create_answer_fields(20)
-        
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Answer key editor (initialized with default 20 questions)
+        self.answer_editor = AnswerKeyEditor(answer_frame, self.answer_manager, 20, bg="#f0f0f0")
+        self.answer_editor.pack(fill=tk.BOTH, expand=True)
         
         # Answer Management Buttons
         btn_frame = tk.Frame(answer_frame, bg="#f0f0f0")
@@ -121,6 +121,17 @@ class OMRGraderGUI:
         Args:
             parent: Parent frame for display panel
         """
+        # Recently graded sheets
+        recent_frame = tk.Frame(parent)
+        recent_frame.pack(fill=tk.X, pady=(0, 5))
+        tk.Label(recent_frame, text="Recent sheets:").pack(side=tk.LEFT)
+        self.recent_sheet = tk.StringVar()
+        self.recent_combo = ttk.Combobox(recent_frame, textvariable=self.recent_sheet,
+                                         state="readonly", width=60)
+        self.recent_combo.pack(side=tk.LEFT, padx=5)
+        self.recent_combo.bind("<<ComboboxSelected>>",
+                               lambda e: self.show_sheet(self.recent_sheet.get()))
+        
         self.notebook = ttk.Notebook(parent)
         self.notebook.pack(expand=True, fill=tk.BOTH)
         
@@ -142,61 +153,176 @@ class OMRGraderGUI:
         
         self.threshold_display = tk.Label(self.threshold_tab)
         self.threshold_display.pack(expand=True, fill=tk.BOTH)
+        
+        # Previews are only rendered for the tab that is actually visible
+        self.tab_displays = {
+            str(self.original_tab): ("original", self.original_display),
+            str(self.warped_tab): ("warped", self.warped_display),
+            str(self.threshold_tab): ("threshold", self.threshold_display),
+        }
+        self.notebook.bind("<<NotebookTabChanged>>", lambda e: self._render_current_tab())
     
     def browse_image(self):
         """Open file dialog to select an image file."""
         filepath = filedialog.askopenfilename(
-            filetypes=[("Image files", "*.jpg *.jpeg *.png")]
+            filetypes=[("Image files", "*.jpg *.jpeg *.png *.tif *.tiff")]
         )
         if filepath:
             self.image_path.set(filepath)
             self.display_original_image(filepath)
     
+    @staticmethod
+    def _make_thumbnail(img: 'np.ndarray') -> 'np.ndarray':
+        """Downscale an image to preview size and convert it to RGB.
+        
+        Args:
+            img: BGR or single-channel image
+            
+        Returns:
+            RGB image no larger than PREVIEW_SIZE
+        """
+        import cv2
+
+        h, w = img.shape[:2]
+        scale = min(PREVIEW_SIZE[0] / w, PREVIEW_SIZE[1] / h, 1.0)
+        if scale < 1.0:
+            img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        code = cv2.COLOR_GRAY2RGB if img.ndim == 2 else cv2.COLOR_BGR2RGB
+        return cv2.cvtColor(img, code)
+    
     def display_original_image(self, path: str):
-        """Display the original image in the first tab.
+        """Display a preview of a newly selected image in the first tab.
+        
+        The file is decoded on a background thread so large scans do not
+        freeze the window; the recent-sheets cache is left untouched.
         
         Args:
             path: Path to the image file
         """
-        img = Image.open(path)
-        img.thumbnail((600, 600))
-        photo = ImageTk.PhotoImage(img)
+        self.current_sheet = None
+        self.recent_sheet.set("")
+        self.rendered_photos.clear()
+        for _, display in self.tab_displays.values():
+            display.config(image="")
+            display.image = None
+        self.display_results([])
+        self.notebook.select(self.original_tab)
+        
+        preview = {}
+        
+        def load():
+            from PIL import Image
+            
+            try:
+                with Image.open(path) as img:
+                    # JPEG decoders can skip most of the work at a reduced scale
+                    img.draft("RGB", PREVIEW_SIZE)
+                    img = img.convert("RGB")
+                    img.thumbnail(PREVIEW_SIZE)
+                preview["image"] = img
+            except Exception as e:
+                preview["error"] = e
+        
+        worker = threading.Thread(target=load, daemon=True)
+        worker.start()
+        self._poll_preview(path, worker, preview)
+    
+    def _poll_preview(self, path: str, worker: threading.Thread, preview: Dict):
+        """Show the preview decoded by display_original_image once it is ready.
         
+        Args:
+            path: Path of the image being decoded
+            worker: Thread decoding the image
+            preview: Dictionary the thread stores `image` or `error` in
+        """
+        if worker.is_alive():
+            self.root.after(50, self._poll_preview, path, worker, preview)
+            return
+        # Ignore previews of a file that is no longer selected or already graded
+        if path != self.image_path.get() or self.current_sheet is not None:
+            return
+        if "image" not in preview:
+            messagebox.showerror("Error", f"Could not load image: {preview.get('error')}")
+            return
+        
+        from PIL import ImageTk
+
+        photo = ImageTk.PhotoImage(preview["image"])
+        self.rendered_photos["original"] = photo
         self.original_display.config(image=photo)
         self.original_display.image = photo
     
-    def display_processed_images(self, original: np.ndarray, 
-                               warped: np.ndarray, 
-                               threshold: np.ndarray):
+    def display_processed_images(self, original: 'np.ndarray', 
+                               warped: 'np.ndarray', 
+                               threshold: 'np.ndarray',
+                               results: Optional[List[str]] = None):
         """Display processed images in their respective tabs.
         
+        Only small thumbnails are kept; each tab is rendered when it is selected.
+        
         Args:
             original: Original processed image
             warped: Perspective transformed image
             threshold: Thresholded image
+            results: Formatted grading results shown with the sheet
         """
-        # Original Image
-        img = cv2.cvtColor(original, cv2.COLOR_BGR2RGB)
-        img = Image.fromarray(img)
-        img.thumbnail((600, 600))
-        photo = ImageTk.PhotoImage(img)
-        self.original_display.config(image=photo)
-        self.original_display.image = photo
+        self.cache_sheet(self.image_path.get(),
+                         {"original": original, "warped": warped, "threshold": threshold},
+                         results or [])
+    
+    def cache_sheet(self, key: str, images: Dict[str, 'np.ndarray'], results: List[str]):
+        """Store thumbnails and results of a sheet in the recent-sheets cache and show it.
+        
+        Args:
+            key: Sheet identifier (the image path)
+            images: Full-size images by tab name
+            results: Formatted grading results
+        """
+        thumbnails = {name: self._make_thumbnail(img) for name, img in images.items()}
+        self.sheet_cache[key] = {"thumbnails": thumbnails, "results": results}
+        self.sheet_cache.move_to_end(key)
+        while len(self.sheet_cache) > RECENT_SHEETS:
+            self.sheet_cache.popitem(last=False)
+        self.recent_combo["values"] = list(reversed(self.sheet_cache))
+        self.show_sheet(key)
+    
+    def show_sheet(self, key: str):
+        """Show a cached sheet without re-running the pipeline.
         
-        # Warped Image
-        img_warped = cv2.cvtColor(warped, cv2.COLOR_BGR2RGB)
-        img_warped = Image.fromarray(img_warped)
-        img_warped.thumbnail((600, 600))
-        photo_warped = ImageTk.PhotoImage(img_warped)
-        self.warped_display.config(image=photo_warped)
-        self.warped_display.image = photo_warped
-        
-        # Threshold Image
-        img_thresh = Image.fromarray(threshold)
-        img_thresh.thumbnail((600, 600))
-        photo_thresh = ImageTk.PhotoImage(img_thresh)
-        self.threshold_display.config(image=photo_thresh)
-        self.threshold_display.image = photo_thresh
+        Args:
+            key: Sheet identifier (the image path)
+        """
+        entry = self.sheet_cache.get(key)
+        if entry is None:
+            return
+        self.sheet_cache.move_to_end(key)
+        self.current_sheet = key
+        self.recent_sheet.set(key)
+        self.display_results(entry["results"])
+        
+        # Drop the photos of the previous sheet; tabs re-render on demand
+        self.rendered_photos.clear()
+        for _, display in self.tab_displays.values():
+            display.config(image="")
+            display.image = None
+        self._render_current_tab()
+    
+    def _render_current_tab(self):
+        """Render the preview of the visible tab for the current sheet."""
+        name, display = self.tab_displays[self.notebook.select()]
+        entry = self.sheet_cache.get(self.current_sheet)
+        if entry is None or name in self.rendered_photos:
+            return
+        thumbnail = entry["thumbnails"].get(name)
+        if thumbnail is None:
+            return
+        
+        from PIL import Image, ImageTk
+
+        photo = ImageTk.PhotoImage(Image.fromarray(thumbnail))
+        self.rendered_photos[name] = photo
+        display.config(image=photo)
+        display.image = photo
     
     def process_image(self):
         """Process the selected image and display results."""
@@ -205,51 +331,19 @@ class OMRGraderGUI:
                 return
 
         try:
-            # Process image using utility functions
-                img_canny = image_utils.load_and_preprocess_image(self.image_path.get())
-                if img_canny is None:
-                    raise Exception("Could not load image")
-
-                # Find and process contours
-                rect_contours = image_utils.find_rectangle_contours(img_canny)
-                if not rect_contours:
-                    raise Exception("No rectangular contours found")
-
-                # Get and validate corner points
-                biggest_contour = image_utils.get_corner_points(rect_contours[0])
-                if biggest_contour is None:
-                    raise Exception("Biggest contour not valid")
-
-                # Reorder points and apply perspective transform
-                ordered_points = image_utils.reorder_points(biggest_contour)
-                img = cv2.imread(self.image_path.get())
-                img = cv2.resize(img, (600, 700))
-                warped = image_utils.apply_perspective_transform(img, ordered_points, 600, 700)
-
-               # Threshold the image
-                thresh = image_utils.threshold_image(warped)
-
-                # Detect answers
-                answers = bubble_detector.analyze_answer_sheet(thresh)
-                print('Answers:', answers)
+                from omr_processing import pipeline
 
                 # Get correct answers from answer manager
                 correct_answers = self.answer_manager.get_grading_list()
 
-                # Convert student answer dict to list (fill missing with -1)
-                # Note: Assuming `answers` is a dictionary with keys like 'Q1', 'Q2', etc.
-                student_answers = [answers.get(f"Q{i+1}", -1) for i in range(len(correct_answers))]
-                print("Student Answers:", student_answers)
-                print("Correct Answers:", correct_answers)
-
+                # Detect and grade the answers
+                result = pipeline.grade_file(self.image_path.get(), correct_answers)
 
-                # Grade the answers
-                grade_results = grader.grade_answers(student_answers, correct_answers)
-                result_strings = grader.format_results(grade_results, student_answers, correct_answers)
+                result_strings = grader.format_results(result["grade"], result["student_answers"], correct_answers)
 
                 # Display results
-                self.display_results(result_strings)
-                self.display_processed_images(img, warped, thresh)
+                self.display_processed_images(result["image"], result["warped"], result["threshold"],
+                                              result_strings)
 
         except Exception as e:
             messagebox.showerror("Processing Error", str(e))
@@ -257,11 +351,6 @@ class OMRGraderGUI:
     
     def save_answers(self):
         """Save current answers to CSV file."""
-        count = len(self.answer_vars)
-        for q_num in range(1, count + 1):
-            answer = self.answer_vars[f"Q{q_num}"].get()
-            self.answer_manager.set_answer(q_num, answer)
-        
         self.answer_manager.save_to_csv()
         messagebox.showinfo("Success", "Answers saved successfully")
     
@@ -269,58 +358,24 @@ class OMRGraderGUI:
         """Load answers from CSV file."""
         if self.answer_manager.load_from_csv():
             # Update GUI with loaded answers
-            answers = self.answer_manager.get_all_answers()
-            for q_num in range(1, 21):
-                if f"Q{q_num}" in answers:
-                    self.answer_vars[f"Q{q_num}"].set(answers[f"Q{q_num}"])
+            self.answer_editor.refresh()
+            self.question_count.set(str(self.answer_editor.count))
             messagebox.showinfo("Success", "Answers loaded successfully")
         else:
             messagebox.showwarning("Warning", "No saved answers found")
     
-    def _create_answer_fields(self, count: int):
-        """Create answer input fields based on question count.
-        
-        Args:
-            count: Number of questions to create fields for
-        """
-        # Clear existing fields
-        for widget in self.answers_container.winfo_children():
-            widget.destroy()
-        self.answer_vars.clear()
-        
-        # Create new fields (4 columns grid)
-        for i in range(count):
-            q_num = i + 1
-            row = i // 4
-            col = i % 4
-            
-            frame = tk.Frame(self.answers_container, bg="#f0f0f0")
-            frame.grid(row=row, column=col, padx=2, pady=2)
-            
-            tk.Label(frame, text=f"Q{q_num}:", bg="#f0f0f0").pack(side=tk.LEFT)
-            var = tk.StringVar(value="A")
-            self.answer_vars[f"Q{q_num}"] = var
-            menu = tk.OptionMenu(frame, var, "A", "B", "C", "D", "E")
-            menu.config(width=2)
-            menu.pack(side=tk.LEFT)
-    
     def _update_answer_fields(self):
         """Update answer fields based on question count input."""
         try:
             count = int(self.question_count.get())
-            if not (1 <= count <= 100):
-                raise ValueError("Question count must be between 1 and 100")
-            self._create_answer_fields(count)
+            self.answer_editor.set_question_count(count)
         except ValueError as e:
             messagebox.showerror("Error", str(e))
-            self.question_count.set("20")
+            self.question_count.set(str(self.answer_editor.count))
     
     def clear_answers(self):
         """Clear all answers."""
-        count = len(self.answer_vars)
-        for q_num in range(1, count + 1):
-            self.answer_vars[f"Q{q_num}"].set("A")
-        self.answer_manager.clear_answers()
+        self.answer_editor.reset(self.answer_editor.count)
         messagebox.showinfo("Success", "Answers cleared")
     
     def display_results(self, results: List[str]):
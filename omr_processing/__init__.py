@@ -0,0 +1,38 @@
+"""OMR sheet processing package.
+
+Submodules are imported on first use, so importing the package (or a light
+module such as answer_manager or grader) does not load OpenCV or NumPy.
+Short-lived workers and command-line tools only pay for what they touch.
+"""
+import importlib
+
+__all__ = [
+    'answer_manager',
+    'autotune',
+    'batch',
+    'bubble_detector',
+    'duplicate_index',
+    'exam_store',
+    'grader',
+    'hot_folder',
+    'image_utils',
+    'ingest',
+    'job_queue',
+    'overlay',
+    'page_classifier',
+    'pipeline',
+    'regression',
+    'roster',
+    'server',
+    'shared_frames',
+    'sheet_archive',
+    'student_info_detector',
+]
+
+def __getattr__(name: str):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,7 +1,21 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 import csv
 import os
 
+def parse_answer_key(key: str) -> List[int]:
+    """Convert an answer key string such as "ABDCE" to grader format.
+
+    Args:
+        key: String of answer letters (A-E), one per question
+
+    Returns:
+        List of integers (0-4 for A-E)
+    """
+    key = key.strip().upper()
+    if not key or any(c not in 'ABCDE' for c in key):
+        raise ValueError("Answer key must be a non-empty string of letters A-E")
+    return [ord(c) - ord('A') for c in key]
+
 class AnswerManager:
     def __init__(self):
         """Initialize the answer manager."""
@@ -41,6 +55,57 @@ class AnswerManager:
         """
         return self.answers.copy()
 
+    def remove_answer(self, question_num: int) -> None:
+        """Remove the correct answer for a question, if set.
+        
+        Args:
+            question_num: Question number (1-based)
+        """
+        self.answers.pop(f"Q{question_num}", None)
+
+    def set_answer_key(self, key: str, start: int = 1) -> int:
+        """Set consecutive answers from a key string such as "ABDCE".
+        
+        Whitespace and commas are ignored; "-" clears the answer for that question.
+        
+        Args:
+            key: String of answer letters (A-E)
+            start: Question number of the first letter (1-based)
+            
+        Returns:
+            Number of questions covered by the key
+        """
+        letters = [c for c in key.upper() if not c.isspace() and c not in ',;|']
+        if any(c not in 'ABCDE-' for c in letters):
+            raise ValueError("Answer key may only contain the letters A-E and -")
+        if letters and start + len(letters) - 1 > 100:
+            raise ValueError("Question number must be between 1 and 100")
+        for offset, answer in enumerate(letters):
+            if answer == '-':
+                self.remove_answer(start + offset)
+            else:
+                self.set_answer(start + offset, answer)
+        return len(letters)
+
+    def get_answer_key(self, count: int) -> str:
+        """Get the answers for the first `count` questions as a key string.
+        
+        Args:
+            count: Number of questions to include
+            
+        Returns:
+            String of answer letters, with "-" for questions without an answer
+        """
+        return ''.join(self.get_answer(q_num) or '-' for q_num in range(1, count + 1))
+
+    def get_question_count(self) -> int:
+        """Get the highest question number that has an answer.
+        
+        Returns:
+            Highest answered question number, or 0 if no answers are set
+        """
+        return max((int(q_key.lstrip('Q')) for q_key in self.answers), default=0)
+
     def clear_answers(self) -> None:
         """Clear all stored answers."""
         self.answers.clear()
@@ -72,6 +137,38 @@ class AnswerManager:
                 self.set_answer(q_num, row['Answer'])
         return True
 
+    def save_to_store(self, store, exam: str) -> int:
+        """Save current answers as a new answer key version of an exam.
+        
+        Args:
+            store: ExamStore to write to
+            exam: Exam name
+            
+        Returns:
+            Version number of the stored key
+        """
+        return store.save_answer_key(exam, self.get_answer_key(self.get_question_count()))
+
+    def load_from_store(self, store, exam: str, version: Optional[int] = None) -> Optional[int]:
+        """Load an exam's answer key from the exam store.
+        
+        Args:
+            store: ExamStore to read from
+            exam: Exam name
+            version: Key version, or None for the latest
+            
+        Returns:
+            Version of the loaded key, read together with the key so a
+            concurrently saved version cannot be mixed in, or None if the
+            exam has no key
+        """
+        found = store.get_answer_key(exam, version)
+        if found is None:
+            return None
+        self.clear_answers()
+        self.set_answer_key(found[1])
+        return found[0]
+
     def get_grading_list(self) -> List[int]:
         """Convert stored answers to format needed by grader.
         
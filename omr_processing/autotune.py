@@ -0,0 +1,228 @@
+"""Benchmark worker layouts and remember the fastest one for this machine.
+
+OpenCV parallelises some calls internally (warpPerspective, GaussianBlur,
+resize).  An outer process pool on top of that oversubscribes the cores,
+while single-threaded workers leave them idle when there are few sheets in
+flight.  The tuner grades sample sheets through the real batch worker
+code for each combination of worker processes, OpenCV threads per worker
+and sheets per task, then saves the fastest layout for each mode:
+
+- batch: workers and OpenCV threads with one sheet per task, which is how
+  batch.run_batch submits work
+- server: workers, OpenCV threads and micro-batch size, limited to batches
+  a worker grades within the latency budget
+
+The configuration is stored per host name, so a home directory shared
+between machines keeps one entry for each.  batch and server read it
+whenever --workers, --cv-threads or --max-batch are not given.
+
+Usage:
+    python -m omr_processing.autotune scans/ --sheets 64
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+CONFIG_PATH = os.path.join(os.path.expanduser('~'), '.omr_processing', 'autotune.json')
+
+# Sample sheets (encoded bytes or decoded pages) owned by each benchmark
+# worker process.  This module must not import NumPy or OpenCV at load
+# time: the server parent reads the tuning through it.
+_samples: List[Any] = []
+
+def load_tuning(mode: str, path: Optional[str] = None) -> Dict[str, Any]:
+    """Read the saved configuration of one mode for this machine.
+
+    Args:
+        mode: "batch" or "server"
+        path: Configuration file (default: CONFIG_PATH)
+
+    Returns:
+        Dictionary with `workers`, `cv_threads` and, for the server,
+        `max_batch`; empty if the machine has not been tuned
+    """
+    try:
+        with open(path or CONFIG_PATH) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return config.get(socket.gethostname(), {}).get(mode, {})
+
+def save_tuning(entry: Dict[str, Any], path: Optional[str] = None) -> str:
+    """Store a tuning entry for this machine, keeping other machines' entries.
+
+    Args:
+        entry: Dictionary with "batch" and "server" configurations
+        path: Configuration file (default: CONFIG_PATH)
+
+    Returns:
+        Path of the written file
+    """
+    path = path or CONFIG_PATH
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    config[socket.gethostname()] = entry
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(temp_path, path)
+    return path
+
+def _init_bench(samples: List[Any], cv_threads: int) -> None:
+    global _samples
+    from . import batch
+
+    batch._init_worker(None, cv_threads)
+    _samples = samples
+
+def _grade_chunk(indices: List[int], correct_answers: List[int]) -> float:
+    from . import batch
+
+    start = time.perf_counter()
+    for i in indices:
+        batch.grade_job(str(i), _samples[i], correct_answers)
+    return (time.perf_counter() - start) * 1000
+
+def benchmark(samples: List[Any], workers: int, cv_threads: int,
+              batch_sizes: Sequence[int], sheets: int = 64) -> List[Dict[str, Any]]:
+    """Measure grading throughput for one worker layout.
+
+    Args:
+        samples: Encoded sheet images or decoded BGR pages
+        workers: Number of worker processes
+        cv_threads: OpenCV threads per worker (cv2.setNumThreads)
+        batch_sizes: Sheets per task to measure
+        sheets: Minimum number of sheets graded per measurement
+
+    Returns:
+        One dictionary per batch size with the layout, `sheets_per_s` and
+        `batch_ms` (median time a worker spends on one task)
+    """
+    correct_answers = [0] * 30
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_bench,
+                             initargs=(samples, cv_threads)) as executor:
+        # Start and warm every worker before timing anything
+        list(executor.map(_grade_chunk, [[0]] * workers, [correct_answers] * workers))
+        for batch_size in batch_sizes:
+            # Keep every worker busy for several tasks at every batch size
+            total = max(sheets, workers * batch_size * 4)
+            chunks = [[i % len(samples) for i in range(start, min(start + batch_size, total))]
+                      for start in range(0, total, batch_size)]
+            start = time.perf_counter()
+            batch_ms = list(executor.map(_grade_chunk, chunks, [correct_answers] * len(chunks)))
+            elapsed = time.perf_counter() - start
+            results.append({
+                'workers': workers,
+                'cv_threads': cv_threads,
+                'batch_size': batch_size,
+                'sheets_per_s': round(total / elapsed, 1),
+                'batch_ms': round(statistics.median(batch_ms), 1),
+            })
+    return results
+
+def _candidates(cpu_count: int) -> List[int]:
+    values = [1]
+    while values[-1] * 2 <= cpu_count:
+        values.append(values[-1] * 2)
+    if values[-1] != cpu_count:
+        values.append(cpu_count)
+    return values
+
+def autotune(samples: List[Any], worker_counts: Optional[Sequence[int]] = None,
+             thread_counts: Optional[Sequence[int]] = None, batch_sizes: Sequence[int] = (1, 4, 8, 16),
+             sheets: int = 64, max_latency_ms: float = 250.0) -> Dict[str, Any]:
+    """Benchmark every layout and pick the fastest for each mode.
+
+    Layouts with more OpenCV threads in total than twice the CPU count are
+    skipped unless both lists are given explicitly.
+
+    Args:
+        samples: Encoded sheet images or decoded BGR pages
+        worker_counts: Worker process counts to try (default: powers of two
+            up to the CPU count)
+        thread_counts: OpenCV threads per worker to try (default: same as workers)
+        batch_sizes: Sheets per task to try for the server
+        sheets: Minimum number of sheets graded per measurement
+        max_latency_ms: Longest median task time acceptable for the server
+
+    Returns:
+        Tuning entry with "batch", "server" and the raw "results"
+    """
+    import cv2
+
+    if not samples:
+        raise ValueError("No sample sheets to benchmark")
+    cpu_count = os.cpu_count() or 1
+    explicit = worker_counts is not None and thread_counts is not None
+    worker_counts = worker_counts or _candidates(cpu_count)
+    thread_counts = thread_counts or _candidates(cpu_count)
+    batch_sizes = sorted(set(batch_sizes) | {1})
+
+    results: List[Dict[str, Any]] = []
+    for workers in worker_counts:
+        for cv_threads in thread_counts:
+            if not explicit and workers * cv_threads > 2 * cpu_count:
+                continue
+            for result in benchmark(samples, workers, cv_threads, batch_sizes, sheets):
+                print(f"workers={workers:<3} cv_threads={cv_threads:<3} batch={result['batch_size']:<3} "
+                      f"{result['sheets_per_s']:8.1f} sheets/s  {result['batch_ms']:7.1f} ms/task")
+                results.append(result)
+
+    best_batch = max((r for r in results if r['batch_size'] == 1), key=lambda r: r['sheets_per_s'])
+    # Single-sheet tasks always qualify so a slow machine still gets a server layout
+    responsive = [r for r in results if r['batch_ms'] <= max_latency_ms or r['batch_size'] == 1]
+    best_server = max(responsive, key=lambda r: r['sheets_per_s'])
+    return {
+        'cpu_count': cpu_count,
+        'opencv': cv2.__version__,
+        'measured': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'batch': {'workers': best_batch['workers'], 'cv_threads': best_batch['cv_threads'],
+                  'sheets_per_s': best_batch['sheets_per_s']},
+        'server': {'workers': best_server['workers'], 'cv_threads': best_server['cv_threads'],
+                   'max_batch': best_server['batch_size'], 'sheets_per_s': best_server['sheets_per_s']},
+        'results': results,
+    }
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(',') if part]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Find the fastest worker layout for this machine")
+    parser.add_argument("inputs", nargs="+", help="sample sheets: image files, multi-page files or directories")
+    parser.add_argument("--sheets", type=int, default=64, help="minimum sheets graded per measurement")
+    parser.add_argument("--workers", type=_int_list, help="worker counts to try, e.g. 1,2,4")
+    parser.add_argument("--cv-threads", type=_int_list, help="OpenCV threads per worker to try, e.g. 1,2")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 4, 8, 16],
+                        help="server micro-batch sizes to try")
+    parser.add_argument("--max-latency-ms", type=float, default=250.0,
+                        help="longest acceptable time for one server micro-batch")
+    parser.add_argument("--config", default=CONFIG_PATH, help="configuration file to update")
+    parser.add_argument("--dry-run", action="store_true", help="print the result without saving it")
+    args = parser.parse_args()
+
+    from . import batch
+
+    samples = [payload for _, payload in batch.iter_jobs(args.inputs)
+               if not isinstance(payload, Exception)]
+    if not samples:
+        parser.error("No readable sample sheets found")
+
+    entry = autotune(samples, args.workers, args.cv_threads, args.batch_sizes,
+                     args.sheets, args.max_latency_ms)
+    print(f"batch:  {entry['batch']}")
+    print(f"server: {entry['server']}")
+    if not args.dry_run:
+        print(f"Saved to {save_tuning(entry, args.config)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,613 @@
+"""Batch grading of whole directories of scans.
+
+The batch runs as a staged pipeline with bounded hand-offs between stages:
+
+    reader thread  ->  worker processes  ->  writer thread
+    (file I/O,         (decode, locate,      (result rows)
+     page decode)       warp, detect, grade)
+
+The reader blocks once `queue_size` sheets are waiting, and no more than
+`max_in_flight` sheets are inside the process pool or waiting to be written,
+so memory stays flat regardless of how many files the input holds.
+
+With `shared_memory=True` every sheet is assigned a slot in a
+SharedFramePool.  Decoded pages, warped sheets and thresholded sheets stay
+in that slot and only its index crosses the process boundary.
+
+Usage:
+    python -m omr_processing.batch scans/ --out results.csv --key ABCDEABCDE
+"""
+import argparse
+import csv
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from . import image_utils, ingest
+from .page_classifier import PageRejected
+from .answer_manager import AnswerManager, parse_answer_key
+from .autotune import load_tuning
+from .duplicate_index import DuplicateIndex
+from .exam_store import ExamStore
+from .overlay import OverlayWriter
+from .roster import DEFAULT_ID_PATTERN, Roster, sheet_student_id
+from .shared_frames import SharedFramePool
+from .sheet_archive import SheetArchiveWriter
+
+RESULT_FIELDS = ['sheet', 'status', 'error', 'score', 'correct', 'incorrect',
+                 'unanswered', 'answers', 'rotation', 'worker_ms', 'student_id', 'roster', 'review']
+
+_DONE = object()
+
+# Shared frame pool and reusable buffers owned by each worker process
+_frames: Optional[SharedFramePool] = None
+_context: Optional[image_utils.ProcessingContext] = None
+
+def iter_input_files(inputs: Iterable[str]) -> Iterator[str]:
+    """Yield every supported scan file under the given files and directories.
+
+    Directories are walked lazily so huge trees start processing immediately.
+
+    Args:
+        inputs: File and directory paths
+
+    Yields:
+        Paths of supported scan files
+    """
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if ingest.is_supported(name):
+                        yield os.path.join(root, name)
+        elif ingest.is_supported(path):
+            yield path
+
+def iter_jobs(inputs: Iterable[str]) -> Iterator[Tuple[str, Union[bytes, np.ndarray]]]:
+    """Read sheets from disk for the worker stage.
+
+    Single-page images are passed on still encoded, so decoding happens in
+    the worker processes.  Multi-page containers are decoded page by page.
+
+    Args:
+        inputs: File and directory paths
+
+    Yields:
+        Tuples of (sheet id, encoded bytes or decoded BGR page)
+    """
+    for path in iter_input_files(inputs):
+        ext = os.path.splitext(path)[1].lower()
+        try:
+            if ext in ingest.SINGLE_PAGE_EXTENSIONS:
+                with open(path, 'rb') as f:
+                    yield path, f.read()
+            else:
+                for page, img in ingest.iter_pages(path):
+                    yield f"{path}#{page + 1}", img
+        except (OSError, ValueError, ImportError) as e:
+            yield path, e
+
+def _init_worker(frames_spec: Optional[Tuple[int, int, int, str]] = None,
+                 cv_threads: Optional[int] = None) -> None:
+    global _frames, _context
+    from . import pipeline
+
+    if cv_threads is not None:
+        cv2.setNumThreads(cv_threads)
+    if frames_spec is not None:
+        slots, width, height, name = frames_spec
+        _frames = SharedFramePool(slots, width, height, name=name)
+    _context = image_utils.ProcessingContext()
+    pipeline.warm_up(ctx=_context)
+
+def _grade_payload(payload: Union[bytes, np.ndarray], correct_answers: List[int],
+                   detect_options: Optional[Dict[str, Any]], screen: bool) -> Dict[str, Any]:
+    from . import pipeline
+
+    if isinstance(payload, bytes):
+        return pipeline.grade_bytes(payload, correct_answers, ctx=_context, detect_options=detect_options,
+                                    screen=screen)
+    return pipeline.grade_sheet(payload, correct_answers, ctx=_context, detect_options=detect_options,
+                                screen=screen)
+
+def grade_job(sheet_id: str, payload: Union[bytes, np.ndarray, Exception, None],
+              correct_answers: List[int], slot: Optional[int] = None,
+              detect_options: Optional[Dict[str, Any]] = None, screen: bool = True) -> Dict[str, Any]:
+    """Grade one sheet inside a worker process.
+
+    Args:
+        sheet_id: Identifier of the sheet (path, or path#page)
+        payload: Encoded image bytes, a decoded BGR image, the read error, or
+            None when the decoded image is already in the shared slot
+        correct_answers: List of correct answers (0-4 for A-E)
+        slot: Shared frame slot that receives the warped and thresholded images
+        detect_options: Keyword arguments for bubble_detector.analyze_answer_sheet
+        screen: Screen out blank, text and outline-less pages (see page_classifier)
+
+    Returns:
+        Small result dictionary suitable for sending back to the parent process
+    """
+    start = time.perf_counter()
+    row = {'sheet': sheet_id, 'slot': slot}
+    try:
+        if isinstance(payload, Exception):
+            raise payload
+        if payload is None:
+            payload = _frames.frame(slot)
+        if slot is not None:
+            # Warp and threshold straight into the shared slot
+            with _context.outputs(_frames.warped(slot), _frames.threshold(slot)):
+                result = _grade_payload(payload, correct_answers, detect_options, screen)
+        else:
+            result = _grade_payload(payload, correct_answers, detect_options, screen)
+        row['status'] = 'graded'
+        row['student_answers'] = result['student_answers']
+        row['grade'] = result['grade']
+        row['rotation'] = result['rotation']
+        row['phash'] = result['phash']
+        row['timings'] = result['timings']
+    except PageRejected as e:
+        row['status'] = 'rejected'
+        row['error'] = str(e)
+        row['reason'] = e.reason
+    except Exception as e:
+        row['status'] = 'error'
+        row['error'] = str(e)
+    row['worker_ms'] = (time.perf_counter() - start) * 1000
+    return row
+
+def format_row(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a worker result into a CSV row.
+
+    Args:
+        result: Dictionary returned by grade_job
+
+    Returns:
+        Dictionary keyed by RESULT_FIELDS
+    """
+    row = {'sheet': result['sheet'], 'status': result['status'],
+           'error': result.get('error', ''), 'worker_ms': f"{result['worker_ms']:.1f}"}
+    grade = result.get('grade')
+    if grade:
+        row['score'] = f"{grade['score_percentage']:.2f}"
+        row['correct'] = grade['correct_answers']
+        row['incorrect'] = grade['incorrect_answers']
+        row['unanswered'] = grade['unanswered']
+        row['answers'] = ''.join('ABCDE'[a] if a != -1 else '-' for a in result['student_answers'])
+        row['rotation'] = result.get('rotation', 0)
+    row['student_id'] = result.get('student_id') or ''
+    row['roster'] = result.get('roster', '')
+    row['review'] = result.get('review', '')
+    return row
+
+def _acquire_slot(frames: SharedFramePool, stop: threading.Event) -> Optional[int]:
+    while not stop.is_set():
+        try:
+            return frames.acquire(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+def _put(target: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _read_stage(inputs: Iterable[str], read_queue: queue.Queue, stop: threading.Event,
+                frames: Optional[SharedFramePool]) -> None:
+    try:
+        for sheet_id, payload in iter_jobs(inputs):
+            slot = None
+            if frames is not None:
+                slot = _acquire_slot(frames, stop)
+                if slot is None:
+                    return
+                if isinstance(payload, np.ndarray):
+                    # Resize the page straight into the slot instead of pickling it
+                    cv2.resize(payload, (frames.width, frames.height), dst=frames.frame(slot))
+                    payload = None
+            if not _put(read_queue, (sheet_id, payload, slot), stop):
+                return
+    finally:
+        _put(read_queue, _DONE, stop)
+
+class ResultSink:
+    """Extra output stage run on the writer thread for every graded sheet.
+
+    Sinks run in order before the CSV row is written, so a sink may add
+    fields to the result for later sinks and the CSV to use.
+    """
+
+    def write(self, result: Dict[str, Any], frames: Optional[SharedFramePool]) -> None:
+        """Handle one result.
+
+        Args:
+            result: Dictionary returned by grade_job
+            frames: Shared frame pool holding the sheet's images in
+                result['slot'], or None when shared memory is off
+        """
+
+    def flush(self) -> None:
+        """Write out any buffered output."""
+
+    def close(self) -> None:
+        """Flush and release the sink's resources."""
+        self.flush()
+
+class StoreSink(ResultSink):
+    """Writes graded sheets to an ExamStore in batched transactions."""
+
+    def __init__(self, store: ExamStore, exam: str, key_version: Optional[int] = None,
+                 batch_size: int = 200):
+        """Initialize the sink.
+
+        Args:
+            store: Exam store to write to
+            exam: Exam the sheets belong to
+            key_version: Version of the answer key used for grading
+            batch_size: Number of sheets per transaction
+        """
+        self.store = store
+        self.exam = exam
+        self.key_version = key_version
+        self.batch_size = batch_size
+        self.pending: List[Dict[str, Any]] = []
+
+    def write(self, result: Dict[str, Any], frames: Optional[SharedFramePool]) -> None:
+        self.pending.append(result)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.pending:
+            self.store.add_results(self.exam, self.pending, self.key_version)
+            self.pending = []
+
+class RosterSink(ResultSink):
+    """Resolves each graded sheet's student ID against a class roster.
+
+    The ID comes from result['student_id'] when the sheet carries one, or
+    else from the file name, which must then match the roster exactly.
+    Put it first so later sinks see the resolved ID.
+    """
+
+    def __init__(self, roster: Roster, course_code: Optional[str] = None, year: Optional[str] = None,
+                 id_pattern: str = DEFAULT_ID_PATTERN):
+        """Initialize the sink.
+
+        Args:
+            roster: Roster to match against
+            course_code: Only accept students enrolled in this course
+            year: Only accept students from this year
+            id_pattern: Regular expression taking the ID from the file name
+                (see roster.sheet_student_id)
+        """
+        self.roster = roster
+        self.course_code = course_code
+        self.year = year
+        self.id_pattern = id_pattern
+        self.counts: Dict[str, int] = {}
+
+    def write(self, result: Dict[str, Any], frames: Optional[SharedFramePool]) -> None:
+        if result['status'] != 'graded':
+            return
+        if result.get('student_id'):
+            match = self.roster.resolve(result['student_id'], self.course_code, self.year)
+        else:
+            match = self.roster.resolve(sheet_student_id(result['sheet'], self.id_pattern),
+                                        self.course_code, self.year, correct=False)
+        # Unresolved sheets keep the ID as read so a reviewer can see it
+        result['student_id'] = match['student_id'] or match['raw_id'] or None
+        result['roster'] = match['status']
+        self.counts[match['status']] = self.counts.get(match['status'], 0) + 1
+
+    def close(self) -> None:
+        if self.counts:
+            print(f"Roster: {self.counts}")
+
+class DuplicateSink(ResultSink):
+    """Flags sheets that duplicate an earlier sheet in a DuplicateIndex.
+
+    A sheet with the student ID of an earlier sheet gets the status
+    'duplicate'.  A sheet that only looks like an earlier one stays graded
+    with a `review` note, since two students may give the same answers.
+    Put it before other sinks (after a RosterSink) so they see the status.
+    """
+
+    def __init__(self, index: DuplicateIndex):
+        """Initialize the sink.
+
+        Args:
+            index: Index of the sheets seen so far
+        """
+        self.index = index
+
+    def write(self, result: Dict[str, Any], frames: Optional[SharedFramePool]) -> None:
+        if result['status'] != 'graded' or 'phash' not in result:
+            return
+        match = self.index.check(result['sheet'], result['phash'], result.get('student_id'))
+        if match is None:
+            return
+        sheet, distance, reason = match
+        result['duplicate_of'] = sheet
+        if reason == 'student_id':
+            result['status'] = 'duplicate'
+            result['error'] = f"Duplicate of {sheet} (same student ID, {distance} bits apart)"
+        else:
+            result['review'] = f"Possible rescan of {sheet} ({distance} bits apart)"
+
+    def close(self) -> None:
+        self.index.close()
+
+class ArchiveSink(ResultSink):
+    """Copies each graded sheet's warped image, as grayscale, into a SheetArchive.
+
+    Needs shared memory, since the warped images only reach the writer
+    thread through the frame pool.
+    """
+
+    def __init__(self, archive: SheetArchiveWriter):
+        """Initialize the sink.
+
+        Args:
+            archive: Archive to append sheets to
+        """
+        self.archive = archive
+        self.gray = np.empty((archive.height, archive.width), dtype=np.uint8)
+
+    def write(self, result: Dict[str, Any], frames: Optional[SharedFramePool]) -> None:
+        if result['status'] != 'graded' or frames is None:
+            return
+        cv2.cvtColor(frames.warped(result['slot']), cv2.COLOR_BGR2GRAY, dst=self.gray)
+        self.archive.append(result['sheet'], self.gray)
+
+    def close(self) -> None:
+        self.archive.close()
+
+class OverlaySink(ResultSink):
+    """Hands each graded sheet to an OverlayWriter for a marked copy.
+
+    Needs shared memory, since the warped images only reach the writer
+    thread through the frame pool.  Rendering and encoding run on the
+    writer's own threads; this sink only copies the image.
+    """
+
+    def __init__(self, writer: OverlayWriter, correct_answers: List[int]):
+        """Initialize the sink.
+
+        Args:
+            writer: Overlay writer to submit sheets to
+            correct_answers: List of correct answers (0-4 for A-E)
+        """
+        self.writer = writer
+        self.correct_answers = correct_answers
+
+    def write(self, result: Dict[str, Any], frames: Optional[SharedFramePool]) -> None:
+        if result['status'] != 'graded' or frames is None:
+            return
+        self.writer.submit(result['sheet'], frames.warped(result['slot']), result['student_answers'],
+                           self.correct_answers, result['grade'])
+
+    def close(self) -> None:
+        self.writer.close()
+
+def _write_stage(output_path: str, write_queue: queue.Queue, in_flight: threading.BoundedSemaphore,
+                 summary: Dict[str, int], frames: Optional[SharedFramePool],
+                 sinks: List[ResultSink], stop: threading.Event, failures: List[BaseException]) -> None:
+    f = None
+    try:
+        f = open(output_path, 'w', newline='')
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+    except OSError as e:
+        failures.append(e)
+        stop.set()
+
+    while True:
+        item = write_queue.get()
+        if item is _DONE:
+            break
+        future, sheet_id, slot = item
+        # After a failure keep draining so run_batch never waits for a slot
+        if not failures:
+            try:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'sheet': sheet_id, 'slot': None, 'status': 'error',
+                              'error': f"Worker failure: {e}", 'worker_ms': 0.0}
+                for sink in sinks:
+                    sink.write(result, frames if result.get('slot') is not None else None)
+                writer.writerow(format_row(result))
+                summary[result['status']] = summary.get(result['status'], 0) + 1
+            except Exception as e:
+                failures.append(e)
+                stop.set()
+        else:
+            future.cancel()
+        if slot is not None:
+            frames.release(slot)
+        in_flight.release()
+
+    for sink in sinks:
+        try:
+            sink.close()
+        except Exception as e:
+            failures.append(e)
+    if f is not None:
+        f.close()
+
+def run_batch(inputs: Iterable[str], correct_answers: List[int], output_path: str,
+              workers: int = 0, queue_size: int = 16, max_in_flight: int = 0,
+              shared_memory: bool = False, sinks: Optional[List[ResultSink]] = None,
+              detect_options: Optional[Dict[str, Any]] = None,
+              cv_threads: Optional[int] = None, screen: bool = True) -> Dict[str, int]:
+    """Grade every sheet under the inputs and write one CSV row per sheet.
+
+    Args:
+        inputs: File and directory paths
+        correct_answers: List of correct answers (0-4 for A-E)
+        output_path: Path of the CSV file to write
+        workers: Number of worker processes (0 uses the CPU count)
+        queue_size: Maximum number of read sheets waiting for a worker
+        max_in_flight: Maximum number of sheets in the pool or awaiting the
+            writer (0 uses twice the worker count)
+        shared_memory: Pass images between processes through a SharedFramePool
+        sinks: Extra output stages run on the writer thread for every sheet
+        detect_options: Keyword arguments for bubble_detector.analyze_answer_sheet
+        cv_threads: OpenCV threads per worker (None keeps OpenCV's default)
+        screen: Screen out blank, text and outline-less pages (see page_classifier)
+
+    Returns:
+        Dictionary counting sheets per status
+
+    Raises:
+        The first error of the writer thread (CSV or sink), after the
+        pipeline has been shut down
+    """
+    if not correct_answers:
+        raise ValueError("No correct answers set")
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    read_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    write_queue: queue.Queue = queue.Queue()
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    stop = threading.Event()
+    summary: Dict[str, int] = {}
+    failures: List[BaseException] = []
+
+    # Every sheet waiting in the read queue or in flight holds one slot
+    frames = SharedFramePool(queue_size + max_in_flight + 1) if shared_memory else None
+    frames_spec = frames.spec() if frames is not None else None
+
+    reader = threading.Thread(target=_read_stage, args=(inputs, read_queue, stop, frames), daemon=True)
+    writer = threading.Thread(target=_write_stage,
+                              args=(output_path, write_queue, in_flight, summary, frames, sinks or [],
+                                    stop, failures))
+    reader.start()
+    writer.start()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(frames_spec, cv_threads)) as executor:
+            # stop is only set early when the writer fails
+            while not stop.is_set():
+                try:
+                    job = read_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if job is _DONE:
+                    break
+                sheet_id, payload, slot = job
+                in_flight.acquire()
+                if stop.is_set():
+                    in_flight.release()
+                    if slot is not None:
+                        frames.release(slot)
+                    break
+                future: Future = executor.submit(grade_job, sheet_id, payload, correct_answers, slot,
+                                                 detect_options, screen)
+                # Results reach the writer in submission order
+                write_queue.put((future, sheet_id, slot))
+    finally:
+        stop.set()
+        write_queue.put(_DONE)
+        writer.join()
+        reader.join()
+        if frames is not None:
+            frames.close()
+    if failures:
+        raise failures[0]
+    return summary
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Grade a directory of OMR sheets")
+    parser.add_argument("inputs", nargs="+", help="image files, multi-page files or directories")
+    parser.add_argument("--out", default="results.csv", help="CSV file to write")
+    parser.add_argument("--key", help="answer key, e.g. ABCDEABCDE (default: correct_answers.csv)")
+    parser.add_argument("--db", help="exam database to read the key from and store results in")
+    parser.add_argument("--exam", help="exam name in the database")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="worker processes (default: autotune result, else CPU count)")
+    parser.add_argument("--cv-threads", type=int,
+                        help="OpenCV threads per worker (default: autotune result, else OpenCV's own)")
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--shared-memory", action="store_true",
+                        help="pass images between processes through shared memory")
+    parser.add_argument("--no-screen", action="store_true",
+                        help="grade every page, without screening out blank, text and outline-less pages")
+    parser.add_argument("--boxes", action="store_true",
+                        help="score whole answer boxes instead of the bubble interiors (less accurate)")
+    parser.add_argument("--duplicates", metavar="INDEX",
+                        help="flag rescanned sheets, keeping the hash index in this file")
+    parser.add_argument("--roster", help="class roster CSV to match student IDs against")
+    parser.add_argument("--course", help="only match roster students enrolled in this course")
+    parser.add_argument("--year", help="only match roster students from this year")
+    parser.add_argument("--id-pattern", default=DEFAULT_ID_PATTERN,
+                        help="regular expression taking the student ID from the file name "
+                             "(default: the whole name must be digits)")
+    parser.add_argument("--archive", help="directory to store warped sheets in for sheet_archive "
+                                          "re-detection (implies --shared-memory)")
+    parser.add_argument("--overlays", help="directory to write marked copies of the graded sheets to "
+                                           "(implies --shared-memory)")
+    parser.add_argument("--overlay-format", choices=["jpg", "png"], default="jpg")
+    args = parser.parse_args()
+
+    if bool(args.db) != bool(args.exam):
+        parser.error("--db and --exam must be used together")
+
+    store = ExamStore(args.db) if args.db else None
+    sinks: List[ResultSink] = []
+    if args.roster:
+        sinks.append(RosterSink(Roster.from_csv(args.roster), args.course, args.year, args.id_pattern))
+    if args.duplicates:
+        sinks.append(DuplicateSink(DuplicateIndex(path=args.duplicates)))
+    key_version = None
+    if args.key:
+        correct_answers = parse_answer_key(args.key)
+    elif store is not None:
+        manager = AnswerManager()
+        key_version = manager.load_from_store(store, args.exam)
+        if key_version is None:
+            parser.error(f"Exam {args.exam!r} has no answer key in {args.db}")
+        correct_answers = manager.get_grading_list()
+    else:
+        manager = AnswerManager()
+        manager.load_from_csv()
+        correct_answers = manager.get_grading_list()
+    if store is not None:
+        sinks.append(StoreSink(store, args.exam, key_version))
+    if args.archive:
+        sinks.append(ArchiveSink(SheetArchiveWriter(args.archive)))
+    if args.overlays:
+        sinks.append(OverlaySink(OverlayWriter(args.overlays, extension=f".{args.overlay_format}"),
+                                 correct_answers))
+
+    tuning = load_tuning('batch')
+    workers = args.workers or tuning.get('workers', 0)
+    cv_threads = args.cv_threads if args.cv_threads is not None else tuning.get('cv_threads')
+
+    start = time.perf_counter()
+    summary = run_batch(args.inputs, correct_answers, args.out, workers, args.queue_size,
+                        shared_memory=args.shared_memory or bool(args.archive or args.overlays), sinks=sinks,
+                        detect_options={'use_masks': False} if args.boxes else None,
+                        cv_threads=cv_threads, screen=not args.no_screen)
+    elapsed = time.perf_counter() - start
+    total = sum(summary.values())
+    print(f"Processed {total} sheets in {elapsed:.1f}s "
+          f"({total / elapsed if elapsed else 0:.1f} sheets/s): {summary}")
+
+if __name__ == "__main__":
+    main()
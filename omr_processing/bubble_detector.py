@@ -1,5 +1,6 @@
 import cv2
 import numpy as np
+from functools import lru_cache
 from typing import List, Tuple, Optional, Dict
 # from . import student_info_detector
 
@@ -44,12 +45,22 @@ def split_answer_boxes(img: np.ndarray, rows: int = 30, cols: int = 5) -> List[n
     
     return boxes
 
-def detect_marked_answers(boxes: List[np.ndarray], threshold_ratio: float = 0.3) -> List[int]:
+# Smallest share of inked pixels for an answer to count as marked.  A
+# filled bubble covers only a small part of its box, but most of the disc
+# sampled by bubble_masks.
+BOX_FILL_RATIO = 0.05
+MASK_FILL_RATIO = 0.3
+
+def detect_marked_answers(boxes: List[np.ndarray], threshold_ratio: float = BOX_FILL_RATIO,
+                          margin: float = 1.2, block_size: int = 11) -> List[int]:
     """Detect which answer bubbles are marked for each question using adaptive thresholding.
     
     Args:
         boxes: List of answer box images
-        threshold_ratio: Ratio of max pixel count to consider an answer marked
+        threshold_ratio: Smallest share of a box's pixels that must be inked
+            for it to count as marked
+        margin: How many times the next highest count the marked box must reach
+        block_size: Neighbourhood size of the per-box adaptive threshold (odd)
         
     Returns:
         List of detected answers (-1 for unmarked questions)
@@ -64,7 +75,7 @@ def detect_marked_answers(boxes: List[np.ndarray], threshold_ratio: float = 0.3)
             # Apply Gaussian blur to reduce noise
             blurred = cv2.GaussianBlur(box, (3, 3), 0)
             # Apply adaptive thresholding
-            adaptive = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2)
+            adaptive = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, block_size, 2)
             processed_boxes.append(adaptive)
         
         # Count non-zero pixels
@@ -72,11 +83,11 @@ def detect_marked_answers(boxes: List[np.ndarray], threshold_ratio: float = 0.3)
         max_count = max(pixel_counts)
         marked = np.argmax(pixel_counts)
         
-        # Use relative thresholding
-        if max_count > 0 and pixel_counts[marked] > max_count * threshold_ratio:
+        # Require an absolute amount of ink before comparing the options
+        if max_count > 0 and max_count > current_boxes[marked].size * threshold_ratio:
             # Verify this is significantly higher than other options
             sorted_counts = sorted(pixel_counts, reverse=True)
-            if len(sorted_counts) > 1 and sorted_counts[0] > sorted_counts[1] * 1.2:  # 20% higher than next highest
+            if len(sorted_counts) > 1 and sorted_counts[0] > sorted_counts[1] * margin:
                 answers.append(marked)
             else:
                 answers.append(-1)  # Multiple answers or unclear marking
@@ -85,6 +96,102 @@ def detect_marked_answers(boxes: List[np.ndarray], threshold_ratio: float = 0.3)
     
     return answers
 
+@lru_cache(maxsize=16)
+def bubble_centres(height: int, width: int, rows: int = 30, cols: int = 5) -> Tuple[np.ndarray, int]:
+    """Locate the centre of every bubble of a sheet layout.
+
+    Bubbles sit at the centre of the boxes produced by split_answer_boxes.
+
+    Args:
+        height: Height of the sheet image
+        width: Width of the sheet image
+        rows: Number of questions
+        cols: Number of options per question
+
+    Returns:
+        Tuple of (array of shape (rows * cols, 2) with the (x, y) centre of
+        each bubble in question order, smaller box side in pixels)
+    """
+    row_sizes = [height // rows + (1 if i < height % rows else 0) for i in range(rows)]
+    col_sizes = [width // cols + (1 if j < width % cols else 0) for j in range(cols)]
+    row_starts = np.cumsum([0] + row_sizes[:-1])
+    col_starts = np.cumsum([0] + col_sizes[:-1])
+
+    centres = np.empty((rows * cols, 2), dtype=np.int64)
+    for i in range(rows):
+        cy = row_starts[i] + (height // rows) // 2
+        for j in range(cols):
+            centres[i * cols + j] = (col_starts[j] + col_sizes[j] // 2, cy)
+    centres.flags.writeable = False
+    return centres, min(height // rows, width // cols)
+
+@lru_cache(maxsize=16)
+def bubble_masks(height: int, width: int, rows: int = 30, cols: int = 5,
+                 radius_ratio: float = 0.35) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Precompute the pixels inside every bubble of a sheet layout.
+
+    Only a disc around each bubble centre (see bubble_centres) is sampled,
+    so grid lines, printed letters and the white margin around the bubble
+    are never read.  Results are cached per layout.
+
+    Args:
+        height: Height of the thresholded sheet
+        width: Width of the thresholded sheet
+        rows: Number of questions
+        cols: Number of options per question
+        radius_ratio: Bubble radius as a fraction of the smaller box side
+
+    Returns:
+        Tuple of (flat pixel indices of all bubbles, start offset of each
+        bubble in the indices, pixel count of each bubble)
+    """
+    centres, box_size = bubble_centres(height, width, rows, cols)
+    radius = box_size * radius_ratio
+
+    span = np.arange(-int(radius), int(radius) + 1)
+    dy, dx = np.meshgrid(span, span, indexing='ij')
+    inside = dy ** 2 + dx ** 2 <= radius ** 2
+    dy, dx = dy[inside], dx[inside]
+
+    indices = [(cy + dy) * width + (cx + dx) for cx, cy in centres]
+
+    areas = np.array([len(idx) for idx in indices], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(areas)[:-1]))
+    flat = np.concatenate(indices).astype(np.intp)
+    for array in (flat, offsets, areas):
+        array.flags.writeable = False
+    return flat, offsets, areas
+
+def detect_marked_answers_masked(img: np.ndarray, rows: int = 30, cols: int = 5,
+                                 threshold_ratio: float = MASK_FILL_RATIO, margin: float = 1.2) -> List[int]:
+    """Detect marked answers by sampling only the precomputed bubble interiors.
+
+    Applies the same decision rule as detect_marked_answers to the share of
+    inked pixels inside each bubble.
+
+    Args:
+        img: Thresholded sheet image (inked pixels non-zero)
+        rows: Number of questions
+        cols: Number of options per question
+        threshold_ratio: Smallest share of a bubble's pixels that must be
+            inked for it to count as marked
+        margin: How many times the next highest fill the marked bubble must reach
+
+    Returns:
+        List of detected answers (-1 for unmarked questions)
+    """
+    height, width = img.shape[:2]
+    flat, offsets, areas = bubble_masks(height, width, rows, cols)
+    # One gather and one segmented sum score every bubble on the sheet
+    samples = np.take(img.reshape(-1), flat) > 0
+    fill = (np.add.reduceat(samples, offsets, dtype=np.int64) / areas).reshape(rows, cols)
+
+    marked = fill.argmax(axis=1)
+    ordered = np.sort(fill, axis=1)
+    best, second = ordered[:, -1], ordered[:, -2]
+    valid = (best > 0) & (best > threshold_ratio) & (best > second * margin)
+    return np.where(valid, marked, -1).tolist()
+
 def validate_answer_boxes(boxes: List[np.ndarray], expected_questions: int = 20) -> bool:
     """Validate that we have the correct number of answer boxes.
     
@@ -97,23 +204,40 @@ def validate_answer_boxes(boxes: List[np.ndarray], expected_questions: int = 20)
     """
     return len(boxes) == expected_questions * 5  # 5 options per question
 
-def analyze_answer_sheet(img: np.ndarray) -> Dict[str, str]:
+def analyze_answer_sheet(img: np.ndarray, rows: int = 30, threshold_ratio: Optional[float] = None,
+                         margin: float = 1.2, block_size: int = 11,
+                         use_masks: bool = True) -> Dict[str, str]:
     """Analyze an answer sheet image and return detected answers.
     
     Args:
         img: Preprocessed and thresholded image
+        rows: Number of question rows on the sheet
+        threshold_ratio: Smallest inked share of a marked box or bubble
+            (default: BOX_FILL_RATIO, or MASK_FILL_RATIO with use_masks)
+        margin: See detect_marked_answers
+        block_size: See detect_marked_answers
+        use_masks: Score only the bubble interiors (see bubble_masks); when
+            False, every pixel of each box is thresholded and counted, which
+            grid lines and printed letters make far less accurate
         
     Returns:
         Dictionary mapping question numbers to letter answers (A-E)
     """
-    # Process answers
-    boxes = split_answer_boxes(img)
-    print(f"Detected {len(boxes)} answer boxes")
-    # print("Boxes", boxes)
-    if not validate_answer_boxes(boxes):
-        raise ValueError("Invalid number of answer boxes detected")
-    
-    marked_answers = detect_marked_answers(boxes)
+    if use_masks:
+        if threshold_ratio is None:
+            threshold_ratio = MASK_FILL_RATIO
+        marked_answers = detect_marked_answers_masked(img, rows, 5, threshold_ratio, margin)
+    else:
+        # Process answers
+        boxes = split_answer_boxes(img, rows)
+        print(f"Detected {len(boxes)} answer boxes")
+        # print("Boxes", boxes)
+        if not validate_answer_boxes(boxes, rows):
+            raise ValueError("Invalid number of answer boxes detected")
+        
+        if threshold_ratio is None:
+            threshold_ratio = BOX_FILL_RATIO
+        marked_answers = detect_marked_answers(boxes, threshold_ratio, margin, block_size)
     
     # Convert numeric answers to letter format
     answer_dict = {}
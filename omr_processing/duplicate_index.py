@@ -0,0 +1,206 @@
+"""Perceptual-hash index for catching rescanned sheets.
+
+Every warped sheet gets a 64-bit hash of its marks.  The printed template
+is identical on every sheet, so a hash of the whole page mostly encodes
+the template and puts different sheets only a few bits apart.  Instead the
+darkness inside each bubble is measured, the sheet's median is subtracted
+to cancel the template and the exposure, and the vector is reduced to 64
+bits by random projections (SimHash).  The Hamming distance between two
+hashes then grows with the angle between the sheets' mark patterns.  On
+the golden corpus simulated rescans land at most 10 bits apart and
+distinct sheets at least 21, so DEFAULT_MAX_DISTANCE is 12.
+
+The marks are the answers, so two students who give the same (or nearly
+the same) answers hash close together.  A hash match is therefore only a
+hint: it is never reported between two sheets whose student IDs are both
+known and differ, and find() labels it "image" so callers can send it to
+review instead of dropping the sheet.  Only a repeated student ID is a
+certain duplicate.
+
+The index splits each hash into 16-bit bands and keeps one
+bucket table per band.  Two hashes within `max_distance` bits must agree
+within `max_distance // bands` bits on at least one band.  A lookup
+therefore probes only the buckets near the query's bands instead of
+comparing against every sheet seen so far.
+
+Sheets that carry a student ID are also matched on the ID exactly.
+"""
+import json
+import os
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .bubble_detector import bubble_masks
+
+HASH_BITS = 64
+HASH_SEED = 0x0A11
+DEFAULT_MAX_DISTANCE = 12
+# Bubble radius sampled by the hash, as a fraction of the smaller box side;
+# smaller than the detector's so the printed outline barely contributes
+HASH_RADIUS_RATIO = 0.3
+
+@lru_cache(maxsize=4)
+def _projections(size: int) -> np.ndarray:
+    # The legacy RandomState stream never changes between NumPy versions, so
+    # hashes stored in an index stay comparable
+    projections = np.random.RandomState(HASH_SEED).standard_normal((HASH_BITS, size))
+    projections.flags.writeable = False
+    return projections
+
+def perceptual_hash(img: np.ndarray, rows: int = 30, cols: int = 5) -> int:
+    """Compute a 64-bit hash of the marks on a warped sheet.
+
+    Args:
+        img: BGR or grayscale warped sheet image
+        rows: Number of questions
+        cols: Number of options per question
+
+    Returns:
+        Hash as an unsigned 64-bit integer
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    height, width = gray.shape
+    flat, offsets, areas = bubble_masks(height, width, rows, cols, HASH_RADIUS_RATIO)
+    sums = np.add.reduceat(np.take(gray.reshape(-1), flat), offsets, dtype=np.int64)
+    darkness = 255.0 - sums / areas
+    bits = _projections(rows * cols) @ (darkness - np.median(darkness)) > 0
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming_distance(a: int, b: int) -> int:
+    """Count the bits in which two hashes differ."""
+    return bin(a ^ b).count('1')
+
+class DuplicateIndex:
+    """Near-neighbour index over sheet hashes and student IDs."""
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE, bands: int = 4, path: Optional[str] = None):
+        """Initialize the index.
+
+        Args:
+            max_distance: Largest Hamming distance still treated as the same sheet
+            bands: Number of bands the 64-bit hash is split into
+            path: Optional JSON-lines file that persists entries; existing
+                entries are loaded and new ones appended
+        """
+        if HASH_BITS % bands:
+            raise ValueError(f"bands must divide {HASH_BITS}")
+        self.max_distance = max_distance
+        self.bands = bands
+        self.band_bits = HASH_BITS // bands
+        self.band_mask = (1 << self.band_bits) - 1
+
+        # Every bit pattern of weight <= radius, used to probe neighbouring buckets
+        radius = max_distance // bands
+        self._probes = [sum(1 << bit for bit in bits)
+                        for weight in range(radius + 1)
+                        for bits in combinations(range(self.band_bits), weight)]
+
+        self.sheets: List[str] = []
+        self.hashes: List[int] = []
+        self.student_ids: List[Optional[str]] = []
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self._students: Dict[str, int] = {}
+
+        self._log = None
+        if path is not None:
+            if os.path.exists(path):
+                with open(path) as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        self._insert(entry['sheet'], int(entry['hash'], 16), entry.get('student_id'))
+            self._log = open(path, 'a')
+
+    def __len__(self) -> int:
+        return len(self.sheets)
+
+    def _band(self, value: int, band: int) -> int:
+        return (value >> (band * self.band_bits)) & self.band_mask
+
+    def _insert(self, sheet_id: str, value: int, student_id: Optional[str]) -> None:
+        position = len(self.sheets)
+        self.sheets.append(sheet_id)
+        self.hashes.append(value)
+        self.student_ids.append(student_id or None)
+        for band, buckets in enumerate(self._buckets):
+            buckets.setdefault(self._band(value, band), []).append(position)
+        if student_id:
+            self._students.setdefault(student_id, position)
+
+    def find(self, value: int, student_id: Optional[str] = None) -> Optional[Tuple[str, int, str]]:
+        """Look for a sheet already in the index that matches this one.
+
+        Args:
+            value: Perceptual hash of the sheet
+            student_id: Decoded student ID, if any
+
+        Returns:
+            Tuple of (matching sheet id, Hamming distance, "student_id" or
+            "image") for the closest match, or None.  Image matches skip
+            sheets carrying a different known student ID.
+        """
+        if student_id and student_id in self._students:
+            position = self._students[student_id]
+            return self.sheets[position], hamming_distance(value, self.hashes[position]), 'student_id'
+
+        best = None
+        checked = set()
+        for band, buckets in enumerate(self._buckets):
+            key = self._band(value, band)
+            for probe in self._probes:
+                for position in buckets.get(key ^ probe, ()):
+                    if position in checked:
+                        continue
+                    checked.add(position)
+                    other_id = self.student_ids[position]
+                    if student_id and other_id and other_id != student_id:
+                        continue
+                    distance = hamming_distance(value, self.hashes[position])
+                    if distance <= self.max_distance and (best is None or distance < best[1]):
+                        best = (position, distance)
+        if best is None:
+            return None
+        return self.sheets[best[0]], best[1], 'image'
+
+    def add(self, sheet_id: str, value: int, student_id: Optional[str] = None) -> None:
+        """Add a sheet to the index.
+
+        Args:
+            sheet_id: Identifier of the sheet
+            value: Perceptual hash of the sheet
+            student_id: Decoded student ID, if any
+        """
+        self._insert(sheet_id, value, student_id)
+        if self._log is not None:
+            self._log.write(json.dumps({'sheet': sheet_id, 'hash': f"{value:016x}",
+                                        'student_id': student_id}) + '\n')
+            self._log.flush()
+
+    def check(self, sheet_id: str, value: int,
+              student_id: Optional[str] = None) -> Optional[Tuple[str, int, str]]:
+        """Look up a sheet and add it to the index unless its student ID was seen before.
+
+        Sheets that only match on the image are added too: they may be a
+        different student with the same answers.
+
+        Args:
+            sheet_id: Identifier of the sheet
+            value: Perceptual hash of the sheet
+            student_id: Decoded student ID, if any
+
+        Returns:
+            Same as find
+        """
+        match = self.find(value, student_id)
+        if match is None or match[2] != 'student_id':
+            self.add(sheet_id, value, student_id)
+        return match
+
+    def close(self) -> None:
+        """Close the persistence file."""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
@@ -0,0 +1,350 @@
+"""SQLite store for exams, answer keys, templates and graded sheets.
+
+Where correct_answers.csv holds a single answer key, one database file
+keeps versioned answer keys for every exam, and graded sheets with their
+per-question answers are written in batched transactions.  The database
+runs in WAL mode so batch workers, the grading server and the GUI can read
+keys and write results at the same time.  Tools given --db read keys from
+the store; the others still use correct_answers.csv, which import-csv
+copies into the store as a new key version.
+
+Usage:
+    python -m omr_processing.exam_store exams.db import-csv midterm correct_answers.csv
+    python -m omr_processing.exam_store exams.db set-key midterm ABCDEABCDE
+"""
+import argparse
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_DB = 'omr_results.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS exams (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    course_code TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    cols INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS answer_keys (
+    id INTEGER PRIMARY KEY,
+    exam_id INTEGER NOT NULL REFERENCES exams(id),
+    version INTEGER NOT NULL,
+    template_id INTEGER REFERENCES templates(id),
+    answers TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (exam_id, version)
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    id INTEGER PRIMARY KEY,
+    exam_id INTEGER NOT NULL REFERENCES exams(id),
+    key_id INTEGER REFERENCES answer_keys(id),
+    source TEXT NOT NULL,
+    student_id TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    score REAL,
+    correct INTEGER,
+    incorrect INTEGER,
+    unanswered INTEGER,
+    graded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS sheets_exam_student ON sheets (exam_id, student_id);
+CREATE INDEX IF NOT EXISTS sheets_source ON sheets (source);
+CREATE TABLE IF NOT EXISTS sheet_answers (
+    sheet_id INTEGER NOT NULL REFERENCES sheets(id) ON DELETE CASCADE,
+    question INTEGER NOT NULL,
+    answer INTEGER NOT NULL,
+    PRIMARY KEY (sheet_id, question)
+) WITHOUT ROWID;
+"""
+
+class ExamStore:
+    def __init__(self, path: str = DEFAULT_DB):
+        """Open (and create if needed) the exam database.
+
+        The connection may be shared between threads; writes are serialised
+        by an internal lock.
+
+        Args:
+            path: Path to the SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+
+    def __enter__(self) -> 'ExamStore':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def create_exam(self, name: str, course_code: Optional[str] = None) -> int:
+        """Create an exam, or return the id of the existing exam with that name.
+
+        Args:
+            name: Unique exam name
+            course_code: Optional course code
+
+        Returns:
+            Exam id
+        """
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO exams (name, course_code) VALUES (?, ?)",
+                               (name, course_code))
+            return self._conn.execute("SELECT id FROM exams WHERE name = ?", (name,)).fetchone()[0]
+
+    def get_exam_id(self, name: str) -> Optional[int]:
+        """Look up an exam by name.
+
+        Args:
+            name: Exam name
+
+        Returns:
+            Exam id or None if the exam does not exist
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM exams WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def list_exams(self) -> List[str]:
+        """Get the names of all exams.
+
+        Returns:
+            Exam names in creation order
+        """
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT name FROM exams ORDER BY id")]
+
+    def save_template(self, name: str, width: int = 600, height: int = 700,
+                      rows: int = 30, cols: int = 5) -> int:
+        """Create or update a sheet layout template.
+
+        Args:
+            name: Unique template name
+            width: Width of the processed image
+            height: Height of the processed image
+            rows: Number of question rows
+            cols: Number of options per question
+
+        Returns:
+            Template id
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO templates (name, width, height, rows, cols) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET width = excluded.width, height = excluded.height, "
+                "rows = excluded.rows, cols = excluded.cols",
+                (name, width, height, rows, cols))
+            return self._conn.execute("SELECT id FROM templates WHERE name = ?", (name,)).fetchone()[0]
+
+    def get_template(self, name: str) -> Optional[Dict[str, Any]]:
+        """Look up a sheet layout template.
+
+        Args:
+            name: Template name
+
+        Returns:
+            Dictionary of template fields or None if not found
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM templates WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def save_answer_key(self, exam: str, key: str, template: Optional[str] = None) -> int:
+        """Store a new version of an exam's answer key.
+
+        Args:
+            exam: Exam name (created if it does not exist)
+            key: Answer key string, one letter (A-E) or "-" per question
+            template: Optional name of the sheet template the key belongs to
+
+        Returns:
+            Version number of the stored key
+        """
+        exam_id = self.create_exam(exam)
+        template_id = None
+        if template is not None:
+            found = self.get_template(template)
+            if found is None:
+                raise ValueError(f"Unknown template: {template}")
+            template_id = found['id']
+
+        with self._lock, self._conn:
+            # Pick the next version in the same statement so concurrent writers cannot collide
+            cursor = self._conn.execute(
+                "INSERT INTO answer_keys (exam_id, version, template_id, answers) "
+                "SELECT ?, COALESCE(MAX(version), 0) + 1, ?, ? FROM answer_keys WHERE exam_id = ?",
+                (exam_id, template_id, key, exam_id))
+            return self._conn.execute("SELECT version FROM answer_keys WHERE id = ?",
+                                      (cursor.lastrowid,)).fetchone()[0]
+
+    def get_answer_key(self, exam: str, version: Optional[int] = None) -> Optional[Tuple[int, str]]:
+        """Get an exam's answer key.
+
+        Args:
+            exam: Exam name
+            version: Key version, or None for the latest
+
+        Returns:
+            Tuple of (version, key string) or None if the exam has no key
+        """
+        query = ("SELECT k.version, k.answers FROM answer_keys k JOIN exams e ON e.id = k.exam_id "
+                 "WHERE e.name = ?")
+        params: Tuple = (exam,)
+        if version is not None:
+            query += " AND k.version = ?"
+            params += (version,)
+        with self._lock:
+            row = self._conn.execute(query + " ORDER BY k.version DESC LIMIT 1", params).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def add_results(self, exam: str, results: Iterable[Dict[str, Any]],
+                    key_version: Optional[int] = None) -> int:
+        """Store graded sheets and their per-question answers in one transaction.
+
+        Each result is a dictionary with `sheet` and `status`, plus `error`,
+        `student_id`, `grade` (from grader.grade_answers) and
+        `student_answers` when available.
+
+        Args:
+            exam: Exam name (created if it does not exist)
+            results: Graded sheet results
+            key_version: Version of the answer key used for grading
+
+        Returns:
+            Number of sheets stored
+        """
+        exam_id = self.create_exam(exam)
+        count = 0
+        with self._lock, self._conn:
+            key_id = None
+            if key_version is not None:
+                row = self._conn.execute(
+                    "SELECT id FROM answer_keys WHERE exam_id = ? AND version = ?",
+                    (exam_id, key_version)).fetchone()
+                key_id = row[0] if row else None
+
+            answer_rows = []
+            for result in results:
+                grade = result.get('grade') or {}
+                cursor = self._conn.execute(
+                    "INSERT INTO sheets (exam_id, key_id, source, student_id, status, error, "
+                    "score, correct, incorrect, unanswered) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (exam_id, key_id, result['sheet'], result.get('student_id'), result['status'],
+                     result.get('error'), grade.get('score_percentage'), grade.get('correct_answers'),
+                     grade.get('incorrect_answers'), grade.get('unanswered')))
+                sheet_id = cursor.lastrowid
+                answer_rows.extend((sheet_id, question, answer) for question, answer
+                                   in enumerate(result.get('student_answers') or [], start=1))
+                count += 1
+            self._conn.executemany(
+                "INSERT INTO sheet_answers (sheet_id, question, answer) VALUES (?, ?, ?)", answer_rows)
+        return count
+
+    def get_results(self, exam: str) -> List[Dict[str, Any]]:
+        """Get every graded sheet of an exam.
+
+        Args:
+            exam: Exam name
+
+        Returns:
+            List of sheet dictionaries ordered by sheet id
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.* FROM sheets s JOIN exams e ON e.id = s.exam_id WHERE e.name = ? ORDER BY s.id",
+                (exam,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_student_results(self, exam: str, student_id: str) -> List[Dict[str, Any]]:
+        """Get the graded sheets of one student in an exam.
+
+        Args:
+            exam: Exam name
+            student_id: Student identifier
+
+        Returns:
+            List of sheet dictionaries ordered by sheet id
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.* FROM sheets s JOIN exams e ON e.id = s.exam_id "
+                "WHERE e.name = ? AND s.student_id = ? ORDER BY s.id", (exam, student_id)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_sheet_answers(self, sheet_id: int) -> List[int]:
+        """Get the detected answers of a graded sheet.
+
+        Args:
+            sheet_id: Sheet id
+
+        Returns:
+            List of answers (0-4 for A-E, -1 for unmarked) in question order
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT answer FROM sheet_answers WHERE sheet_id = ? ORDER BY question",
+                (sheet_id,)).fetchall()
+        return [row[0] for row in rows]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage answer keys in the exam database")
+    parser.add_argument("db", help="exam database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_csv = commands.add_parser("import-csv", help="store a correct_answers.csv file as a new key version")
+    import_csv.add_argument("exam", help="exam name (created if it does not exist)")
+    import_csv.add_argument("csv", nargs="?", default="correct_answers.csv", help="answer CSV to import")
+
+    set_key = commands.add_parser("set-key", help="store an answer key string as a new key version")
+    set_key.add_argument("exam", help="exam name (created if it does not exist)")
+    set_key.add_argument("key", help="answer key, e.g. ABCDEABCDE, with - for questions without an answer")
+
+    commands.add_parser("list", help="list exams with their latest key")
+    args = parser.parse_args()
+
+    from .answer_manager import AnswerManager
+
+    with ExamStore(args.db) as store:
+        if args.command == "list":
+            for exam in store.list_exams():
+                found = store.get_answer_key(exam)
+                print(f"{exam}: " + (f"v{found[0]} {found[1]}" if found else "no key"))
+            return
+
+        manager = AnswerManager()
+        if args.command == "import-csv":
+            manager.csv_file = args.csv
+            if not manager.load_from_csv():
+                parser.error(f"{args.csv} does not exist")
+        else:
+            try:
+                manager.set_answer_key(args.key)
+            except ValueError as e:
+                parser.error(str(e))
+        if not manager.get_question_count():
+            parser.error("The answer key is empty")
+        version = manager.save_to_store(store, args.exam)
+        print(f"Saved a {manager.get_question_count()}-question key as {args.exam} version {version}")
+
+if __name__ == "__main__":
+    main()
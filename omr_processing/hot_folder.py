@@ -0,0 +1,338 @@
+"""Hot-folder daemon that grades scans as soon as they land in a directory.
+
+Scanners write into a watched folder.  A file is only picked up once its
+size and modification time stop changing for `settle` seconds, so
+half-written files are never read.  Settled files are graded on a small
+worker pool; every sheet gets a row in the results CSV, and the file is
+moved to `processed/` (or `failed/` if any page could not be graded).
+Multi-page scans are read a few pages ahead of the workers, so a long PDF
+or TIFF is never held in memory whole.
+
+On Linux the folder is watched with inotify so new files are noticed
+immediately.  The folder is also rescanned every `poll_interval` seconds,
+which is the only mechanism on other platforms and catches files written
+by other machines to a network share, where inotify sees nothing.
+
+Usage:
+    python -m omr_processing.hot_folder incoming/ --out results.csv --key ABCDEABCDE
+"""
+import argparse
+import csv
+import ctypes
+import ctypes.util
+import os
+import select
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from . import batch, ingest
+from .answer_manager import AnswerManager, parse_answer_key
+from .duplicate_index import DuplicateIndex
+from .exam_store import ExamStore
+
+# inotify constants from <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+# Pages submitted but not yet graded, per worker
+PAGES_PER_WORKER = 2
+
+class _Inotify:
+    """Minimal inotify binding that only reports that something changed."""
+
+    def __init__(self, path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"Cannot watch {path}")
+
+    def wait(self, timeout: float) -> bool:
+        """Block until the folder changes or the timeout expires.
+
+        Returns:
+            True if any event arrived
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        # The folder is rescanned anyway, so the events themselves are discarded
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+def _open_watch(path: str) -> Optional[_Inotify]:
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        return _Inotify(path)
+    except (OSError, AttributeError):
+        return None
+
+def _move_aside(path: str, folder: str) -> str:
+    os.makedirs(folder, exist_ok=True)
+    target = os.path.join(folder, os.path.basename(path))
+    if os.path.exists(target):
+        stem, ext = os.path.splitext(os.path.basename(path))
+        target = os.path.join(folder, f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}{ext}")
+    shutil.move(path, target)
+    return target
+
+class HotFolder:
+    """Watches a folder and grades every settled scan that appears in it."""
+
+    def __init__(self, folder: str, correct_answers: List[int], output_path: str,
+                 workers: int = 2, settle: float = 2.0, poll_interval: float = 1.0,
+                 processed_dir: Optional[str] = None, failed_dir: Optional[str] = None,
+                 sinks: Optional[List[batch.ResultSink]] = None,
+                 detect_options: Optional[Dict[str, Any]] = None, use_inotify: bool = True,
+                 screen: bool = True):
+        """Initialize the watcher.
+
+        Args:
+            folder: Directory the scanners write into
+            correct_answers: List of correct answers (0-4 for A-E)
+            output_path: CSV file that receives one row per sheet (appended to)
+            workers: Number of worker processes
+            settle: Seconds a file's size and mtime must stay unchanged
+            poll_interval: Seconds between folder rescans
+            processed_dir: Where graded files go (default: folder/processed)
+            failed_dir: Where files with errors go (default: folder/failed)
+            sinks: Extra outputs (e.g. batch.StoreSink), flushed after every file
+            detect_options: Keyword arguments for bubble_detector.analyze_answer_sheet
+            use_inotify: Use inotify when available instead of only polling
+            screen: Screen out blank, text and outline-less pages (see page_classifier)
+        """
+        if not correct_answers:
+            raise ValueError("No correct answers set")
+        self.folder = folder
+        self.correct_answers = correct_answers
+        self.output_path = output_path
+        self.workers = workers
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.processed_dir = processed_dir or os.path.join(folder, 'processed')
+        self.failed_dir = failed_dir or os.path.join(folder, 'failed')
+        self.sinks = sinks or []
+        self.detect_options = detect_options
+        self.use_inotify = use_inotify
+        self.screen = screen
+        self.stop_event = threading.Event()
+
+        # path -> (size, mtime_ns, time the stat last changed)
+        self._seen: Dict[str, Tuple[int, int, float]] = {}
+        # path -> futures of the file's sheets, in page order
+        self._active: Dict[str, List[Future]] = {}
+        # path -> pages not submitted yet, for files still being read
+        self._pages: Dict[str, Iterator[Tuple[str, Union[bytes, np.ndarray]]]] = {}
+        # path -> (size, mtime_ns) of graded files that could not be moved away;
+        # skipped until the file changes so they are not graded on every rescan
+        self._unmovable: Dict[str, Tuple[int, int]] = {}
+
+    def stop(self) -> None:
+        """Ask run() to finish the files in progress and return."""
+        self.stop_event.set()
+
+    def _settled_files(self) -> List[str]:
+        now = time.monotonic()
+        present = set()
+        ready = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.startswith('.') or not ingest.is_supported(entry.name):
+                    continue
+                path = entry.path
+                present.add(path)
+                if path in self._active:
+                    continue
+                stat = entry.stat()
+                if path in self._unmovable:
+                    if self._unmovable[path] == (stat.st_size, stat.st_mtime_ns):
+                        continue
+                    del self._unmovable[path]
+                previous = self._seen.get(path)
+                if previous is None or previous[:2] != (stat.st_size, stat.st_mtime_ns):
+                    self._seen[path] = (stat.st_size, stat.st_mtime_ns, now)
+                elif stat.st_size > 0 and now - previous[2] >= self.settle:
+                    ready.append(path)
+        for path in list(self._seen):
+            if path not in present:
+                del self._seen[path]
+        for path in list(self._unmovable):
+            if path not in present:
+                del self._unmovable[path]
+        return sorted(ready)
+
+    def _pending(self) -> int:
+        return sum(1 for futures in self._active.values() for future in futures if not future.done())
+
+    def _top_up(self, executor: ProcessPoolExecutor) -> None:
+        """Submit pages, oldest file first, until the window is full."""
+        room = self.workers * PAGES_PER_WORKER - self._pending()
+        for path, pages in list(self._pages.items()):
+            while room > 0:
+                job = next(pages, None)
+                if job is None:
+                    del self._pages[path]
+                    break
+                sheet_id, payload = job
+                self._active[path].append(executor.submit(
+                    batch.grade_job, sheet_id, payload, self.correct_answers, None, self.detect_options,
+                    self.screen))
+                room -= 1
+            if room <= 0:
+                break
+
+    def _submit(self, executor: ProcessPoolExecutor, path: str) -> None:
+        self._active[path] = []
+        self._pages[path] = batch.iter_jobs([path])
+        self._top_up(executor)
+
+    def _finish(self, writer: csv.DictWriter, output) -> int:
+        finished = 0
+        for path, futures in list(self._active.items()):
+            if path in self._pages or not all(future.done() for future in futures):
+                continue
+            ok = True
+            for future in futures:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'sheet': path, 'status': 'error', 'error': f"Worker failure: {e}",
+                              'worker_ms': 0.0}
+                # Screened-out pages such as blank backs are expected, not failures
+                ok = ok and result['status'] != 'error'
+                for sink in self.sinks:
+                    sink.write(result, None)
+                writer.writerow(batch.format_row(result))
+            output.flush()
+            for sink in self.sinks:
+                sink.flush()
+
+            try:
+                target = _move_aside(path, self.processed_dir if ok and futures else self.failed_dir)
+                print(f"{'Graded' if ok else 'Failed'} {path} ({len(futures)} sheets) -> {target}")
+            except OSError as e:
+                print(f"Could not move {path}: {e}; skipping it until it changes")
+                previous = self._seen.get(path)
+                if previous is not None:
+                    self._unmovable[path] = previous[:2]
+            del self._active[path]
+            self._seen.pop(path, None)
+            finished += 1
+        return finished
+
+    def run(self) -> None:
+        """Watch the folder until stop() is called or the process is interrupted."""
+        os.makedirs(self.folder, exist_ok=True)
+        watch = _open_watch(self.folder) if self.use_inotify else None
+        new_file = not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0
+        print(f"Watching {self.folder} ({'inotify' if watch else 'polling'}, {self.workers} workers)")
+
+        try:
+            with open(self.output_path, 'a', newline='') as output, \
+                    ProcessPoolExecutor(max_workers=self.workers, initializer=batch._init_worker) as executor:
+                writer = csv.DictWriter(output, fieldnames=batch.RESULT_FIELDS, extrasaction='ignore')
+                if new_file:
+                    writer.writeheader()
+                while not self.stop_event.is_set():
+                    self._top_up(executor)
+                    for path in self._settled_files():
+                        # A file still has unread pages only while the window is full
+                        if self._pages:
+                            break
+                        self._submit(executor, path)
+                    self._finish(writer, output)
+
+                    # Wake up early for new files and while results are pending
+                    timeout = 0.05 if self._active else self.poll_interval
+                    if watch is not None:
+                        watch.wait(min(timeout, self.settle))
+                    else:
+                        self.stop_event.wait(timeout)
+
+                while self._active:
+                    self._top_up(executor)
+                    self._finish(writer, output)
+                    time.sleep(0.05)
+        finally:
+            for sink in self.sinks:
+                sink.close()
+            if watch is not None:
+                watch.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Grade scans as they arrive in a folder")
+    parser.add_argument("folder", help="directory the scanners write into")
+    parser.add_argument("--out", default="results.csv", help="CSV file to append results to")
+    parser.add_argument("--key", help="answer key, e.g. ABCDEABCDE (default: correct_answers.csv)")
+    parser.add_argument("--db", help="exam database to read the key from and store results in")
+    parser.add_argument("--exam", help="exam name in the database")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="seconds a file must stay unchanged before it is read")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between rescans")
+    parser.add_argument("--poll", action="store_true", help="never use inotify")
+    parser.add_argument("--no-screen", action="store_true",
+                        help="grade every page, without screening out blank, text and outline-less pages")
+    parser.add_argument("--boxes", action="store_true",
+                        help="score whole answer boxes instead of the bubble interiors (less accurate)")
+    parser.add_argument("--duplicates", metavar="INDEX",
+                        help="flag rescanned sheets, keeping the hash index in this file")
+    args = parser.parse_args()
+
+    if bool(args.db) != bool(args.exam):
+        parser.error("--db and --exam must be used together")
+
+    store = ExamStore(args.db) if args.db else None
+    key_version = None
+    manager = AnswerManager()
+    if args.key:
+        correct_answers = parse_answer_key(args.key)
+    elif store is not None:
+        key_version = manager.load_from_store(store, args.exam)
+        if key_version is None:
+            parser.error(f"Exam {args.exam!r} has no answer key in {args.db}")
+        correct_answers = manager.get_grading_list()
+    else:
+        manager.load_from_csv()
+        correct_answers = manager.get_grading_list()
+    if not correct_answers:
+        parser.error("No correct answers set")
+
+    sinks: List[batch.ResultSink] = []
+    if args.duplicates:
+        sinks.append(batch.DuplicateSink(DuplicateIndex(path=args.duplicates)))
+    if store is not None:
+        sinks.append(batch.StoreSink(store, args.exam, key_version))
+    folder = HotFolder(args.folder, correct_answers, args.out, args.workers, args.settle,
+                       args.poll_interval, sinks=sinks,
+                       detect_options={'use_masks': False} if args.boxes else None,
+                       use_inotify=not args.poll, screen=not args.no_screen)
+    try:
+        folder.run()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,226 @@
+import contextlib
+import io
+import struct
 import cv2
 import numpy as np
-from typing import List, Tuple, Optional
+from typing import BinaryIO, Iterator, List, Tuple, Optional, Union
+
+# imread flags for each supported reduced decode scale
+_GRAYSCALE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+class ProcessingContext:
+    """Reusable OpenCV objects and destination buffers for one worker.
+
+    Passing a context to the processing functions makes them write into these
+    preallocated buffers instead of allocating new arrays for every sheet.
+    Images returned while using a context are views of its buffers and are
+    overwritten by the next sheet processed with the same context, so a
+    context must not be shared between threads.
+    """
+
+    def __init__(self, width: int = 600, height: int = 700):
+        """Allocate the buffers for one working resolution.
+
+        Args:
+            width: Width of the processed image
+            height: Height of the processed image
+        """
+        self.width = width
+        self.height = height
+        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+
+        color_shape = (height, width, 3)
+        gray_shape = (height, width)
+        # Localisation pass
+        self.resized = np.empty(color_shape, dtype=np.uint8)
+        self.gray = np.empty(gray_shape, dtype=np.uint8)
+        self.blur = np.empty(gray_shape, dtype=np.uint8)
+        self.canny = np.empty(gray_shape, dtype=np.uint8)
+        # Warp and threshold pass
+        self.warped = np.empty(color_shape, dtype=np.uint8)
+        self.warped_gray = np.empty(gray_shape, dtype=np.uint8)
+        self.enhanced = np.empty(gray_shape, dtype=np.uint8)
+        self.threshold_blur = np.empty(gray_shape, dtype=np.uint8)
+        self.threshold = np.empty(gray_shape, dtype=np.uint8)
+
+    @contextlib.contextmanager
+    def outputs(self, warped: np.ndarray, threshold: np.ndarray) -> Iterator['ProcessingContext']:
+        """Temporarily direct the warped and thresholded images into other buffers.
+
+        Args:
+            warped: Buffer that receives the warped image
+            threshold: Buffer that receives the thresholded image
+        """
+        saved = self.warped, self.threshold
+        self.warped, self.threshold = warped, threshold
+        try:
+            yield self
+        finally:
+            self.warped, self.threshold = saved
+
+def _read_jpeg_size(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+
+        marker = byte[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue  # Standalone markers carry no length field
+        segment = f.read(2)
+        if len(segment) < 2:
+            return None
+        length = struct.unpack('>H', segment)[0]
+
+        # Start-of-frame markers hold the image dimensions
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            frame = f.read(5)
+            if len(frame) < 5:
+                return None
+            _, height, width = struct.unpack('>BHH', frame)
+            return width, height
+        f.seek(length - 2, io.SEEK_CUR)
+
+def read_image_size(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    """Read the pixel dimensions of a JPEG or PNG from its header only.
+    
+    Args:
+        f: Binary file object positioned at the start of the image
+        
+    Returns:
+        Tuple of (width, height) or None if the format is not recognised
+    """
+    signature = f.read(8)
+    if signature[:2] == b'\xff\xd8':
+        f.seek(-6, io.SEEK_CUR)
+        return _read_jpeg_size(f)
+    if signature == b'\x89PNG\r\n\x1a\n':
+        header = f.read(16)
+        if len(header) < 16 or header[4:8] != b'IHDR':
+            return None
+        return struct.unpack('>II', header[8:16])
+    return None
+
+def choose_reduced_scale(size: Optional[Tuple[int, int]], width: int = 600, height: int = 700) -> int:
+    """Pick the largest decode reduction that still covers the working resolution.
+    
+    Args:
+        size: Tuple of (width, height) of the encoded image, or None if unknown
+        width: Width of the processed image
+        height: Height of the processed image
+        
+    Returns:
+        Reduction factor (1, 2, 4 or 8)
+    """
+    if size is None:
+        return 1
+    # Compare short side with short side so EXIF rotation does not matter
+    image_short, image_long = sorted(size)
+    target_short, target_long = sorted((width, height))
+    for scale in (8, 4, 2):
+        if image_short // scale >= target_short and image_long // scale >= target_long:
+            return scale
+    return 1
+
+def reduced_decode_scale(source: Union[str, bytes], width: int = 600, height: int = 700) -> int:
+    """Return the reduction a decoder can apply to an encoded image.
+
+    Only JPEG decoders skip work at reduced scale; other formats are fully
+    decoded and then shrunk, so they report 1.
+
+    Args:
+        source: Path to the image file or encoded image bytes
+        width: Width of the processed image
+        height: Height of the processed image
+
+    Returns:
+        Reduction factor (1, 2, 4 or 8)
+    """
+    try:
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                head = f.read(2)
+                f.seek(0)
+                size = read_image_size(f) if head == b'\xff\xd8' else None
+        else:
+            size = read_image_size(io.BytesIO(source)) if source[:2] == b'\xff\xd8' else None
+    except OSError:
+        return 1
+    return choose_reduced_scale(size, width, height)
+
+def read_image_reduced(image_path: str, width: int = 600, height: int = 700,
+                       grayscale: bool = False, dst: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+    """Decode an image file at the smallest scale that covers the working resolution.
+    
+    JPEG files are decoded directly at 1/2, 1/4 or 1/8 scale, which is several
+    times faster and needs a fraction of the memory of a full decode.
+    
+    Args:
+        image_path: Path to the image file
+        width: Width of the processed image
+        height: Height of the processed image
+        grayscale: Decode a single-channel image instead of BGR
+        dst: Optional buffer that receives the resized image
+        
+    Returns:
+        Decoded image resized to (width, height) or None if loading fails
+    """
+    try:
+        with open(image_path, 'rb') as f:
+            size = read_image_size(f)
+    except OSError:
+        return None
+    flags = _GRAYSCALE_FLAGS if grayscale else _COLOR_FLAGS
+    img = cv2.imread(image_path, flags[choose_reduced_scale(size, width, height)])
+    if img is None:
+        return None
+    return cv2.resize(img, (width, height), dst=dst)
+
+def decode_image_reduced(data: bytes, width: int = 600, height: int = 700,
+                         grayscale: bool = False, dst: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+    """Decode an in-memory image at the smallest scale that covers the working resolution.
+    
+    Args:
+        data: Encoded image bytes
+        width: Width of the processed image
+        height: Height of the processed image
+        grayscale: Decode a single-channel image instead of BGR
+        dst: Optional buffer that receives the resized image
+        
+    Returns:
+        Decoded image resized to (width, height) or None if decoding fails
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size == 0:
+        return None
+    size = read_image_size(io.BytesIO(data))
+    flags = _GRAYSCALE_FLAGS if grayscale else _COLOR_FLAGS
+    img = cv2.imdecode(buf, flags[choose_reduced_scale(size, width, height)])
+    if img is None:
+        return None
+    return cv2.resize(img, (width, height), dst=dst)
 
 def load_and_preprocess_image(image_path: str, width: int = 600, height: int = 700) -> Optional[np.ndarray]:
     """Load and preprocess the image for OMR processing.
     
+    Only the reduced-scale grayscale image is decoded, which is all the edge
+    and contour search needs.
+    
     Args:
         image_path: Path to the image file
         width: Desired width of the processed image
@@ -13,17 +229,18 @@ def load_and_preprocess_image(image_path: str, width: int = 600, height: int = 7
     Returns:
         Preprocessed image or None if loading fails
     """
-    img = cv2.imread(image_path)
-    if img is None:
+    img_gray = read_image_reduced(image_path, width, height, grayscale=True)
+    if img_gray is None:
         return None
     
-    img = cv2.resize(img, (width, height))
-    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     img_blur = cv2.GaussianBlur(img_gray, (5, 5), 1)
     img_canny = cv2.Canny(img_blur, 10, 50)
     return img_canny
 
-def find_rectangle_contours(img: np.ndarray, min_area: float = 1000) -> List[np.ndarray]:
+# Smallest contour area, in pixels of the processed image, taken for a sheet outline
+MIN_SHEET_AREA = 1000
+
+def find_rectangle_contours(img: np.ndarray, min_area: float = MIN_SHEET_AREA) -> List[np.ndarray]:
     """Find and sort rectangular contours in the image.
     
     Args:
@@ -83,7 +300,8 @@ def reorder_points(points: np.ndarray) -> np.ndarray:
     return new_points
     
 
-def apply_perspective_transform(img: np.ndarray, points: np.ndarray, width: int, height: int) -> np.ndarray:
+def apply_perspective_transform(img: np.ndarray, points: np.ndarray, width: int, height: int,
+                                dst: Optional[np.ndarray] = None) -> np.ndarray:
     """Apply perspective transform to get a top-down view of the OMR sheet.
     
     Args:
@@ -91,6 +309,7 @@ def apply_perspective_transform(img: np.ndarray, points: np.ndarray, width: int,
         points: Corner points for perspective transform
         width: Output image width
         height: Output image height
+        dst: Optional buffer that receives the transformed image
         
     Returns:
         Transformed image
@@ -103,31 +322,133 @@ def apply_perspective_transform(img: np.ndarray, points: np.ndarray, width: int,
     [width, height]   # Bottom-right
     ])
     matrix = cv2.getPerspectiveTransform(pts1, pts2)
-    return cv2.warpPerspective(img, matrix, (width, height))
+    return cv2.warpPerspective(img, matrix, (width, height), dst=dst)
 
-def threshold_image(img: np.ndarray) -> np.ndarray:
+def detect_rotation(warped: np.ndarray, marker_size: float = 0.05,
+                    min_fill: float = 0.3, margin: float = 2.0) -> int:
+    """Find which corner of a warped sheet holds the orientation marker.
+
+    The sheet carries a solid dark square in its top-left corner.  Only the
+    four small corner regions are sampled, so the check costs next to
+    nothing; sheets without a clear marker are left as they are.
+
+    Args:
+        warped: Warped sheet image (BGR or grayscale)
+        marker_size: Side of the sampled corner region as a fraction of the sheet width
+        min_fill: Minimum share of dark pixels for a corner to hold the marker
+        margin: How many times darker the marker corner must be than any other
+
+    Returns:
+        Number of 90 degree clockwise turns the sheet is rotated by (0-3)
+    """
+    h, w = warped.shape[:2]
+    size = max(2, int(w * marker_size))
+    # Clockwise from top-left, so the index of the marker corner is the rotation
+    corners = [warped[:size, :size], warped[:size, w - size:],
+               warped[h - size:, w - size:], warped[h - size:, :size]]
+    fill = [np.count_nonzero(corner < 128) / corner.size for corner in corners]
+    best = int(np.argmax(fill))
+    others = max(f for i, f in enumerate(fill) if i != best)
+    if fill[best] < min_fill or fill[best] < others * margin:
+        return 0
+    return best
+
+def rotate_points(points: np.ndarray, turns: int) -> np.ndarray:
+    """Relabel ordered sheet corners so the sheet is turned back upright.
+
+    Args:
+        points: Corners ordered as returned by reorder_points
+        turns: Clockwise quarter turns reported by detect_rotation
+
+    Returns:
+        Corners in reorder_points order for the upright sheet
+    """
+    clockwise = points[[0, 1, 3, 2]]
+    return np.roll(clockwise, -turns, axis=0)[[0, 1, 3, 2]]
+
+def correct_rotation(img: np.ndarray, points: np.ndarray, warped: np.ndarray,
+                     width: int, height: int) -> Tuple[np.ndarray, int]:
+    """Turn a warped sheet upright in place if it was fed rotated.
+
+    A sheet upside down is flipped inside the warped buffer.  A sheet
+    scanned sideways was stretched by the warp, so it is warped again from
+    the source image, with relabelled corners, into the same buffer.
+
+    Args:
+        img: Source image the sheet was warped from
+        points: Corners used for the warp, ordered as returned by reorder_points
+        warped: Warped sheet image; overwritten when the sheet is rotated
+        width: Width of the warped image
+        height: Height of the warped image
+
+    Returns:
+        Tuple of (corners of the upright sheet, clockwise quarter turns corrected)
+    """
+    turns = detect_rotation(warped)
+    if turns == 2:
+        cv2.flip(warped, -1, dst=warped)
+    if turns:
+        points = rotate_points(points, turns)
+    if turns in (1, 3):
+        apply_perspective_transform(img, points, width, height, dst=warped)
+    return points, turns
+
+def threshold_image(img: np.ndarray, ctx: Optional[ProcessingContext] = None,
+                    block_size: int = 11, c: float = 2) -> np.ndarray:
     """Apply adaptive thresholding to the image for better bubble detection.
     
     Args:
-        img: Input image
+        img: Input BGR or grayscale image
+        ctx: Optional processing context providing the CLAHE object and buffers
+        block_size: Neighbourhood size of the adaptive threshold (odd)
+        c: Constant subtracted from the neighbourhood mean
         
     Returns:
         Thresholded image
     """
-    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if ctx is None:
+        ctx_gray = ctx_enhanced = ctx_blur = ctx_thresh = None
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    else:
+        ctx_gray, ctx_enhanced = ctx.warped_gray, ctx.enhanced
+        ctx_blur, ctx_thresh = ctx.threshold_blur, ctx.threshold
+        clahe = ctx.clahe
+
+    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=ctx_gray) if img.ndim == 3 else img
     # Apply contrast enhancement
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    img_enhanced = clahe.apply(img_gray)
+    img_enhanced = clahe.apply(img_gray, dst=ctx_enhanced)
     # Apply Gaussian blur to reduce noise
-    img_blur = cv2.GaussianBlur(img_enhanced, (3, 3), 0)
+    img_blur = cv2.GaussianBlur(img_enhanced, (3, 3), 0, dst=ctx_blur)
     # Apply adaptive thresholding
-    img_thresh = cv2.adaptiveThreshold(img_blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2)
+    img_thresh = cv2.adaptiveThreshold(img_blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV,
+                                       block_size, c, dst=ctx_thresh)
     return img_thresh
 
 
-def load_and_preprocess_image_from_array(img: np.ndarray, width: int = 600, height: int = 700) -> Optional[np.ndarray]:
-    img = cv2.resize(img, (width, height))
-    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    img_blur = cv2.GaussianBlur(img_gray, (5, 5), 1)
-    img_canny = cv2.Canny(img_blur, 10, 50)
+def load_and_preprocess_image_from_array(img: np.ndarray, width: int = 600, height: int = 700,
+                                         ctx: Optional[ProcessingContext] = None) -> Optional[np.ndarray]:
+    if ctx is None:
+        ctx_resized = ctx_gray = ctx_blur = ctx_canny = None
+    else:
+        ctx_resized, ctx_gray, ctx_blur, ctx_canny = ctx.resized, ctx.gray, ctx.blur, ctx.canny
+
+    if img.shape[:2] != (height, width):
+        img = cv2.resize(img, (width, height), dst=ctx_resized if img.ndim == 3 else ctx_gray)
+    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=ctx_gray) if img.ndim == 3 else img
+    img_blur = cv2.GaussianBlur(img_gray, (5, 5), 1, dst=ctx_blur)
+    img_canny = cv2.Canny(img_blur, 10, 50, edges=ctx_canny)
     return img_canny
+
+def load_image_from_bytes(data: bytes) -> Optional[np.ndarray]:
+    """Decode an encoded image (JPG, PNG, ...) held in memory.
+    
+    Args:
+        data: Encoded image bytes
+        
+    Returns:
+        Decoded BGR image or None if decoding fails
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size == 0:
+        return None
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
@@ -0,0 +1,234 @@
+"""Streaming ingestion of single- and multi-page scan files.
+
+Scanners deliver whole stacks as one multi-page TIFF or PDF.  Pages are
+decoded one at a time and handed to the grading pipeline through a small
+bounded queue, so a 300-page file never sits fully decoded in memory and
+grading starts while later pages are still being read.
+
+Usage:
+    python -m omr_processing.ingest stack.tiff --key ABCDEABCDE
+"""
+import argparse
+import os
+import queue
+import threading
+import cv2
+import numpy as np
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+SINGLE_PAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+PDF_EXTENSIONS = ('.pdf',)
+
+# TIFF pages decoded per imreadmulti call.  Every call reopens the file and
+# walks the page directory from the start, so reading page by page is
+# quadratic in the page count; larger chunks trade memory for fewer walks.
+TIFF_CHUNK_PAGES = 8
+SUPPORTED_EXTENSIONS = SINGLE_PAGE_EXTENSIONS + TIFF_EXTENSIONS + PDF_EXTENSIONS
+
+def is_supported(path: str) -> bool:
+    """Check whether a file has an extension the ingestion layer can read.
+
+    Args:
+        path: Path to the file
+
+    Returns:
+        True if the file can be ingested
+    """
+    return os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS
+
+def _open_pdf(path: str):
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        raise ImportError("Reading PDF files requires PyMuPDF: pip install pymupdf")
+    return fitz.open(path)
+
+def count_pages(path: str) -> int:
+    """Count the pages in a scan file without decoding them.
+
+    Args:
+        path: Path to the image, TIFF or PDF file
+
+    Returns:
+        Number of pages (1 for single-page images)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in TIFF_EXTENSIONS:
+        return cv2.imcount(path)
+    if ext in PDF_EXTENSIONS:
+        with _open_pdf(path) as doc:
+            return doc.page_count
+    return 1
+
+def iter_pages(path: str, dpi: int = 150) -> Iterator[Tuple[int, np.ndarray]]:
+    """Lazily decode the pages of a scan file one at a time.
+
+    Args:
+        path: Path to the image, TIFF or PDF file
+        dpi: Resolution used to rasterise PDF pages
+
+    Yields:
+        Tuples of (0-based page number, decoded BGR image)
+
+    Raises:
+        ValueError: If the file cannot be read
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in TIFF_EXTENSIONS:
+        total = cv2.imcount(path)
+        for start in range(0, total, TIFF_CHUNK_PAGES):
+            count = min(TIFF_CHUNK_PAGES, total - start)
+            ok, mats = cv2.imreadmulti(path, start, count, flags=cv2.IMREAD_COLOR)
+            if not ok or len(mats) != count:
+                raise ValueError(f"Could not read pages {start + 1}-{start + count} of {path}")
+            mats = list(mats)
+            for offset in range(count):
+                # Drop each page once handed out so only the rest of the chunk stays alive
+                img, mats[offset] = mats[offset], None
+                yield start + offset, img
+    elif ext in PDF_EXTENSIONS:
+        with _open_pdf(path) as doc:
+            for page in range(doc.page_count):
+                yield page, _render_pdf_page(doc[page], dpi)
+    else:
+        img = cv2.imread(path)
+        if img is None:
+            raise ValueError(f"Could not load image {path}")
+        yield 0, img
+
+def _render_pdf_page(pdf_page, dpi: int) -> np.ndarray:
+    pix = pdf_page.get_pixmap(dpi=dpi)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    codes = {1: cv2.COLOR_GRAY2BGR, 3: cv2.COLOR_RGB2BGR, 4: cv2.COLOR_RGBA2BGR}
+    return cv2.cvtColor(img, codes[pix.n])
+
+def read_page(path: str, page: int, dpi: int = 150) -> np.ndarray:
+    """Decode a single page of a scan file without touching the others.
+
+    Args:
+        path: Path to the image, TIFF or PDF file
+        page: 0-based page number
+        dpi: Resolution used to rasterise PDF pages
+
+    Returns:
+        Decoded BGR image
+
+    Raises:
+        ValueError: If the page cannot be read
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in TIFF_EXTENSIONS:
+        ok, mats = cv2.imreadmulti(path, page, 1, flags=cv2.IMREAD_COLOR)
+        if not ok or not mats:
+            raise ValueError(f"Could not read page {page + 1} of {path}")
+        return mats[0]
+    if ext in PDF_EXTENSIONS:
+        with _open_pdf(path) as doc:
+            if not 0 <= page < doc.page_count:
+                raise ValueError(f"Could not read page {page + 1} of {path}")
+            return _render_pdf_page(doc[page], dpi)
+    if page != 0:
+        raise ValueError(f"Could not read page {page + 1} of {path}")
+    img = cv2.imread(path)
+    if img is None:
+        raise ValueError(f"Could not load image {path}")
+    return img
+
+def prefetch(items: Iterable, depth: int = 2) -> Iterator:
+    """Produce items on a background thread, keeping at most `depth` ready.
+
+    Decoding releases the GIL inside OpenCV, so the next page is read while
+    the caller grades the current one.  The bounded queue is what keeps
+    memory flat: the reader blocks once `depth` pages are waiting.
+
+    Args:
+        items: Iterable to consume on the background thread
+        depth: Maximum number of items buffered ahead of the consumer
+
+    Yields:
+        The items of `items`, in order
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                while not stop.is_set():
+                    try:
+                        buffer.put((item, None), timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+            buffer.put((done, None))
+        except BaseException as e:
+            buffer.put((done, e))
+
+    reader = threading.Thread(target=produce, daemon=True)
+    reader.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+def grade_pages(path: str, correct_answers: List[int], depth: int = 2) -> Iterator[Dict[str, Any]]:
+    """Grade every page of a scan file as it is decoded.
+
+    Args:
+        path: Path to the image, TIFF or PDF file
+        correct_answers: List of correct answers (0-4 for A-E)
+        depth: Number of pages decoded ahead of grading
+
+    Yields:
+        Result dictionaries with the page number and either the grading
+        results or an error message
+    """
+    from . import pipeline
+    from .page_classifier import PageRejected
+
+    for page, img in prefetch(iter_pages(path), depth):
+        try:
+            result = pipeline.grade_sheet(img, correct_answers)
+            yield {
+                "page": page + 1,
+                "answers": result["student_answers"],
+                "grade": result["grade"],
+            }
+        except PageRejected as e:
+            yield {"page": page + 1, "error": str(e), "rejected": e.reason}
+        except Exception as e:
+            yield {"page": page + 1, "error": str(e)}
+
+def main() -> None:
+    from .answer_manager import AnswerManager, parse_answer_key
+
+    parser = argparse.ArgumentParser(description="Grade every page of a scan file")
+    parser.add_argument("path")
+    parser.add_argument("--key", help="answer key, e.g. ABCDEABCDE (default: correct_answers.csv)")
+    args = parser.parse_args()
+
+    if args.key:
+        correct_answers = parse_answer_key(args.key)
+    else:
+        manager = AnswerManager()
+        manager.load_from_csv()
+        correct_answers = manager.get_grading_list()
+
+    for result in grade_pages(args.path, correct_answers):
+        if "error" in result:
+            print(f"Page {result['page']}: error: {result['error']}")
+        else:
+            print(f"Page {result['page']}: {result['grade']['score_percentage']:.2f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,669 @@
+"""Durable job queue for grading sheets on several machines.
+
+A coordinator enqueues sheet jobs (file paths or embedded image bytes) in a
+SQLite queue and serves it over a small HTTP/JSON protocol.  Workers on
+any number of nodes claim jobs with time-limited leases, grade them and
+report the results back.  When a lease runs out because a worker died or
+lost its connection, the job goes to the next worker that asks, up to
+`max_attempts` times, so a lost node never loses work.
+
+Usage:
+    python -m omr_processing.job_queue enqueue jobs.db scans/ --key ABCDEABCDE
+    python -m omr_processing.job_queue serve jobs.db --host 0.0.0.0 --port 8090
+    python -m omr_processing.job_queue work --url http://coordinator:8090 --processes 4
+    python -m omr_processing.job_queue export jobs.db --out results.csv
+
+Workers on the coordinator's machine can also open the database directly
+with `work --db jobs.db`.  Path jobs need the scans at the same path on
+every worker (e.g. a network share); use `enqueue --embed` otherwise.
+"""
+import abc
+import argparse
+import base64
+import contextlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from .answer_manager import AnswerManager, parse_answer_key
+
+DEFAULT_PORT = 8090
+
+# Errors from a coordinator that is restarting or briefly unreachable
+TRANSIENT_ERRORS = (urllib.error.URLError, ConnectionError, TimeoutError)
+MAX_BACKOFF_SECONDS = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    sheet TEXT NOT NULL,
+    path TEXT,
+    page INTEGER NOT NULL DEFAULT 0,
+    blob BLOB,
+    answer_key TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until);
+"""
+
+class JobQueue(abc.ABC):
+    """Operations a grading worker needs from a queue backend.
+
+    Jobs are dictionaries with `id`, `sheet`, `path`, `page`, `blob`,
+    `answer_key` (list of correct answers) and `attempts`.
+    """
+
+    @abc.abstractmethod
+    def claim(self, worker: str, limit: int = 1, lease_seconds: float = 60.0) -> List[Dict[str, Any]]:
+        """Lease up to `limit` queued or expired jobs to a worker.
+
+        Args:
+            worker: Unique worker name
+            limit: Maximum number of jobs to lease
+            lease_seconds: How long the worker may hold the jobs
+
+        Returns:
+            List of leased jobs (empty when nothing is available)
+        """
+
+    @abc.abstractmethod
+    def complete(self, job_id: int, worker: str, result: Dict[str, Any]) -> bool:
+        """Store a job's result.
+
+        Returns:
+            False if the worker no longer holds the lease and the result was dropped
+        """
+
+    @abc.abstractmethod
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        """Give a job back after an error unrelated to the sheet itself.
+
+        The job is queued again until it runs out of attempts.
+
+        Returns:
+            False if the worker no longer holds the lease
+        """
+
+    @abc.abstractmethod
+    def renew(self, job_ids: List[int], worker: str, lease_seconds: float = 60.0) -> int:
+        """Extend the leases a worker still holds.
+
+        Returns:
+            Number of leases extended
+        """
+
+    @abc.abstractmethod
+    def pending(self) -> int:
+        """Count jobs that are queued or leased."""
+
+class SQLiteJobQueue(JobQueue):
+    """Job queue stored in a local SQLite database."""
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        """Open (and create if needed) the queue database.
+
+        Args:
+            path: Path to the SQLite database file
+            max_attempts: Leases a job gets before it is marked failed
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes can
+        # never select the same job before either marks it leased
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+
+    def enqueue(self, jobs: Iterable[Dict[str, Any]]) -> int:
+        """Add jobs in one transaction.
+
+        Args:
+            jobs: Dictionaries with `sheet`, `answer_key` and either `path`
+                (plus optional `page`) or `blob`
+
+        Returns:
+            Number of jobs added
+        """
+        rows = [(job['sheet'], job.get('path'), job.get('page', 0), job.get('blob'),
+                 json.dumps(job['answer_key'])) for job in jobs]
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT INTO jobs (sheet, path, page, blob, answer_key) VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def claim(self, worker: str, limit: int = 1, lease_seconds: float = 60.0) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Lease expired ' || attempts || ' times', "
+                "finished_at = ? WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts))
+            rows = self._conn.execute(
+                "SELECT id, sheet, path, page, blob, answer_key, attempts FROM jobs "
+                "WHERE status = 'queued' OR (status = 'leased' AND lease_until < ?) ORDER BY id LIMIT ?",
+                (now, limit)).fetchall()
+            self._conn.executemany(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE id = ?", [(worker, now + lease_seconds, row['id']) for row in rows])
+
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job['answer_key'] = json.loads(job['answer_key'])
+            job['attempts'] += 1
+            jobs.append(job)
+        return jobs
+
+    def complete(self, job_id: int, worker: str, result: Dict[str, Any]) -> bool:
+        with self._transaction():
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, lease_until = NULL, finished_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (json.dumps(result), time.time(), job_id, worker))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        with self._transaction():
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "error = ?, lease_until = NULL, finished_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (self.max_attempts, error, time.time(), job_id, worker))
+        return cursor.rowcount == 1
+
+    def renew(self, job_ids: List[int], worker: str, lease_seconds: float = 60.0) -> int:
+        until = time.time() + lease_seconds
+        with self._transaction():
+            cursor = self._conn.executemany(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                [(until, job_id, worker) for job_id in job_ids])
+        return cursor.rowcount
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'leased')").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Count jobs per status.
+
+        Returns:
+            Dictionary mapping status to job count
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def results(self) -> Iterator[Dict[str, Any]]:
+        """Yield the result of every finished job in enqueue order.
+
+        Jobs that ran out of attempts are reported as errors.
+
+        Yields:
+            Result dictionaries in the format of batch.grade_job
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sheet, status, result, error FROM jobs "
+                "WHERE status IN ('done', 'failed') ORDER BY id").fetchall()
+        for row in rows:
+            if row['status'] == 'done':
+                yield json.loads(row['result'])
+            else:
+                yield {'sheet': row['sheet'], 'status': 'error', 'error': row['error'], 'worker_ms': 0.0}
+
+class HTTPJobQueue(JobQueue):
+    """Client for a queue served by serve_queue on another machine."""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        """Initialize the client.
+
+        Args:
+            url: Base URL of the coordinator, e.g. http://host:8090
+            timeout: Seconds to wait for each request
+        """
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _call(self, endpoint: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(f"{self.url}/{endpoint}", data=data,
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def claim(self, worker: str, limit: int = 1, lease_seconds: float = 60.0) -> List[Dict[str, Any]]:
+        jobs = self._call('claim', {'worker': worker, 'limit': limit, 'lease_seconds': lease_seconds})['jobs']
+        for job in jobs:
+            if job['blob'] is not None:
+                job['blob'] = base64.b64decode(job['blob'])
+        return jobs
+
+    def complete(self, job_id: int, worker: str, result: Dict[str, Any]) -> bool:
+        return self._call('complete', {'id': job_id, 'worker': worker, 'result': result})['ok']
+
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        return self._call('fail', {'id': job_id, 'worker': worker, 'error': error})['ok']
+
+    def renew(self, job_ids: List[int], worker: str, lease_seconds: float = 60.0) -> int:
+        return self._call('renew', {'ids': job_ids, 'worker': worker, 'lease_seconds': lease_seconds})['renewed']
+
+    def pending(self) -> int:
+        return self._call('stats')['pending']
+
+class _QueueHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != '/stats':
+            self._reply(404, {'error': 'Not found'})
+            return
+        queue = self.server.queue
+        self._reply(200, {'pending': queue.pending(), 'jobs': queue.stats()})
+
+    def do_POST(self) -> None:
+        queue = self.server.queue
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if self.path == '/claim':
+                jobs = queue.claim(body['worker'], body.get('limit', 1), body.get('lease_seconds', 60.0))
+                for job in jobs:
+                    if job['blob'] is not None:
+                        job['blob'] = base64.b64encode(job['blob']).decode('ascii')
+                self._reply(200, {'jobs': jobs})
+            elif self.path == '/complete':
+                self._reply(200, {'ok': queue.complete(body['id'], body['worker'], body['result'])})
+            elif self.path == '/fail':
+                self._reply(200, {'ok': queue.fail(body['id'], body['worker'], body['error'])})
+            elif self.path == '/renew':
+                self._reply(200, {'renewed': queue.renew(body['ids'], body['worker'],
+                                                         body.get('lease_seconds', 60.0))})
+            else:
+                self._reply(404, {'error': 'Not found'})
+        except (KeyError, ValueError) as e:
+            self._reply(400, {'error': f"Bad request: {e}"})
+
+    def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+def serve_queue(queue: SQLiteJobQueue, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> None:
+    """Serve a queue to remote workers until interrupted.
+
+    Args:
+        queue: Queue to serve
+        host: Interface to bind
+        port: TCP port to listen on
+    """
+    server = ThreadingHTTPServer((host, port), _QueueHandler)
+    server.daemon_threads = True
+    server.queue = queue
+    print(f"Job queue listening on http://{host}:{port} ({queue.pending()} jobs pending)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def iter_sheet_jobs(inputs: Iterable[str], correct_answers: List[int],
+                    embed: bool = False) -> Iterator[Dict[str, Any]]:
+    """Build one job per sheet under the given files and directories.
+
+    Multi-page files get one job per page; only the page count is read.
+
+    Args:
+        inputs: File and directory paths
+        correct_answers: List of correct answers (0-4 for A-E)
+        embed: Store single-page images in the queue instead of their paths
+
+    Yields:
+        Job dictionaries for SQLiteJobQueue.enqueue
+    """
+    from . import batch, ingest
+
+    for path in batch.iter_input_files(inputs):
+        path = os.path.abspath(path)
+        if os.path.splitext(path)[1].lower() in ingest.SINGLE_PAGE_EXTENSIONS:
+            job = {'sheet': path, 'path': path, 'answer_key': correct_answers}
+            if embed:
+                with open(path, 'rb') as f:
+                    job['blob'] = f.read()
+            yield job
+        else:
+            for page in range(ingest.count_pages(path)):
+                yield {'sheet': f"{path}#{page + 1}", 'path': path, 'page': page,
+                       'answer_key': correct_answers}
+
+def grade_job(job: Dict[str, Any], ctx=None,
+              detect_options: Optional[Dict[str, Any]] = None, screen: bool = True) -> Dict[str, Any]:
+    """Grade one claimed job.
+
+    Every other failure, from a sheet without an outline to an OpenCV error,
+    becomes an error result so a poison job cannot take down worker after
+    worker.  OSError is raised so the job can be retried on a worker that
+    can read the file.
+
+    Args:
+        job: Job dictionary from JobQueue.claim
+        ctx: Optional image_utils.ProcessingContext
+        detect_options: Keyword arguments for bubble_detector.analyze_answer_sheet
+        screen: Screen out blank, text and outline-less pages (see page_classifier)
+
+    Returns:
+        Result dictionary in the format of batch.grade_job
+    """
+    from . import ingest, pipeline
+    from .page_classifier import PageRejected
+
+    start = time.perf_counter()
+    row = {'sheet': job['sheet']}
+    key = job['answer_key']
+    try:
+        if job['blob'] is not None:
+            result = pipeline.grade_bytes(job['blob'], key, ctx=ctx, detect_options=detect_options,
+                                          screen=screen)
+        elif os.path.splitext(job['path'])[1].lower() in ingest.SINGLE_PAGE_EXTENSIONS:
+            if not os.path.exists(job['path']):
+                raise FileNotFoundError(f"No such file: {job['path']}")
+            result = pipeline.grade_file(job['path'], key, ctx=ctx, detect_options=detect_options,
+                                         screen=screen)
+        else:
+            img = ingest.read_page(job['path'], job['page'])
+            result = pipeline.grade_sheet(img, key, ctx=ctx, detect_options=detect_options,
+                                          screen=screen)
+        row['status'] = 'graded'
+        row['student_answers'] = result['student_answers']
+        row['grade'] = result['grade']
+        row['rotation'] = result['rotation']
+        row['phash'] = result['phash']
+        row['timings'] = result['timings']
+    except PageRejected as e:
+        row['status'] = 'rejected'
+        row['error'] = str(e)
+        row['reason'] = e.reason
+    except OSError:
+        # Possibly a problem of this worker (unmounted share), so retry elsewhere
+        raise
+    except Exception as e:
+        # Anything else (cv2.error, MemoryError, ...) would fail on every worker
+        row['status'] = 'error'
+        row['error'] = str(e) or type(e).__name__
+    row['worker_ms'] = (time.perf_counter() - start) * 1000
+    return row
+
+class _LeaseKeeper:
+    """Renews a worker's leases in the background while it grades the jobs."""
+
+    def __init__(self, queue: JobQueue, worker: str, job_ids: List[int], lease_seconds: float):
+        self._held = set(job_ids)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(queue, worker, lease_seconds),
+                                        name='lease-keeper', daemon=True)
+
+    def __enter__(self) -> '_LeaseKeeper':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def release(self, job_id: int) -> None:
+        """Stop renewing a job once its result has been reported."""
+        with self._lock:
+            self._held.discard(job_id)
+
+    def _run(self, queue: JobQueue, worker: str, lease_seconds: float) -> None:
+        # Renew well before expiry so one failed renewal does not lose the lease
+        while not self._stop.wait(lease_seconds / 3):
+            with self._lock:
+                held = sorted(self._held)
+            if held:
+                try:
+                    queue.renew(held, worker, lease_seconds)
+                except TRANSIENT_ERRORS:
+                    pass
+
+def _with_retry(call: Callable[..., Any], *args, attempts: int = 5, delay: float = 1.0) -> Any:
+    """Call a queue operation, retrying transient errors with exponential backoff.
+
+    Args:
+        call: Queue method
+        *args: Arguments for the call
+        attempts: Total number of tries
+        delay: Seconds to wait before the first retry; doubled after each one
+
+    Returns:
+        Whatever the call returns
+
+    Raises:
+        The last transient error once every attempt failed
+    """
+    for attempt in range(attempts):
+        try:
+            return call(*args)
+        except TRANSIENT_ERRORS as e:
+            if attempt == attempts - 1:
+                raise
+            print(f"Queue unreachable ({e}); retrying in {delay:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_BACKOFF_SECONDS)
+
+def run_worker(queue: JobQueue, worker: Optional[str] = None, batch_size: int = 4,
+               lease_seconds: float = 60.0, poll_interval: float = 1.0, exit_when_idle: bool = False,
+               detect_options: Optional[Dict[str, Any]] = None, screen: bool = True) -> int:
+    """Claim and grade jobs until interrupted.
+
+    Leases are renewed in the background while the claimed jobs are graded.
+    When the queue cannot be reached the worker backs off exponentially, up
+    to MAX_BACKOFF_SECONDS, and keeps trying.  A result that still cannot be
+    reported after several retries is dropped; its lease then runs out and
+    another worker grades the sheet again.
+
+    Args:
+        queue: Queue backend to pull jobs from
+        worker: Unique worker name (default: host name and process id)
+        batch_size: Jobs claimed per round trip
+        lease_seconds: Lease length; must comfortably exceed one renewal
+            round trip (leases are renewed every third of it)
+        poll_interval: Seconds to wait when the queue is empty
+        exit_when_idle: Stop once no jobs are queued or leased
+        detect_options: Keyword arguments for bubble_detector.analyze_answer_sheet
+        screen: Screen out blank, text and outline-less pages (see page_classifier)
+
+    Returns:
+        Number of jobs completed
+    """
+    from . import image_utils, pipeline
+
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    ctx = image_utils.ProcessingContext()
+    pipeline.warm_up(ctx=ctx)
+
+    done = 0
+    backoff = poll_interval
+    while True:
+        try:
+            jobs = queue.claim(worker, batch_size, lease_seconds)
+            idle = not jobs and exit_when_idle and queue.pending() == 0
+        except TRANSIENT_ERRORS as e:
+            print(f"Worker {worker}: queue unreachable ({e}); retrying in {backoff:.0f}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+            continue
+        backoff = poll_interval
+        if idle:
+            return done
+        if not jobs:
+            time.sleep(poll_interval)
+            continue
+
+        with _LeaseKeeper(queue, worker, [job['id'] for job in jobs], lease_seconds) as keeper:
+            for job in jobs:
+                try:
+                    try:
+                        result = grade_job(job, ctx, detect_options, screen)
+                    except OSError as e:
+                        _with_retry(queue.fail, job['id'], worker, f"{worker}: {e}")
+                    else:
+                        result['worker'] = worker
+                        if _with_retry(queue.complete, job['id'], worker, result):
+                            done += 1
+                except TRANSIENT_ERRORS as e:
+                    print(f"Worker {worker}: could not report job {job['id']} ({e}); "
+                          f"it will be graded again")
+                keeper.release(job['id'])
+
+def _open_queue(db: Optional[str], url: Optional[str], max_attempts: int = 3) -> JobQueue:
+    return SQLiteJobQueue(db, max_attempts) if db else HTTPJobQueue(url)
+
+def _work(db: Optional[str], url: Optional[str], max_attempts: int, options: Dict[str, Any]) -> None:
+    try:
+        done = run_worker(_open_queue(db, url, max_attempts), **options)
+        print(f"Worker {os.getpid()} completed {done} jobs")
+    except KeyboardInterrupt:
+        pass
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Distributed OMR grading through a durable job queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="add sheets to the queue")
+    enqueue.add_argument("db", help="queue database")
+    enqueue.add_argument("inputs", nargs="+", help="image files, multi-page files or directories")
+    enqueue.add_argument("--key", help="answer key, e.g. ABCDEABCDE (default: correct_answers.csv)")
+    enqueue.add_argument("--embed", action="store_true", help="store image bytes instead of paths")
+
+    serve = commands.add_parser("serve", help="serve the queue to remote workers")
+    serve.add_argument("db", help="queue database")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--max-attempts", type=int, default=3)
+
+    work = commands.add_parser("work", help="grade jobs from a queue")
+    source = work.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", help="local queue database")
+    source.add_argument("--url", help="coordinator URL, e.g. http://host:8090")
+    work.add_argument("--processes", type=int, default=1)
+    work.add_argument("--batch-size", type=int, default=4)
+    work.add_argument("--lease", type=float, default=60.0, help="lease length in seconds")
+    work.add_argument("--exit-when-idle", action="store_true")
+    work.add_argument("--max-attempts", type=int,
+                      help="leases a job gets before it is marked failed (default: 3; "
+                           "only with --db, the coordinator decides for --url)")
+    work.add_argument("--no-screen", action="store_true",
+                      help="grade every page, without screening out blank, text and outline-less pages")
+    work.add_argument("--boxes", action="store_true",
+                      help="score whole answer boxes instead of the bubble interiors (less accurate)")
+
+    status = commands.add_parser("status", help="show job counts")
+    status.add_argument("db", help="queue database")
+
+    export = commands.add_parser("export", help="write finished results")
+    export.add_argument("db", help="queue database")
+    export.add_argument("--out", default="results.csv", help="CSV file to write")
+    export.add_argument("--store", help="exam database to also store the results in")
+    export.add_argument("--exam", help="exam name in the exam database")
+
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        if args.key:
+            correct_answers = parse_answer_key(args.key)
+        else:
+            manager = AnswerManager()
+            manager.load_from_csv()
+            correct_answers = manager.get_grading_list()
+        if not correct_answers:
+            parser.error("No correct answers set")
+        queue = SQLiteJobQueue(args.db)
+        count = queue.enqueue(iter_sheet_jobs(args.inputs, correct_answers, args.embed))
+        print(f"Enqueued {count} jobs ({queue.pending()} pending)")
+
+    elif args.command == "serve":
+        try:
+            serve_queue(SQLiteJobQueue(args.db, args.max_attempts), args.host, args.port)
+        except KeyboardInterrupt:
+            pass
+
+    elif args.command == "work":
+        if args.url and args.max_attempts is not None:
+            parser.error("--max-attempts is set by the coordinator (serve --max-attempts)")
+        max_attempts = args.max_attempts if args.max_attempts is not None else 3
+        options = {'batch_size': args.batch_size, 'lease_seconds': args.lease,
+                   'exit_when_idle': args.exit_when_idle,
+                   'detect_options': {'use_masks': False} if args.boxes else None,
+                   'screen': not args.no_screen}
+        processes = [multiprocessing.Process(target=_work, args=(args.db, args.url, max_attempts, options))
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.join()
+
+    elif args.command == "status":
+        queue = SQLiteJobQueue(args.db)
+        print(f"{queue.pending()} pending: {queue.stats()}")
+
+    elif args.command == "export":
+        import csv
+        from .batch import RESULT_FIELDS, format_row
+
+        if bool(args.store) != bool(args.exam):
+            parser.error("--store and --exam must be used together")
+        results = list(SQLiteJobQueue(args.db).results())
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            for result in results:
+                writer.writerow(format_row(result))
+        if args.store:
+            from .exam_store import ExamStore
+            with ExamStore(args.store) as store:
+                store.add_results(args.exam, results)
+        print(f"Exported {len(results)} results to {args.out}")
+
+if __name__ == "__main__":
+    main()
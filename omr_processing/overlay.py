@@ -0,0 +1,201 @@
+"""Marked copies of graded sheets.
+
+render_overlay draws the grading result onto the warped sheet: the chosen
+bubble is circled green when correct and red when wrong, the expected
+answer is outlined green next to wrong answers and amber for unanswered
+questions, and the score is stamped in a header strip.
+
+OverlayWriter renders and encodes overlays on a small thread pool so the
+caller only pays for one image copy per sheet.  Sheets wait in a fixed set
+of preallocated buffers; once all of them are in use, submit() blocks
+until an encoder frees one, so memory stays bounded however many sheets
+are written.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+import cv2
+import numpy as np
+
+from .bubble_detector import bubble_centres
+
+HEADER_HEIGHT = 40
+
+# BGR colours
+CORRECT_COLOUR = (0, 160, 0)
+WRONG_COLOUR = (0, 0, 220)
+MISSED_COLOUR = (0, 170, 255)
+
+def render_overlay(warped: np.ndarray, student_answers: List[int], correct_answers: List[int],
+                   grade: Dict[str, float], rows: int = 30, cols: int = 5,
+                   dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """Draw the grading result onto a warped sheet.
+
+    Args:
+        warped: Warped BGR or grayscale sheet image
+        student_answers: Detected answers (0-4 for A-E, -1 for unmarked)
+        correct_answers: List of correct answers (0-4 for A-E)
+        grade: Dictionary returned by grader.grade_answers
+        rows: Number of questions on the sheet
+        cols: Number of options per question
+        dst: Optional output image of shape (height + HEADER_HEIGHT, width, 3)
+
+    Returns:
+        Overlay image with the score header above the sheet
+    """
+    h, w = warped.shape[:2]
+    if dst is None:
+        dst = np.empty((h + HEADER_HEIGHT, w, 3), dtype=np.uint8)
+    elif dst.shape != (h + HEADER_HEIGHT, w, 3):
+        raise ValueError(f"Overlay buffer must have shape {(h + HEADER_HEIGHT, w, 3)}, got {dst.shape}")
+
+    sheet = dst[HEADER_HEIGHT:]
+    if warped.ndim == 2:
+        cv2.cvtColor(warped, cv2.COLOR_GRAY2BGR, dst=sheet)
+    else:
+        np.copyto(sheet, warped)
+
+    centres, box_size = bubble_centres(h, w, rows, cols)
+    radius = max(2, int(box_size * 0.45))
+    for question, correct in enumerate(correct_answers[:rows]):
+        student = student_answers[question] if question < len(student_answers) else -1
+        expected = tuple(int(v) for v in centres[question * cols + correct])
+        if student == correct:
+            cv2.circle(sheet, expected, radius, CORRECT_COLOUR, 2, cv2.LINE_AA)
+        elif student == -1:
+            cv2.circle(sheet, expected, radius, MISSED_COLOUR, 1, cv2.LINE_AA)
+        else:
+            chosen = tuple(int(v) for v in centres[question * cols + student])
+            cv2.circle(sheet, chosen, radius, WRONG_COLOUR, 2, cv2.LINE_AA)
+            cv2.circle(sheet, expected, radius, CORRECT_COLOUR, 1, cv2.LINE_AA)
+
+    dst[:HEADER_HEIGHT] = 255
+    text = (f"Score: {grade['correct_answers']}/{grade['total_questions']} "
+            f"({grade['score_percentage']:.1f}%)  wrong {grade['incorrect_answers']}  "
+            f"blank {grade['unanswered']}")
+    cv2.putText(dst, text, (8, HEADER_HEIGHT - 13), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1, cv2.LINE_AA)
+    cv2.line(dst, (0, HEADER_HEIGHT - 1), (w - 1, HEADER_HEIGHT - 1), (0, 0, 0), 1)
+    return dst
+
+def overlay_name(sheet_id: str, extension: str = '.jpg') -> str:
+    """Build an overlay file name from a sheet id such as "scans/a.tiff#3".
+
+    Args:
+        sheet_id: Identifier of the sheet (path, or path#page)
+        extension: Image file extension including the dot
+
+    Returns:
+        File name such as "a_p3.jpg"
+    """
+    path, _, page = sheet_id.partition('#')
+    stem = os.path.splitext(os.path.basename(path))[0] or 'sheet'
+    return f"{stem}_p{page}{extension}" if page else f"{stem}{extension}"
+
+class OverlayWriter:
+    """Renders and encodes overlays on a background thread pool."""
+
+    def __init__(self, directory: str, width: int = 600, height: int = 700, extension: str = '.jpg',
+                 quality: int = 90, workers: int = 2, queue_size: int = 16):
+        """Initialize the writer.
+
+        Args:
+            directory: Directory to write the overlay images to
+            width: Width of the warped sheets
+            height: Height of the warped sheets
+            extension: ".jpg" or ".png"
+            quality: JPEG quality (0-100) or PNG compression level (0-9)
+            workers: Number of encoder threads
+            queue_size: Number of sheets that may wait for an encoder before
+                submit() blocks
+        """
+        if extension not in ('.jpg', '.png'):
+            raise ValueError(f"Unsupported overlay format: {extension}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.width = width
+        self.height = height
+        self.extension = extension
+        self.params = [cv2.IMWRITE_JPEG_QUALITY if extension == '.jpg' else cv2.IMWRITE_PNG_COMPRESSION,
+                       quality]
+        self.written = 0
+        self.failures: List[str] = []
+
+        self._free: queue.Queue = queue.Queue()
+        for _ in range(queue_size):
+            self._free.put(np.empty((height, width, 3), dtype=np.uint8))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='overlay')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._names: Set[str] = set()
+
+    def _path(self, sheet_id: str) -> str:
+        name = overlay_name(sheet_id, self.extension)
+        stem = name[:-len(self.extension)]
+        counter = 1
+        # Files with the same name from different directories get a suffix
+        while name in self._names:
+            counter += 1
+            name = f"{stem}_{counter}{self.extension}"
+        self._names.add(name)
+        return os.path.join(self.directory, name)
+
+    def submit(self, sheet_id: str, warped: np.ndarray, student_answers: List[int],
+               correct_answers: List[int], grade: Dict[str, float]) -> str:
+        """Queue one sheet for rendering.
+
+        The image is copied before returning, so the caller may reuse it.
+
+        Args:
+            sheet_id: Identifier of the sheet (path, or path#page)
+            warped: Warped BGR or grayscale sheet image
+            student_answers: Detected answers (0-4 for A-E, -1 for unmarked)
+            correct_answers: List of correct answers (0-4 for A-E)
+            grade: Dictionary returned by grader.grade_answers
+
+        Returns:
+            Path the overlay will be written to
+        """
+        buffer = self._free.get()
+        if warped.ndim == 2:
+            cv2.cvtColor(warped, cv2.COLOR_GRAY2BGR, dst=buffer)
+        else:
+            np.copyto(buffer, warped)
+        path = self._path(sheet_id)
+        self._executor.submit(self._encode, path, buffer, student_answers, correct_answers, grade)
+        return path
+
+    def _encode(self, path: str, buffer: np.ndarray, student_answers: List[int],
+                correct_answers: List[int], grade: Dict[str, float]) -> None:
+        canvas = getattr(self._local, 'canvas', None)
+        if canvas is None:
+            canvas = self._local.canvas = np.empty((self.height + HEADER_HEIGHT, self.width, 3),
+                                                   dtype=np.uint8)
+        try:
+            try:
+                render_overlay(buffer, student_answers, correct_answers, grade, dst=canvas)
+            finally:
+                self._free.put(buffer)
+            ok, data = cv2.imencode(self.extension, canvas, self.params)
+            if not ok:
+                raise ValueError("Encoding failed")
+            data.tofile(path)
+            with self._lock:
+                self.written += 1
+        except Exception as e:
+            with self._lock:
+                self.failures.append(f"{path}: {e}")
+
+    def close(self) -> None:
+        """Wait for every queued overlay to be written."""
+        self._executor.shutdown(wait=True)
+        if self.failures:
+            print(f"Failed to write {len(self.failures)} overlays, first: {self.failures[0]}")
+
+    def __enter__(self) -> 'OverlayWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
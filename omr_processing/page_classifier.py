@@ -0,0 +1,120 @@
+"""Cheap screening of pages before the full grading pipeline runs.
+
+Scanner batches contain blank backs, cover pages and torn or folded
+sheets.  Without screening each one runs through edge detection, contour
+search, warp and threshold before failing, or worse, produces an all-blank
+grade.  The checks here run on a small thumbnail in about a millisecond
+and reject those pages with a categorised reason.
+"""
+import cv2
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from .image_utils import MIN_SHEET_AREA
+
+# Rejection reasons
+LOW_CONTRAST = 'low_contrast'
+BLANK = 'blank'
+NO_OUTLINE = 'no_outline'
+TEXT_PAGE = 'text_page'
+
+class PageRejected(ValueError):
+    """Raised when a page is screened out before grading."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(f"Page rejected ({reason}): {message}")
+        self.reason = reason
+
+def page_features(img: np.ndarray, thumb_width: int = 150) -> Dict[str, float]:
+    """Measure a page on a small thumbnail.
+
+    Args:
+        img: BGR or grayscale page image
+        thumb_width: Width of the thumbnail the features are computed on
+
+    Returns:
+        Dictionary with `contrast` (2nd to 98th percentile spread),
+        `brightness` (median grey level), `ink`
+        (share of dark pixels in the central half of the page), `edges`
+        (share of edge pixels) and `outline` (area share of the largest
+        four-cornered contour)
+    """
+    h, w = img.shape[:2]
+    size = (thumb_width, max(1, round(h * thumb_width / w)))
+    thumb = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    if thumb.ndim == 3:
+        thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+
+    low, high = np.percentile(thumb, (2, 98))
+    th, tw = thumb.shape
+    centre = thumb[th // 4:3 * th // 4, tw // 4:3 * tw // 4]
+    paper = np.percentile(centre, 90)
+    ink = np.count_nonzero(centre < paper - 60) / centre.size
+
+    edges = cv2.Canny(cv2.GaussianBlur(thumb, (3, 3), 0), 10, 50)
+    edge_density = np.count_nonzero(edges) / edges.size
+    contours, _ = cv2.findContours(cv2.dilate(edges, None), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    outline = 0.0
+    for contour in contours:
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4:
+            outline = max(outline, cv2.contourArea(contour))
+
+    return {
+        'contrast': float(high - low),
+        'brightness': float(np.median(thumb)),
+        'ink': ink,
+        'edges': edge_density,
+        'outline': outline / thumb.size,
+    }
+
+def classify_page(img: np.ndarray, min_contrast: float = 40, min_ink: float = 0.005,
+                  max_ink: float = 0.12, min_outline: Optional[float] = None,
+                  min_paper: float = 128) -> Optional[Tuple[str, str]]:
+    """Decide whether a page looks like an answer sheet worth grading.
+
+    Args:
+        img: BGR or grayscale page image
+        min_contrast: Minimum brightness spread; flatter pages are blank when
+            at least `min_paper` bright, otherwise unexposed (low contrast)
+        min_ink: Minimum ink share in the centre; emptier pages are blank
+        max_ink: Maximum ink share in the centre; denser pages are text or covers
+        min_outline: Minimum area share of the sheet outline; smaller or
+            missing outlines mean a torn, folded or absent sheet (default:
+            the share of image_utils.MIN_SHEET_AREA, the smallest outline
+            the sheet localiser accepts, so a page is only rejected if it
+            could not have been graded)
+        min_paper: Median grey level of a flat page that still counts as paper
+
+    Returns:
+        None if the page should be graded, otherwise a (reason, message) tuple
+    """
+    features = page_features(img)
+    if min_outline is None:
+        min_outline = MIN_SHEET_AREA / (img.shape[0] * img.shape[1])
+    if features['contrast'] < min_contrast:
+        if features['brightness'] >= min_paper:
+            # Empty paper filling the whole scan has no edges to give it contrast
+            return BLANK, (f"empty page: brightness spread {features['contrast']:.0f} "
+                           f"< {min_contrast:.0f}")
+        return LOW_CONTRAST, f"brightness spread {features['contrast']:.0f} < {min_contrast:.0f}"
+    if features['ink'] < min_ink:
+        return BLANK, f"ink coverage {features['ink']:.2%} < {min_ink:.2%}"
+    if features['outline'] < min_outline:
+        return NO_OUTLINE, f"sheet outline covers {features['outline']:.1%} < {min_outline:.1%}"
+    if features['ink'] > max_ink:
+        return TEXT_PAGE, f"ink coverage {features['ink']:.2%} > {max_ink:.2%}"
+    return None
+
+def check_page(img: np.ndarray) -> None:
+    """Raise PageRejected if classify_page rejects the page.
+
+    Args:
+        img: BGR or grayscale page image
+
+    Raises:
+        PageRejected: If the page should not be graded
+    """
+    rejection = classify_page(img)
+    if rejection is not None:
+        raise PageRejected(*rejection)
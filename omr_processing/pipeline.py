@@ -0,0 +1,329 @@
+import os
+import time
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional, Union
+
+from . import image_utils, bubble_detector, duplicate_index, grader, ingest, page_classifier
+
+def answers_to_list(answers: Dict[str, str], count: int) -> List[int]:
+    """Convert a detected answer dictionary to the list format used by the grader.
+
+    Args:
+        answers: Dictionary mapping question numbers to letter answers (A-E)
+        count: Number of questions to include
+
+    Returns:
+        List of integers (0-4 for A-E, -1 for unmarked)
+    """
+    return [ord(answers[f"Q{i+1}"]) - ord('A') if f"Q{i+1}" in answers else -1
+            for i in range(count)]
+
+def warm_up(width: int = 600, height: int = 700,
+            ctx: Optional[image_utils.ProcessingContext] = None) -> None:
+    """Run a blank image through the OpenCV stages so worker processes start warm.
+
+    Args:
+        width: Width of the processed image
+        height: Height of the processed image
+        ctx: Optional processing context to warm up along with OpenCV
+    """
+    blank = np.full((height, width, 3), 255, dtype=np.uint8)
+    corners = np.float32([[0, 0], [width, 0], [0, height], [width, height]])
+    page_classifier.page_features(blank)
+    image_utils.load_and_preprocess_image_from_array(blank, width, height, ctx)
+    warped = image_utils.apply_perspective_transform(blank, corners, width, height,
+                                                     dst=ctx.warped if ctx is not None else None)
+    image_utils.threshold_image(warped, ctx)
+    bubble_detector.bubble_masks(height, width)
+
+def locate_sheet(img_canny: np.ndarray) -> np.ndarray:
+    """Find the sheet outline in an edge image.
+
+    Args:
+        img_canny: Edge image from the preprocessing step
+
+    Returns:
+        Ordered corner points of the sheet
+
+    Raises:
+        ValueError: If the sheet outline cannot be located
+    """
+    rect_contours = image_utils.find_rectangle_contours(img_canny)
+    if not rect_contours:
+        raise ValueError("No rectangular contours found")
+
+    biggest_contour = image_utils.get_corner_points(rect_contours[0])
+    if biggest_contour is None:
+        raise ValueError("Biggest contour not valid")
+    return image_utils.reorder_points(biggest_contour)
+
+def _warp_and_detect(img: np.ndarray, points: np.ndarray, width: int, height: int,
+                     timings: Dict[str, float],
+                     ctx: Optional[image_utils.ProcessingContext],
+                     detect_options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    stage = time.perf_counter()
+    warped = image_utils.apply_perspective_transform(img, points, width, height,
+                                                     dst=ctx.warped if ctx is not None else None)
+    timings['warp_ms'] = (time.perf_counter() - stage) * 1000
+
+    stage = time.perf_counter()
+    points, turns = image_utils.correct_rotation(img, points, warped, width, height)
+    timings['orient_ms'] = (time.perf_counter() - stage) * 1000
+
+    stage = time.perf_counter()
+    phash = duplicate_index.perceptual_hash(warped)
+    timings['hash_ms'] = (time.perf_counter() - stage) * 1000
+
+    stage = time.perf_counter()
+    thresh = image_utils.threshold_image(warped, ctx)
+    timings['threshold_ms'] = (time.perf_counter() - stage) * 1000
+
+    stage = time.perf_counter()
+    answers = bubble_detector.analyze_answer_sheet(thresh, **(detect_options or {}))
+    timings['detect_ms'] = (time.perf_counter() - stage) * 1000
+
+    return {
+        "image": img,
+        "warped": warped,
+        "threshold": thresh,
+        "answers": answers,
+        "rotation": turns * 90,
+        "phash": phash,
+        "timings": timings
+    }
+
+def process_sheet(img: np.ndarray, width: int = 600, height: int = 700,
+                  ctx: Optional[image_utils.ProcessingContext] = None,
+                  detect_options: Optional[Dict[str, Any]] = None,
+                  screen: bool = True) -> Dict[str, Any]:
+    """Run the detection pipeline on a decoded sheet image.
+
+    Args:
+        img: Decoded BGR image of the OMR sheet
+        width: Width of the processed image
+        height: Height of the processed image
+        ctx: Optional processing context; returned images then live in its
+            buffers and are overwritten by the next sheet
+        detect_options: Keyword arguments for bubble_detector.analyze_answer_sheet,
+            e.g. {"use_masks": False}
+        screen: Reject blank pages, text pages and pages without a sheet
+            outline before grading (see page_classifier)
+
+    Returns:
+        Dictionary containing the resized image, warped image, thresholded image,
+        detected answers, the clockwise rotation (degrees) that was corrected,
+        the perceptual hash of the warped sheet and per-stage timings in
+        milliseconds
+
+    Raises:
+        PageRejected: If screening finds a blank page, a text page or no sheet outline
+        ValueError: If the sheet outline cannot be located
+    """
+    timings = {}
+    stage = time.perf_counter()
+    if img.shape[:2] != (height, width):
+        img = cv2.resize(img, (width, height), dst=ctx.resized if ctx is not None else None)
+    timings['resize_ms'] = (time.perf_counter() - stage) * 1000
+
+    if screen:
+        stage = time.perf_counter()
+        page_classifier.check_page(img)
+        timings['screen_ms'] = (time.perf_counter() - stage) * 1000
+
+    stage = time.perf_counter()
+    img_canny = image_utils.load_and_preprocess_image_from_array(img, width, height, ctx)
+    timings['preprocess_ms'] = (time.perf_counter() - stage) * 1000
+
+    stage = time.perf_counter()
+    points = locate_sheet(img_canny)
+    timings['contours_ms'] = (time.perf_counter() - stage) * 1000
+
+    return _warp_and_detect(img, points, width, height, timings, ctx, detect_options)
+
+def _process_encoded(source: Union[str, bytes], width: int, height: int,
+                     ctx: Optional[image_utils.ProcessingContext],
+                     detect_options: Optional[Dict[str, Any]], screen: bool) -> Dict[str, Any]:
+    # Locate the sheet on a reduced grayscale decode and only decode colour
+    # pixels once there is a sheet to warp
+    if isinstance(source, str):
+        decode = image_utils.read_image_reduced
+    else:
+        decode = image_utils.decode_image_reduced
+
+    timings = {}
+    stage = time.perf_counter()
+    img = None
+    if image_utils.reduced_decode_scale(source, width, height) == 1:
+        # Nothing to gain from a separate grayscale pass: decode once in colour
+        img = decode(source, width, height, dst=ctx.resized if ctx is not None else None)
+        if img is None:
+            raise ValueError("Could not load image")
+        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=ctx.gray if ctx is not None else None)
+    else:
+        img_gray = decode(source, width, height, grayscale=True, dst=ctx.gray if ctx is not None else None)
+        if img_gray is None:
+            raise ValueError("Could not load image")
+    timings['decode_ms'] = (time.perf_counter() - stage) * 1000
+
+    if screen:
+        stage = time.perf_counter()
+        page_classifier.check_page(img_gray)
+        timings['screen_ms'] = (time.perf_counter() - stage) * 1000
+
+    stage = time.perf_counter()
+    img_canny = image_utils.load_and_preprocess_image_from_array(img_gray, width, height, ctx)
+    timings['preprocess_ms'] = (time.perf_counter() - stage) * 1000
+
+    stage = time.perf_counter()
+    points = locate_sheet(img_canny)
+    timings['contours_ms'] = (time.perf_counter() - stage) * 1000
+
+    if img is None:
+        stage = time.perf_counter()
+        img = decode(source, width, height, dst=ctx.resized if ctx is not None else None)
+        if img is None:
+            raise ValueError("Could not load image")
+        timings['decode_color_ms'] = (time.perf_counter() - stage) * 1000
+
+    return _warp_and_detect(img, points, width, height, timings, ctx, detect_options)
+
+def process_file(image_path: str, width: int = 600, height: int = 700,
+                 ctx: Optional[image_utils.ProcessingContext] = None,
+                 detect_options: Optional[Dict[str, Any]] = None,
+                 screen: bool = True) -> Dict[str, Any]:
+    """Run the detection pipeline on an image file using reduced-scale decoding.
+
+    Args:
+        image_path: Path to the image file
+        width: Width of the processed image
+        height: Height of the processed image
+        ctx: Optional processing context (see process_sheet)
+        detect_options: Detection options (see process_sheet)
+        screen: Page screening (see process_sheet)
+
+    Returns:
+        Same dictionary as process_sheet
+
+    Raises:
+        ValueError: If the file has more than one page; multi-page files are
+            graded page by page with ingest.iter_pages (see batch and ingest)
+    """
+    ext = os.path.splitext(image_path)[1].lower()
+    if ext in ingest.TIFF_EXTENSIONS + ingest.PDF_EXTENSIONS:
+        pages = ingest.count_pages(image_path)
+        if pages > 1:
+            raise ValueError(f"{image_path} has {pages} pages; grade multi-page files with "
+                             "omr_processing.batch or omr_processing.ingest")
+        if ext in ingest.PDF_EXTENSIONS:
+            return process_sheet(ingest.read_page(image_path, 0), width, height, ctx, detect_options,
+                                 screen)
+    return _process_encoded(image_path, width, height, ctx, detect_options, screen)
+
+def process_bytes(data: bytes, width: int = 600, height: int = 700,
+                  ctx: Optional[image_utils.ProcessingContext] = None,
+                  detect_options: Optional[Dict[str, Any]] = None,
+                  screen: bool = True) -> Dict[str, Any]:
+    """Run the detection pipeline on an encoded in-memory image using reduced-scale decoding.
+
+    Args:
+        data: Encoded image bytes
+        width: Width of the processed image
+        height: Height of the processed image
+        ctx: Optional processing context (see process_sheet)
+        detect_options: Detection options (see process_sheet)
+        screen: Page screening (see process_sheet)
+
+    Returns:
+        Same dictionary as process_sheet
+    """
+    return _process_encoded(data, width, height, ctx, detect_options, screen)
+
+def grade_result(result: Dict[str, Any], correct_answers: List[int]) -> Dict[str, Any]:
+    """Grade the answers detected by one of the process functions.
+
+    Args:
+        result: Dictionary returned by process_sheet, process_file or process_bytes
+        correct_answers: List of correct answers (0-4 for A-E)
+
+    Returns:
+        The same dictionary with student answers and grading results added
+    """
+    stage = time.perf_counter()
+    student_answers = answers_to_list(result["answers"], len(correct_answers))
+    result["student_answers"] = student_answers
+    result["grade"] = grader.grade_answers(student_answers, correct_answers)
+    result["timings"]['grade_ms'] = (time.perf_counter() - stage) * 1000
+    return result
+
+def grade_sheet(img: np.ndarray, correct_answers: List[int],
+                width: int = 600, height: int = 700,
+                ctx: Optional[image_utils.ProcessingContext] = None,
+                detect_options: Optional[Dict[str, Any]] = None,
+                screen: bool = True) -> Dict[str, Any]:
+    """Detect and grade the answers on a decoded sheet image.
+
+    Args:
+        img: Decoded BGR image of the OMR sheet
+        correct_answers: List of correct answers (0-4 for A-E)
+        width: Width of the processed image
+        height: Height of the processed image
+        ctx: Optional processing context (see process_sheet)
+        detect_options: Detection options (see process_sheet)
+        screen: Page screening (see process_sheet)
+
+    Returns:
+        Dictionary containing the processed images, student answers,
+        grading results and per-stage timings in milliseconds
+    """
+    if not correct_answers:
+        raise ValueError("No correct answers set")
+    return grade_result(process_sheet(img, width, height, ctx, detect_options, screen), correct_answers)
+
+def grade_file(image_path: str, correct_answers: List[int],
+               width: int = 600, height: int = 700,
+               ctx: Optional[image_utils.ProcessingContext] = None,
+               detect_options: Optional[Dict[str, Any]] = None,
+               screen: bool = True) -> Dict[str, Any]:
+    """Detect and grade the answers in an image file.
+
+    Args:
+        image_path: Path to the image file
+        correct_answers: List of correct answers (0-4 for A-E)
+        width: Width of the processed image
+        height: Height of the processed image
+        ctx: Optional processing context (see process_sheet)
+        detect_options: Detection options (see process_sheet)
+        screen: Page screening (see process_sheet)
+
+    Returns:
+        Same dictionary as grade_sheet
+    """
+    if not correct_answers:
+        raise ValueError("No correct answers set")
+    return grade_result(process_file(image_path, width, height, ctx, detect_options, screen),
+                        correct_answers)
+
+def grade_bytes(data: bytes, correct_answers: List[int],
+                width: int = 600, height: int = 700,
+                ctx: Optional[image_utils.ProcessingContext] = None,
+                detect_options: Optional[Dict[str, Any]] = None,
+                screen: bool = True) -> Dict[str, Any]:
+    """Detect and grade the answers in an encoded in-memory image.
+
+    Args:
+        data: Encoded image bytes
+        correct_answers: List of correct answers (0-4 for A-E)
+        width: Width of the processed image
+        height: Height of the processed image
+        ctx: Optional processing context (see process_sheet)
+        detect_options: Detection options (see process_sheet)
+        screen: Page screening (see process_sheet)
+
+    Returns:
+        Same dictionary as grade_sheet
+    """
+    if not correct_answers:
+        raise ValueError("No correct answers set")
+    return grade_result(process_bytes(data, width, height, ctx, detect_options, screen),
+                        correct_answers)
@@ -0,0 +1,343 @@
+"""Accuracy and latency regression gate over the golden sheet corpus.
+
+The corpus directory holds labelled sheets and a labels.json file:
+
+    {"rows": 30, "sheets": [
+        {"file": "clean_01.jpg", "answers": "AB-*E..."},
+        {"file": "blank_page_01.jpg", "rejected": "blank"}]}
+
+Each answer label is one character per question: A-E, "-" for a blank
+question, or "*" for a question with several marks.  The detector reports
+both blank and multiply marked questions as unanswered.  Sheets with a
+`rejected` reason must be screened out by page_classifier.  A sheet with
+`duplicate_of` is a rescan of another corpus sheet: the two hashes must be
+within duplicate_index.DEFAULT_MAX_DISTANCE bits, while the hashes of any
+two different sheets must be farther apart.
+
+The runner grades every sheet, compares the result with the baseline
+stored for the detection mode, and exits non-zero if accuracy drops,
+falls below MIN_ACCURACY, or any stage gets slower than the tolerance
+allows.  Each run also times a
+fixed OpenCV workload; baseline latencies are scaled by the ratio of the
+two calibration times, so a baseline recorded on one machine still gates
+runs on a faster or slower one.
+
+Usage:
+    python -m omr_processing.regression golden/
+    python -m omr_processing.regression golden/ --update
+    python -m omr_processing.regression golden/ --boxes
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+LABELS_FILE = 'labels.json'
+BASELINE_FILE = 'baseline.json'
+
+# Accuracy the default detector must reach on the golden corpus, whatever
+# the baseline says
+MIN_ACCURACY = 0.65
+
+# Error rates, as a share of the questions they apply to
+RATES = ('false_blank_rate', 'false_mark_rate', 'wrong_choice_rate', 'multi_accepted_rate')
+
+def load_corpus(path: str) -> Tuple[int, List[Dict[str, Any]]]:
+    """Read the labels of a golden corpus.
+
+    Args:
+        path: Corpus directory containing labels.json
+
+    Returns:
+        Tuple of (questions per sheet, list of sheet entries)
+    """
+    with open(os.path.join(path, LABELS_FILE)) as f:
+        labels = json.load(f)
+    rows = labels.get('rows', 30)
+    for sheet in labels['sheets']:
+        if 'rejected' not in sheet and len(sheet['answers']) != rows:
+            raise ValueError(f"{sheet['file']}: expected {rows} answer labels, "
+                             f"got {len(sheet['answers'])}")
+    return rows, labels['sheets']
+
+def calibrate(repeats: int = 30) -> float:
+    """Time a fixed decode, resize and threshold workload on this machine.
+
+    Args:
+        repeats: Number of timed runs
+
+    Returns:
+        Median time of one run in milliseconds
+    """
+    import cv2
+
+    rng = np.random.default_rng(0)
+    page = cv2.GaussianBlur(rng.integers(0, 256, (1140, 1000, 3), dtype=np.uint8), (9, 9), 0)
+    _, encoded = cv2.imencode('.jpg', page, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        img = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+        gray = cv2.cvtColor(cv2.resize(img, (600, 700), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        cv2.adaptiveThreshold(cv2.GaussianBlur(gray, (3, 3), 0), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                              cv2.THRESH_BINARY_INV, 11, 2)
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+def evaluate(path: str, detect_options: Optional[Dict[str, Any]] = None,
+             repeats: int = 3) -> Dict[str, Any]:
+    """Grade every corpus sheet and measure accuracy and latency.
+
+    Args:
+        path: Corpus directory
+        detect_options: Keyword arguments for bubble_detector.analyze_answer_sheet
+        repeats: Times each sheet is processed; latency is the median over all runs
+
+    Returns:
+        Metrics dictionary with `accuracy`, `per_question` and `per_tag`
+        accuracy, the error RATES, `failed` (sheets that should have been graded),
+        `wrongly_accepted` (sheets that should have been rejected),
+        `hash_collisions` (different sheets the duplicate index would
+        confuse), `missed_duplicates` (rescans it would not match),
+        `hash_distance`, `latency_ms` (median per pipeline stage and in
+        total) and `calibration_ms` (see calibrate)
+    """
+    from . import image_utils, pipeline
+    from .duplicate_index import DEFAULT_MAX_DISTANCE, hamming_distance
+    from .page_classifier import PageRejected
+
+    rows, sheets = load_corpus(path)
+    ctx = image_utils.ProcessingContext()
+    pipeline.warm_up(ctx=ctx)
+    calibration = [calibrate()]
+
+    correct = np.zeros(rows, dtype=np.int64)
+    graded = 0
+    counts = {rate: [0, 0] for rate in RATES}
+    tags: Dict[str, List[int]] = {}
+    failed: List[str] = []
+    wrongly_accepted: List[str] = []
+    timings: Dict[str, List[float]] = {}
+    hashes: Dict[str, int] = {}
+
+    for sheet in sheets:
+        with open(os.path.join(path, sheet['file']), 'rb') as f:
+            data = f.read()
+        result = None
+        error = None
+        for _ in range(max(1, repeats)):
+            start = time.perf_counter()
+            try:
+                result = pipeline.process_bytes(data, ctx=ctx, detect_options=detect_options)
+            except (PageRejected, ValueError) as e:
+                error = e
+                break
+            for stage, ms in result['timings'].items():
+                timings.setdefault(stage, []).append(ms)
+            timings.setdefault('total_ms', []).append((time.perf_counter() - start) * 1000)
+
+        if 'rejected' in sheet:
+            if not isinstance(error, PageRejected) or error.reason != sheet['rejected']:
+                wrongly_accepted.append(sheet['file'])
+            continue
+        graded += 1
+        if error is not None:
+            failed.append(f"{sheet['file']}: {error}")
+        else:
+            hashes[sheet['file']] = result['phash']
+        detected = pipeline.answers_to_list(result['answers'] if error is None else {}, rows)
+        sheet_correct = 0
+
+        for question, (label, answer) in enumerate(zip(sheet['answers'], detected)):
+            expected = 'ABCDE'.index(label) if label in 'ABCDE' else -1
+            correct[question] += answer == expected
+            sheet_correct += answer == expected
+            if label == '-':
+                counts['false_mark_rate'][1] += 1
+                counts['false_mark_rate'][0] += answer != -1
+            elif label == '*':
+                counts['multi_accepted_rate'][1] += 1
+                counts['multi_accepted_rate'][0] += answer != -1
+            else:
+                counts['false_blank_rate'][1] += 1
+                counts['false_blank_rate'][0] += answer == -1
+                counts['wrong_choice_rate'][1] += 1
+                counts['wrong_choice_rate'][0] += answer not in (-1, expected)
+        for tag in sheet.get('tags', []):
+            tag_counts = tags.setdefault(tag, [0, 0])
+            tag_counts[0] += sheet_correct
+            tag_counts[1] += rows
+
+    metrics: Dict[str, Any] = {
+        'host': socket.gethostname(),
+        'detect_options': detect_options or {},
+        'sheets': [sheet['file'] for sheet in sheets],
+        'accuracy': float(correct.sum() / (graded * rows)) if graded else 0.0,
+        'per_question': [float(c / graded) if graded else 0.0 for c in correct],
+        'per_tag': {tag: hits / total for tag, (hits, total) in sorted(tags.items())},
+    }
+    for rate, (errors, total) in counts.items():
+        metrics[rate] = errors / total if total else 0.0
+    metrics['failed'] = failed
+    metrics['wrongly_accepted'] = wrongly_accepted
+
+    # Rescans belong to the group of their original sheet
+    groups = {sheet['file']: sheet.get('duplicate_of', sheet['file']) for sheet in sheets}
+    collisions: List[str] = []
+    missed: List[str] = []
+    same: List[int] = []
+    different: List[int] = []
+    graded_files = sorted(hashes)
+    for i, first in enumerate(graded_files):
+        for second in graded_files[i + 1:]:
+            distance = hamming_distance(hashes[first], hashes[second])
+            if groups[first] == groups[second]:
+                same.append(distance)
+                if distance > DEFAULT_MAX_DISTANCE:
+                    missed.append(f"{first} ~ {second} ({distance} bits)")
+            else:
+                different.append(distance)
+                if distance <= DEFAULT_MAX_DISTANCE:
+                    collisions.append(f"{first} ~ {second} ({distance} bits)")
+    metrics['hash_collisions'] = collisions
+    metrics['missed_duplicates'] = missed
+    metrics['hash_distance'] = {'max_same': max(same, default=None),
+                                'min_different': min(different, default=None)}
+    metrics['latency_ms'] = {stage: float(np.median(values)) for stage, values in sorted(timings.items())}
+    # Calibrate before and after grading so a clock change mid-run is averaged out
+    calibration.append(calibrate())
+    metrics['calibration_ms'] = float(np.mean(calibration))
+    return metrics
+
+def compare(metrics: Dict[str, Any], baseline: Dict[str, Any], accuracy_tolerance: float = 0.0,
+            question_tolerance: float = 0.1, latency_tolerance: float = 0.25,
+            latency_slack_ms: float = 0.5,
+            min_accuracy: float = MIN_ACCURACY) -> Tuple[List[str], List[str]]:
+    """Check metrics against a baseline.
+
+    Args:
+        metrics: Dictionary returned by evaluate
+        baseline: Earlier metrics to compare against
+        accuracy_tolerance: Largest allowed drop in overall accuracy, and
+            rise in each error rate
+        question_tolerance: Largest allowed drop in any single question's or
+            tag's accuracy
+        latency_tolerance: Largest allowed relative slowdown of a stage,
+            after scaling the baseline by the calibration ratio
+        latency_slack_ms: Absolute slowdown always allowed, so sub-millisecond
+            stages do not fail on timer noise
+        min_accuracy: Lowest overall accuracy accepted, even if the
+            baseline is lower
+
+    Returns:
+        Tuple of (failures, notes)
+    """
+    failures: List[str] = []
+    notes: List[str] = []
+    epsilon = 1e-9
+
+    if metrics['accuracy'] < baseline['accuracy'] - accuracy_tolerance - epsilon:
+        failures.append(f"accuracy {metrics['accuracy']:.2%} < baseline {baseline['accuracy']:.2%}")
+    elif metrics['accuracy'] > baseline['accuracy'] + epsilon:
+        notes.append(f"accuracy improved to {metrics['accuracy']:.2%} "
+                     f"from {baseline['accuracy']:.2%}; consider --update")
+    if metrics['accuracy'] < min_accuracy - epsilon:
+        failures.append(f"accuracy {metrics['accuracy']:.2%} < floor {min_accuracy:.2%}")
+    for rate in RATES:
+        if metrics[rate] > baseline.get(rate, 0.0) + accuracy_tolerance + epsilon:
+            failures.append(f"{rate} {metrics[rate]:.2%} > baseline {baseline.get(rate, 0.0):.2%}")
+    for question, (now, before) in enumerate(zip(metrics['per_question'], baseline['per_question'])):
+        if now < before - question_tolerance - epsilon:
+            failures.append(f"Q{question + 1} accuracy {now:.0%} < baseline {before:.0%}")
+    for tag, before in baseline.get('per_tag', {}).items():
+        now = metrics['per_tag'].get(tag)
+        if now is not None and now < before - question_tolerance - epsilon:
+            failures.append(f"{tag} sheets accuracy {now:.0%} < baseline {before:.0%}")
+    new = sorted(set(metrics['failed']) - set(baseline.get('failed', [])))
+    if new:
+        failures.append(f"new failed sheets: {', '.join(new)}")
+    # A page that should have been screened out is never grandfathered in
+    if metrics['wrongly_accepted']:
+        failures.append(f"wrongly accepted sheets: {', '.join(metrics['wrongly_accepted'])}")
+    # The duplicate index must separate the corpus whatever the baseline says
+    for name in ('hash_collisions', 'missed_duplicates'):
+        if metrics.get(name):
+            failures.append(f"{name.replace('_', ' ')}: {', '.join(metrics[name])}")
+    if set(metrics['sheets']) != set(baseline.get('sheets', [])):
+        notes.append("the corpus changed since the baseline was recorded")
+
+    if not baseline.get('calibration_ms'):
+        failures.append("the baseline has no calibration time; re-record it with --update")
+        return failures, notes
+    scale = metrics['calibration_ms'] / baseline['calibration_ms']
+    if abs(scale - 1) > 0.1 or metrics['host'] != baseline.get('host'):
+        notes.append(f"baseline latencies from {baseline.get('host')} scaled by {scale:.2f} "
+                     f"(calibration {metrics['calibration_ms']:.2f} ms vs {baseline['calibration_ms']:.2f} ms)")
+    for stage, before in baseline.get('latency_ms', {}).items():
+        now = metrics['latency_ms'].get(stage)
+        if now is not None and now > before * scale * (1 + latency_tolerance) + latency_slack_ms:
+            failures.append(f"{stage} {now:.2f} ms > baseline {before * scale:.2f} ms "
+                            f"+{latency_tolerance:.0%}")
+    return failures, notes
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check detector accuracy and latency against the golden set")
+    parser.add_argument("corpus", nargs="?", default="golden", help="golden corpus directory")
+    parser.add_argument("--baseline", help="baseline file (default: CORPUS/baseline.json)")
+    parser.add_argument("--boxes", action="store_true", help="check the whole-box detector")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per sheet for latency")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.0)
+    parser.add_argument("--min-accuracy", type=float, default=MIN_ACCURACY,
+                        help="lowest accuracy accepted whatever the baseline (default: %(default)s)")
+    parser.add_argument("--question-tolerance", type=float, default=0.1)
+    parser.add_argument("--latency-tolerance", type=float, default=0.25)
+    parser.add_argument("--update", action="store_true", help="record the results as the new baseline")
+    args = parser.parse_args()
+
+    mode = 'boxes' if args.boxes else 'masks'
+    baseline_path = args.baseline or os.path.join(args.corpus, BASELINE_FILE)
+    baselines: Dict[str, Any] = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baselines = json.load(f)
+
+    metrics = evaluate(args.corpus, {'use_masks': not args.boxes}, args.repeats)
+    print(f"{mode}: accuracy {metrics['accuracy']:.2%}, "
+          + ", ".join(f"{rate} {metrics[rate]:.2%}" for rate in RATES))
+    print("by tag: " + ", ".join(f"{tag} {accuracy:.0%}" for tag, accuracy in metrics['per_tag'].items()))
+    print(f"hashes: rescans at most {metrics['hash_distance']['max_same']} bits apart, "
+          f"different sheets at least {metrics['hash_distance']['min_different']}")
+    print("latency: " + ", ".join(f"{stage} {ms:.2f}" for stage, ms in metrics['latency_ms'].items())
+          + f" (calibration {metrics['calibration_ms']:.2f} ms)")
+    for failure in metrics['failed']:
+        print(f"failed: {failure}")
+
+    if args.update:
+        baselines[mode] = metrics
+        with open(baseline_path, 'w') as f:
+            json.dump(baselines, f, indent=2)
+            f.write('\n')
+        print(f"Baseline for {mode} saved to {baseline_path}")
+        return
+    if mode not in baselines:
+        print(f"No {mode} baseline in {baseline_path}; run with --update to record one")
+        sys.exit(2)
+
+    failures, notes = compare(metrics, baselines[mode], args.accuracy_tolerance,
+                              args.question_tolerance, args.latency_tolerance,
+                              min_accuracy=args.min_accuracy)
+    for note in notes:
+        print(f"note: {note}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""Class roster lookup with correction of misread student IDs.
+
+Student IDs decoded from bubbles are often off by one bubble: a wrong
+digit, a missed column or a doubly marked one.  The roster keeps a hash
+map on the exact ID plus a neighbour table keyed by every ID with one
+character deleted.  Two IDs within edit distance 1 always share a key in
+that table, so a misread ID finds its candidates in a few dictionary
+lookups instead of a scan of the whole roster.
+
+Each lookup resolves to one of four statuses:
+
+- matched: the ID is on the roster
+- corrected: exactly one roster ID is one edit away
+- review: several roster IDs are one edit away, or the ID is only on the
+  roster for another course or year
+- unmatched: nothing is close
+
+IDs taken from file names were not read from bubbles, so they are only
+ever matched exactly and are never corrected.
+
+Usage:
+    python -m omr_processing.roster roster.csv results.csv --course CS101 --year 2024
+"""
+import argparse
+import csv
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+MATCHED = 'matched'
+CORRECTED = 'corrected'
+REVIEW = 'review'
+UNMATCHED = 'unmatched'
+
+# Accepted header names for each roster column
+_COLUMNS = {
+    'student_id': ('student_id', 'id', 'index_number'),
+    'name': ('name', 'student_name'),
+    'course_code': ('course_code', 'course'),
+    'year': ('year', 'academic_year'),
+}
+
+def _within_one_edit(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+def _deletions(value: str) -> List[str]:
+    return [value[:i] + value[i + 1:] for i in range(len(value))]
+
+class Roster:
+    """Indexed class roster."""
+
+    def __init__(self, students: Iterable[Dict[str, str]] = ()):
+        """Build the index.
+
+        Args:
+            students: Dictionaries with `student_id` and optionally `name`,
+                `course_code` and `year`
+        """
+        self.students: List[Dict[str, str]] = []
+        self._by_id: Dict[str, List[int]] = {}
+        self._neighbours: Dict[str, List[str]] = {}
+        for student in students:
+            self.add(student)
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'Roster':
+        """Load a roster from a CSV file with a header row.
+
+        Args:
+            path: CSV file with a student ID column and optional name,
+                course code and year columns
+
+        Returns:
+            Roster of every row with a student ID
+        """
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f)
+            headers = {name.strip().lower(): name for name in reader.fieldnames or []}
+            columns = {}
+            for column, aliases in _COLUMNS.items():
+                for alias in aliases:
+                    if alias in headers:
+                        columns[column] = headers[alias]
+                        break
+            if 'student_id' not in columns:
+                raise ValueError(f"{path} has no student ID column ({', '.join(_COLUMNS['student_id'])})")
+            return cls({column: (row.get(header) or '').strip() for column, header in columns.items()}
+                       for row in reader if (row.get(columns['student_id']) or '').strip())
+
+    def __len__(self) -> int:
+        return len(self.students)
+
+    def add(self, student: Dict[str, str]) -> None:
+        """Add one roster entry.
+
+        Args:
+            student: Dictionary with `student_id` and optionally `name`,
+                `course_code` and `year`
+        """
+        student_id = str(student['student_id']).strip()
+        if not student_id:
+            raise ValueError("Roster entry without a student ID")
+        position = len(self.students)
+        self.students.append({'student_id': student_id, 'name': student.get('name', ''),
+                              'course_code': str(student.get('course_code', '')).strip(),
+                              'year': str(student.get('year', '')).strip()})
+        if student_id not in self._by_id:
+            self._by_id[student_id] = []
+            for key in _deletions(student_id):
+                self._neighbours.setdefault(key, []).append(student_id)
+        self._by_id[student_id].append(position)
+
+    def _entries(self, student_id: str, course_code: Optional[str],
+                 year: Optional[str]) -> List[Dict[str, str]]:
+        return [self.students[position] for position in self._by_id.get(student_id, ())
+                if (not course_code or self.students[position]['course_code'] == course_code)
+                and (not year or self.students[position]['year'] == year)]
+
+    def neighbours(self, student_id: str) -> List[str]:
+        """Find the roster IDs exactly one edit away from an ID.
+
+        Args:
+            student_id: Decoded student ID
+
+        Returns:
+            Sorted list of roster IDs
+        """
+        candidates = set()
+        # Roster ID one character longer: the query is one of its deletions
+        candidates.update(self._neighbours.get(student_id, ()))
+        for key in _deletions(student_id):
+            # Roster ID one character shorter
+            if key in self._by_id:
+                candidates.add(key)
+            # Same length: both share a deletion, which may also pair up a
+            # transposition or two substitutions, so verify the distance
+            candidates.update(self._neighbours.get(key, ()))
+        candidates.discard(student_id)
+        return sorted(c for c in candidates if _within_one_edit(student_id, c))
+
+    def resolve(self, student_id: Optional[str], course_code: Optional[str] = None,
+                year: Optional[str] = None, correct: bool = True) -> Dict[str, Any]:
+        """Match a decoded student ID against the roster.
+
+        Args:
+            student_id: Decoded student ID
+            course_code: Only accept students enrolled in this course
+            year: Only accept students from this year
+            correct: Look for misread IDs; when False anything but an exact
+                match is unmatched
+
+        Returns:
+            Dictionary with `status` (matched, corrected, review or
+            unmatched), `raw_id`, the resolved `student_id` and `name` (None
+            unless matched or corrected), `candidates` and a `message`
+        """
+        raw_id = (student_id or '').strip()
+        match: Dict[str, Any] = {'status': UNMATCHED, 'raw_id': raw_id, 'student_id': None,
+                                 'name': None, 'candidates': [], 'message': ''}
+        if not raw_id:
+            match['message'] = "No student ID"
+            return match
+
+        entries = self._entries(raw_id, course_code, year)
+        if entries:
+            match.update(status=MATCHED, student_id=raw_id, name=entries[0]['name'])
+            return match
+        if not correct:
+            if raw_id in self._by_id:
+                match['message'] = f"{raw_id} is on the roster, but not for this course or year"
+            else:
+                match['message'] = f"{raw_id} is not on the roster"
+            return match
+
+        candidates = [c for c in self.neighbours(raw_id) if self._entries(c, course_code, year)]
+        match['candidates'] = candidates
+        if raw_id in self._by_id:
+            match['status'] = REVIEW
+            match['candidates'] = [raw_id] + candidates
+            match['message'] = f"{raw_id} is on the roster, but not for this course or year"
+        elif len(candidates) == 1:
+            entry = self._entries(candidates[0], course_code, year)[0]
+            match.update(status=CORRECTED, student_id=candidates[0], name=entry['name'],
+                         message=f"Read {raw_id}, corrected to {candidates[0]}")
+        elif candidates:
+            match['status'] = REVIEW
+            match['message'] = f"{raw_id} is one bubble away from {len(candidates)} students"
+        else:
+            match['message'] = f"{raw_id} is not on the roster"
+        return match
+
+    def resolve_details(self, details: Dict[str, str], course_code: Optional[str] = None,
+                        year: Optional[str] = None) -> Dict[str, Any]:
+        """Match the output of student_info_detector.extract_student_details.
+
+        The course code and academic year decoded from the sheet are used as
+        filters unless given explicitly; decoded values that appear nowhere
+        on the roster are treated as misreads and ignored.
+
+        Args:
+            details: Dictionary with `index_number` and optionally
+                `course_code` and `academic_year`
+            course_code: Course filter overriding the decoded one
+            year: Year filter overriding the decoded one
+
+        Returns:
+            Same as resolve
+        """
+        if course_code is None and details.get('course_code'):
+            decoded = details['course_code']
+            course_code = decoded if any(s['course_code'] == decoded for s in self.students) else None
+        if year is None and details.get('academic_year'):
+            decoded = details['academic_year']
+            year = decoded if any(s['year'] == decoded for s in self.students) else None
+        return self.resolve(details.get('index_number'), course_code, year)
+
+# The whole file name, so scanner counters such as scan_00123 are not IDs
+DEFAULT_ID_PATTERN = r'^\d+$'
+
+def sheet_student_id(sheet_id: str, pattern: str = DEFAULT_ID_PATTERN) -> Optional[str]:
+    """Take a student ID from a sheet's file name, for scans named by ID.
+
+    Args:
+        sheet_id: Identifier of the sheet (path, or path#page)
+        pattern: Regular expression searched in the file name without
+            extension; its first group, or the whole match when it has
+            none, is the ID
+
+    Returns:
+        Student ID or None if the file name does not match
+    """
+    name = os.path.splitext(os.path.basename(sheet_id.partition('#')[0]))[0]
+    found = re.search(pattern, name)
+    if found is None:
+        return None
+    return found.group(1) if found.groups() else found.group(0)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Match graded sheets to a class roster")
+    parser.add_argument("roster", help="roster CSV with student_id, name, course_code and year columns")
+    parser.add_argument("results", help="results CSV written by batch or hot_folder")
+    parser.add_argument("--out", default="roster_results.csv", help="CSV file to write")
+    parser.add_argument("--course", help="only match students enrolled in this course")
+    parser.add_argument("--year", help="only match students from this year")
+    parser.add_argument("--id-pattern", default=DEFAULT_ID_PATTERN,
+                        help="regular expression taking the ID from the file name "
+                             "when the results have no student_id")
+    args = parser.parse_args()
+
+    roster = Roster.from_csv(args.roster)
+    counts: Dict[str, int] = {}
+    with open(args.results, newline='') as f_in, open(args.out, 'w', newline='') as f_out:
+        reader = csv.DictReader(f_in)
+        fields = [name for name in reader.fieldnames or [] if name != 'student_id']
+        writer = csv.DictWriter(f_out, fieldnames=fields + ['raw_id', 'student_id', 'name', 'roster',
+                                                            'candidates', 'roster_message'])
+        writer.writeheader()
+        for row in reader:
+            raw_id = row.pop('student_id', None)
+            if raw_id:
+                match = roster.resolve(raw_id, args.course, args.year)
+            else:
+                match = roster.resolve(sheet_student_id(row.get('sheet', ''), args.id_pattern),
+                                       args.course, args.year, correct=False)
+            counts[match['status']] = counts.get(match['status'], 0) + 1
+            row.update(raw_id=match['raw_id'], student_id=match['student_id'] or '',
+                       name=match['name'] or '', roster=match['status'],
+                       candidates=' '.join(match['candidates']), roster_message=match['message'])
+            writer.writerow(row)
+    print(f"Matched {sum(counts.values())} sheets against {len(roster)} roster entries: {counts}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""Local HTTP grading service.
+
+Accepts encoded sheet images over HTTP, grades them on a pre-warmed process
+pool and returns JSON results.  Requests arriving within a short window are
+grouped into micro-batches so each round trip to a worker process grades
+several sheets.
+
+Usage:
+    python -m omr_processing.server --port 8080 --workers 4
+
+    curl --data-binary @sheet.jpg "http://127.0.0.1:8080/grade?key=ABCDE..."
+
+With --db, "?exam=NAME" grades against the exam's latest stored key and
+records the result in the exam store.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .answer_manager import AnswerManager, parse_answer_key
+from .autotune import load_tuning
+from .exam_store import ExamStore
+
+MAX_BODY_SIZE = 32 * 1024 * 1024
+
+_STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+class _RequestError(ValueError):
+    """Malformed or unacceptable request, answered with the given status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+# Reusable buffers owned by each worker process
+_context = None
+_screen = True
+
+def _init_worker(cv_threads: Optional[int] = None, screen: bool = True) -> None:
+    """Import OpenCV and run a dummy sheet through it so the first real request is fast."""
+    global _context, _screen
+    import cv2
+    from . import image_utils, pipeline
+
+    if cv_threads is not None:
+        cv2.setNumThreads(cv_threads)
+    _screen = screen
+    _context = image_utils.ProcessingContext()
+    pipeline.warm_up(ctx=_context)
+
+def _warmup() -> int:
+    return os.getpid()
+
+def _grade_batch(batch: List[Tuple[bytes, List[int]]]) -> List[Dict[str, Any]]:
+    """Grade a batch of encoded images inside a worker process.
+
+    Args:
+        batch: List of (encoded image bytes, correct answers) pairs
+
+    Returns:
+        List of JSON-serialisable result dictionaries, one per image
+    """
+    from . import pipeline
+    from .page_classifier import PageRejected
+
+    results = []
+    for data, correct_answers in batch:
+        try:
+            result = pipeline.grade_bytes(data, correct_answers, ctx=_context, screen=_screen)
+            results.append({
+                "answers": result["student_answers"],
+                "grade": result["grade"],
+                "rotation": result["rotation"],
+                "timings": result["timings"],
+            })
+        except PageRejected as e:
+            results.append({"error": str(e), "rejected": e.reason})
+        except Exception as e:
+            results.append({"error": str(e)})
+    return results
+
+class MicroBatcher:
+    """Groups concurrent grading requests into batches for the worker pool."""
+
+    def __init__(self, executor: ProcessPoolExecutor, max_batch: int = 8,
+                 max_delay: float = 0.005, max_in_flight: int = 4):
+        """Initialize the batcher.
+
+        Args:
+            executor: Pre-warmed process pool that grades the batches
+            max_batch: Maximum number of sheets per batch
+            max_delay: Seconds to wait for more requests after the first one arrives
+            max_in_flight: Maximum number of batches dispatched at once
+        """
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_batch * max_in_flight * 4)
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, data: bytes, correct_answers: List[int]) -> Dict[str, Any]:
+        """Queue one image for grading and wait for its result.
+
+        Args:
+            data: Encoded image bytes
+            correct_answers: List of correct answers (0-4 for A-E)
+
+        Returns:
+            Result dictionary with grading results and timings
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((data, correct_answers, future, time.perf_counter()))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Wait for a free worker slot so queued requests back up instead of the pool
+            await self.slots.acquire()
+            loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List[Tuple]) -> None:
+        loop = asyncio.get_running_loop()
+        dispatched = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(
+                self.executor, _grade_batch, [(data, key) for data, key, _, _ in batch])
+        except Exception as e:
+            results = [{"error": f"Worker failure: {e}"}] * len(batch)
+        finally:
+            self.slots.release()
+
+        done = time.perf_counter()
+        for (_, _, future, queued), result in zip(batch, results):
+            if future.done():
+                continue
+            result = dict(result)
+            timings = result.setdefault("timings", {})
+            timings["queue_ms"] = (dispatched - queued) * 1000
+            timings["worker_ms"] = (done - dispatched) * 1000
+            timings["total_ms"] = (done - queued) * 1000
+            result["batch_size"] = len(batch)
+            future.set_result(result)
+
+class GradingServer:
+    """Minimal HTTP/1.1 server exposing the grading pipeline."""
+
+    def __init__(self, batcher: MicroBatcher, default_key: List[int],
+                 store: Optional[ExamStore] = None):
+        """Initialize the server.
+
+        Args:
+            batcher: Batcher used to dispatch grading work
+            default_key: Correct answers used when a request does not supply a key
+            store: Optional exam store for `?exam=` key lookups and result recording
+        """
+        self.batcher = batcher
+        self.default_key = default_key
+        self.store = store
+
+    def _exam_key(self, exam: str) -> Tuple[Optional[int], List[int]]:
+        found = self.store.get_answer_key(exam)
+        if found is None:
+            return None, []
+        manager = AnswerManager()
+        manager.set_answer_key(found[1])
+        return found[0], manager.get_grading_list()
+
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload = await self._route(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except _RequestError as e:
+            self._send_error(writer, e.status, str(e))
+        except ValueError as e:
+            self._send_error(writer, 400, str(e))
+        except Exception as e:
+            # e.g. a database or decoder failure: answer rather than drop the connection
+            self._send_error(writer, 500, f"Internal error: {e}")
+        finally:
+            writer.close()
+
+    def _send_error(self, writer: asyncio.StreamWriter, status: int, message: str) -> None:
+        try:
+            self._write_response(writer, status, {"error": message}, False)
+        except (ConnectionError, RuntimeError):
+            pass
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise _RequestError(400, "Malformed request line")
+        method, target, _ = parts
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise _RequestError(400, "Invalid Content-Length") from None
+        if length > MAX_BODY_SIZE:
+            raise _RequestError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    async def _route(self, method: str, target: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        url = urlsplit(target)
+        if url.path == "/health":
+            return 200, {"status": "ok", "queued": self.batcher.queue.qsize()}
+        if url.path != "/grade":
+            return 404, {"error": "Not found"}
+        if method != "POST":
+            return 405, {"error": "Use POST with the image as the request body"}
+        if not body:
+            return 400, {"error": "Empty request body"}
+
+        query = parse_qs(url.query)
+        exam = query["exam"][0] if "exam" in query else None
+        if exam is not None and self.store is None:
+            return 400, {"error": "Server was started without an exam database"}
+
+        loop = asyncio.get_running_loop()
+        key_version = None
+        try:
+            if "key" in query:
+                key = parse_answer_key(query["key"][0])
+            elif exam is not None:
+                # SQLite calls run on a thread so the event loop never blocks on disk
+                key_version, key = await loop.run_in_executor(None, self._exam_key, exam)
+            else:
+                key = self.default_key
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        if not key:
+            return 400, {"error": "No answer key supplied and no default key loaded"}
+
+        result = await self.batcher.submit(body, key)
+        if exam is not None:
+            record = {
+                "sheet": query["sheet"][0] if "sheet" in query else "http",
+                "status": ("rejected" if "rejected" in result else "error") if "error" in result else "graded",
+                "error": result.get("error"),
+                "student_answers": result.get("answers"),
+                "grade": result.get("grade"),
+            }
+            await loop.run_in_executor(None, self.store.add_results, exam, [record], key_version)
+        return (422 if "error" in result else 200), result
+
+    def _write_response(self, writer: asyncio.StreamWriter, status: int,
+                        payload: Dict[str, Any], keep_alive: bool) -> None:
+        body = json.dumps(payload).encode()
+        head = (
+            f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+
+async def serve(host: str = "127.0.0.1", port: int = 8080, workers: int = 0,
+                max_batch: int = 8, max_delay: float = 0.005,
+                default_key: Optional[List[int]] = None,
+                store: Optional[ExamStore] = None, cv_threads: Optional[int] = None,
+                screen: bool = True) -> None:
+    """Start the worker pool and serve grading requests until cancelled.
+
+    Args:
+        host: Interface to bind
+        port: TCP port to listen on
+        workers: Number of worker processes (0 uses the CPU count)
+        max_batch: Maximum number of sheets per batch
+        max_delay: Seconds to wait while filling a batch
+        default_key: Correct answers used when a request does not supply a key
+        store: Optional exam store for `?exam=` key lookups and result recording
+        cv_threads: OpenCV threads per worker (None keeps OpenCV's default)
+        screen: Screen out blank, text and outline-less pages (see page_classifier)
+    """
+    workers = workers or os.cpu_count() or 1
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cv_threads, screen)) as executor:
+        # Start every worker up front so no request pays the import cost
+        await asyncio.gather(*(loop.run_in_executor(executor, _warmup) for _ in range(workers)))
+
+        batcher = MicroBatcher(executor, max_batch, max_delay, max_in_flight=workers)
+        batcher.start()
+        app = GradingServer(batcher, default_key or [], store)
+        server = await asyncio.start_server(app.handle_connection, host, port)
+        print(f"Grading server listening on http://{host}:{port} with {workers} workers")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await batcher.stop()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OMR grading server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="worker processes (default: autotune result, else CPU count)")
+    parser.add_argument("--cv-threads", type=int,
+                        help="OpenCV threads per worker (default: autotune result, else OpenCV's own)")
+    parser.add_argument("--max-batch", type=int, help="sheets per micro-batch (default: autotune result, else 8)")
+    parser.add_argument("--max-delay-ms", type=float, default=5.0)
+    parser.add_argument("--key", help="default answer key, e.g. ABCDEABCDE")
+    parser.add_argument("--db", help="exam database for ?exam= lookups and result recording")
+    parser.add_argument("--no-screen", action="store_true",
+                        help="grade every page, without screening out blank, text and outline-less pages")
+    args = parser.parse_args()
+
+    if args.key:
+        default_key = parse_answer_key(args.key)
+    else:
+        manager = AnswerManager()
+        default_key = manager.get_grading_list() if manager.load_from_csv() else []
+
+    tuning = load_tuning('server')
+    workers = args.workers or tuning.get('workers', 0)
+    max_batch = args.max_batch or tuning.get('max_batch', 8)
+    cv_threads = args.cv_threads if args.cv_threads is not None else tuning.get('cv_threads')
+
+    try:
+        asyncio.run(serve(args.host, args.port, workers, max_batch,
+                          args.max_delay_ms / 1000, default_key,
+                          ExamStore(args.db) if args.db else None, cv_threads, not args.no_screen))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Shared-memory image slots for passing sheets between processes.
+
+Each slot holds the three images a sheet moves through: the resized input
+frame, the warped sheet and the thresholded sheet.  Processes exchange a
+slot index instead of pickling the arrays, so images move between cores
+without being copied through a pipe.
+"""
+import queue
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+class SharedFramePool:
+    """Fixed ring of preallocated image slots in one shared memory block."""
+
+    def __init__(self, slots: int, width: int = 600, height: int = 700,
+                 name: Optional[str] = None):
+        """Create a new pool, or attach to an existing one when `name` is given.
+
+        Args:
+            slots: Number of sheet slots
+            width: Width of the processed image
+            height: Height of the processed image
+            name: Name of an existing shared memory block to attach to
+        """
+        self.slots = slots
+        self.width = width
+        self.height = height
+        self._color_size = height * width * 3
+        self._gray_size = height * width
+        self._slot_size = self._color_size * 2 + self._gray_size
+
+        self.owner = name is None
+        size = self._slot_size * slots
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+
+        buf = np.ndarray((slots, self._slot_size), dtype=np.uint8, buffer=self._shm.buf)
+        color_shape = (slots, height, width, 3)
+        self._frames = buf[:, :self._color_size].reshape(color_shape)
+        self._warped = buf[:, self._color_size:self._color_size * 2].reshape(color_shape)
+        self._thresholds = buf[:, self._color_size * 2:].reshape((slots, height, width))
+
+        # Only the creating process hands out slots
+        self._free: Optional[queue.Queue] = None
+        if self.owner:
+            self._free = queue.Queue()
+            for slot in range(slots):
+                self._free.put(slot)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def spec(self) -> Tuple[int, int, int, str]:
+        """Return the arguments another process needs to attach to this pool.
+
+        Returns:
+            Tuple of (slots, width, height, shared memory name)
+        """
+        return self.slots, self.width, self.height, self.name
+
+    def frame(self, slot: int) -> np.ndarray:
+        """Return the resized input image of a slot."""
+        return self._frames[slot]
+
+    def warped(self, slot: int) -> np.ndarray:
+        """Return the warped sheet image of a slot."""
+        return self._warped[slot]
+
+    def threshold(self, slot: int) -> np.ndarray:
+        """Return the thresholded sheet image of a slot."""
+        return self._thresholds[slot]
+
+    def acquire(self, timeout: Optional[float] = None) -> int:
+        """Take a free slot, blocking until one is released.
+
+        Args:
+            timeout: Seconds to wait, or None to wait indefinitely
+
+        Returns:
+            Index of the slot
+
+        Raises:
+            queue.Empty: If no slot became free within the timeout
+        """
+        if self._free is None:
+            raise RuntimeError("Slots can only be acquired in the process that created the pool")
+        return self._free.get(timeout=timeout)
+
+    def release(self, slot: int) -> None:
+        """Return a slot to the pool once every stage is done with it."""
+        self._free.put(slot)
+
+    def close(self) -> None:
+        """Detach from the shared memory, unlinking it if this process created it."""
+        # Views into the buffer must be dropped before the mapping can close
+        self._frames = self._warped = self._thresholds = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __enter__(self) -> 'SharedFramePool':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
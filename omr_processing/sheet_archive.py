@@ -0,0 +1,215 @@
+"""Memory-mapped archive of warped sheets for re-running detection.
+
+A batch run with --archive stores every graded sheet's warped grayscale
+image in one flat uint8 file, with a JSON index mapping sheet ids to
+positions.  Detection parameters can then be tuned by re-running the
+threshold and bubble detection over the archive, without decoding the
+original scans or searching for contours again.
+
+Usage:
+    python -m omr_processing.batch scans/ --out results.csv --archive warped/
+    python -m omr_processing.sheet_archive warped/ --key ABCDEABCDE --margin 1.5
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .answer_manager import AnswerManager, parse_answer_key
+
+DATA_FILE = 'sheets.u8'
+INDEX_FILE = 'index.json'
+
+class SheetArchiveWriter:
+    """Appends warped grayscale sheets to a new archive directory."""
+
+    def __init__(self, path: str, width: int = 600, height: int = 700):
+        """Create the archive, replacing any archive already in `path`.
+
+        Args:
+            path: Archive directory
+            width: Width of the warped images
+            height: Height of the warped images
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.width = width
+        self.height = height
+        self.ids: List[str] = []
+        self._data = open(os.path.join(path, DATA_FILE), 'wb')
+
+    def append(self, sheet_id: str, img_gray: np.ndarray) -> int:
+        """Add one sheet to the archive.
+
+        Args:
+            sheet_id: Identifier of the sheet
+            img_gray: Warped grayscale image of shape (height, width)
+
+        Returns:
+            Position of the sheet in the archive
+        """
+        if img_gray.shape != (self.height, self.width):
+            raise ValueError(f"Expected a {self.width}x{self.height} grayscale image, "
+                             f"got shape {img_gray.shape}")
+        self._data.write(np.ascontiguousarray(img_gray, dtype=np.uint8).data)
+        self.ids.append(sheet_id)
+        return len(self.ids) - 1
+
+    def close(self) -> None:
+        """Flush the images and write the index."""
+        if self._data.closed:
+            return
+        self._data.close()
+        with open(os.path.join(self.path, INDEX_FILE), 'w') as f:
+            json.dump({'width': self.width, 'height': self.height, 'ids': self.ids}, f)
+
+    def __enter__(self) -> 'SheetArchiveWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class SheetArchive:
+    """Read-only view of an archive, backed by a memory map."""
+
+    def __init__(self, path: str):
+        """Open an archive written by SheetArchiveWriter.
+
+        Args:
+            path: Archive directory
+        """
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.path = path
+        self.width = index['width']
+        self.height = index['height']
+        self.ids: List[str] = index['ids']
+        self._positions = {sheet_id: i for i, sheet_id in enumerate(self.ids)}
+        if self.ids:
+            self.images = np.memmap(os.path.join(path, DATA_FILE), dtype=np.uint8, mode='r',
+                                    shape=(len(self.ids), self.height, self.width))
+        else:
+            self.images = np.empty((0, self.height, self.width), dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, position: int) -> np.ndarray:
+        return self.images[position]
+
+    def get(self, sheet_id: str) -> Optional[np.ndarray]:
+        """Look up a sheet by id.
+
+        Args:
+            sheet_id: Identifier of the sheet
+
+        Returns:
+            Warped grayscale image or None if the sheet is not archived
+        """
+        position = self._positions.get(sheet_id)
+        return None if position is None else self.images[position]
+
+    def __iter__(self) -> Iterator[Tuple[str, np.ndarray]]:
+        return zip(self.ids, self.images)
+
+def _detect_range(path: str, start: int, stop: int, params: Dict[str, Any]) -> List[Dict[str, str]]:
+    from . import bubble_detector, image_utils
+
+    archive = SheetArchive(path)
+    ctx = image_utils.ProcessingContext(archive.width, archive.height)
+    detected = []
+    for position in range(start, stop):
+        thresh = image_utils.threshold_image(archive[position], ctx, params['block_size'])
+        detected.append(bubble_detector.analyze_answer_sheet(
+            thresh, threshold_ratio=params['threshold_ratio'], margin=params['margin'],
+            block_size=params['box_block_size'], use_masks=params['use_masks']))
+    return detected
+
+def redetect(path: str, threshold_ratio: Optional[float] = None, margin: float = 1.2,
+             block_size: int = 11, box_block_size: int = 11, use_masks: bool = True,
+             workers: int = 0, chunk_size: int = 256) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """Re-run thresholding and bubble detection over every archived sheet.
+
+    Worker processes each map the archive themselves, so only sheet
+    positions and detected answers cross process boundaries.
+
+    Args:
+        path: Archive directory
+        threshold_ratio: Smallest inked share of a marked box or bubble
+            (default: the detector's own, see bubble_detector.analyze_answer_sheet)
+        margin: See bubble_detector.detect_marked_answers
+        block_size: Adaptive threshold block size for the whole sheet
+        box_block_size: Adaptive threshold block size inside each answer box
+            (without use_masks)
+        use_masks: Score only the bubble interiors (see bubble_detector.bubble_masks)
+            instead of whole boxes
+        workers: Number of worker processes (0 uses the CPU count)
+        chunk_size: Number of sheets per worker task
+
+    Yields:
+        Tuples of (sheet id, detected answer dictionary) in archive order
+    """
+    archive = SheetArchive(path)
+    params = {'threshold_ratio': threshold_ratio, 'margin': margin,
+              'block_size': block_size, 'box_block_size': box_block_size, 'use_masks': use_masks}
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_detect_range, path, start, min(start + chunk_size, len(archive)), params)
+                   for start in range(0, len(archive), chunk_size)]
+        position = 0
+        for future in futures:
+            for answers in future.result():
+                yield archive.ids[position], answers
+                position += 1
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-run bubble detection over a warped sheet archive")
+    parser.add_argument("archive", help="archive directory written by batch --archive")
+    parser.add_argument("--out", default="redetect.csv", help="CSV file to write")
+    parser.add_argument("--key", help="answer key, e.g. ABCDEABCDE (default: correct_answers.csv)")
+    parser.add_argument("--threshold-ratio", type=float,
+                        help="smallest inked share of a marked bubble, or box with --boxes "
+                             "(default: 0.3, or 0.05 with --boxes)")
+    parser.add_argument("--margin", type=float, default=1.2)
+    parser.add_argument("--block-size", type=int, default=11, help="sheet threshold block size")
+    parser.add_argument("--box-block-size", type=int, default=11, help="per-box threshold block size (with --boxes)")
+    parser.add_argument("--boxes", action="store_true",
+                        help="score whole answer boxes instead of the bubble interiors (less accurate)")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if args.key:
+        correct_answers = parse_answer_key(args.key)
+    else:
+        manager = AnswerManager()
+        manager.load_from_csv()
+        correct_answers = manager.get_grading_list()
+    if not correct_answers:
+        parser.error("No correct answers set")
+
+    from . import grader, pipeline
+
+    start = time.perf_counter()
+    count = 0
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['sheet', 'score', 'correct', 'incorrect', 'unanswered', 'answers'])
+        for sheet_id, answers in redetect(args.archive, args.threshold_ratio, args.margin,
+                                          args.block_size, args.box_block_size, not args.boxes,
+                                          args.workers):
+            student_answers = pipeline.answers_to_list(answers, len(correct_answers))
+            grade = grader.grade_answers(student_answers, correct_answers)
+            writer.writerow([sheet_id, f"{grade['score_percentage']:.2f}", grade['correct_answers'],
+                             grade['incorrect_answers'], grade['unanswered'],
+                             ''.join('ABCDE'[a] if a != -1 else '-' for a in student_answers)])
+            count += 1
+    elapsed = time.perf_counter() - start
+    print(f"Re-detected {count} sheets in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.1f} sheets/s)")
+
+if __name__ == "__main__":
+    main()